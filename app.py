@@ -19,30 +19,39 @@ Example Usage:
 """
 
 import gradio as gr
+from config import WARM_UP_ON_START, METRICS_HOST, METRICS_PORT, LOG_LEVEL, LOG_SAMPLE_RATE, SLOW_REQUEST_SECONDS
 from src.chat import SchoolChatbot
+from src.telemetry import configure_logging, configure_sampling, start_metrics_server
 
-def create_chatbot():
+def create_chatbot(chatbot=None):
     """
     Creates and configures the chatbot interface.
+
+    Args:
+        chatbot (SchoolChatbot or None): Chatbot to serve; a new one if None
     """
-    chatbot = SchoolChatbot()
+    if chatbot is None:
+        chatbot = SchoolChatbot()
+    if WARM_UP_ON_START:
+        chatbot.warm_up()
     
-    def chat(message, history):
+    async def chat(message, history):
         """
-        TODO:Generate a response for the current message in a Gradio chat interface.
+        Generate a response for the current message in a Gradio chat interface,
+        streaming it token by token.
 
         Args:
             message (str): The current message from the user
-            history (list): List of previous message pairs, where each pair is
-                           [user_message, assistant_message]
+            history (list): List of previous messages as role/content dictionaries
                            Example:
                            [
-                               ["What schools offer Spanish?", "The Hernandez School..."],
-                               ["Where is it located?", "The Hernandez School is in Roxbury..."]
+                               {"role": "user", "content": "What schools offer Spanish?"},
+                               {"role": "assistant", "content": "The Hernandez School..."}
                            ]
 
-        Returns:
-            str: The assistant's response to the current message.
+        Yields:
+            str: The response generated so far. Gradio re-renders the assistant's
+            message with each yielded value, so users see tokens as they arrive.
 
 
         Note:
@@ -55,9 +64,13 @@ def create_chatbot():
                 - Generate an appropriate response to the current message
                 - Return that response as a string
         """
-        # Get response from chatbot
-        response = chatbot.get_response(message)
-        return response
+        # Stream response from chatbot. The async path keeps Gradio's event loop
+        # free while retrieval and generation are in progress. The chatbot
+        # keeps only a bounded window of the history in the prompt.
+        response = ""
+        async for token in chatbot.aget_response_stream(message, history):
+            response += token
+            yield response
 
     
     
@@ -88,5 +101,9 @@ def create_chatbot():
     return demo
 
 if __name__ == "__main__":
+    configure_logging(LOG_LEVEL)
+    configure_sampling(LOG_SAMPLE_RATE, SLOW_REQUEST_SECONDS)
+    if METRICS_PORT is not None:
+        start_metrics_server(METRICS_PORT, host=METRICS_HOST)
     demo = create_chatbot()
     demo.launch()
\ No newline at end of file
@@ -15,3 +15,109 @@ BASE_MODEL = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
 MY_MODEL = None
 
 HF_TOKEN = os.getenv("HF_TOKEN")
+
+# Query embedding cache used by the RAG engine. Set the size to 0 to disable it,
+# and the TTL (in seconds) to None to keep entries until they are evicted.
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL = None
+
+# Opt-in micro-batching of concurrent retrievals: queries arriving within
+# MICRO_BATCH_WAIT_MS of each other are embedded and searched together.
+MICRO_BATCHING = False
+MICRO_BATCH_MAX_SIZE = 32
+MICRO_BATCH_WAIT_MS = 5.0
+
+# Retrieval strategy: "dense" (embeddings + FAISS), "lexical" (BM25 only, no
+# embedding model is loaded) or "hybrid" (both, merged with reciprocal rank fusion).
+RETRIEVAL_MODE = "hybrid"
+
+# Embedding backend for dense and hybrid retrieval: "sentence-transformers"
+# (EMBEDDING_MODEL is a HuggingFace model ID), or "onnx" / "onnx-fp32" for an
+# int8-quantized / float32 ONNX Runtime model, where EMBEDDING_MODEL is the
+# directory written by `python -m src.embeddings export`.
+EMBEDDING_BACKEND = "sentence-transformers"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# FAISS index type for dense retrieval: "flat" (exact), "hnsw", "sq8" (int8
+# scalar quantization) or "ivfpq" (product quantization), trading recall for
+# memory. `python -m src.vector_index` reports recall, latency and memory of each.
+INDEX_SPEC = "flat"
+
+# Adaptive retrieval: up to RETRIEVAL_TOP_K schools are retrieved per question
+# and kept in rank order while their score (cosine similarity to the question,
+# or BM25 score relative to the best match in lexical mode) is at least
+# RETRIEVAL_SCORE_THRESHOLD and within RETRIEVAL_SCORE_GAP of the best one, and
+# while their context fits in CONTEXT_TOKEN_BUDGET tokens. At least
+# RETRIEVAL_MIN_K are always kept; set it to RETRIEVAL_TOP_K for a fixed number.
+RETRIEVAL_TOP_K = 6
+RETRIEVAL_MIN_K = 1
+RETRIEVAL_SCORE_THRESHOLD = 0.3
+RETRIEVAL_SCORE_GAP = 0.15
+CONTEXT_TOKEN_BUDGET = 400
+
+# Load the embedding model and page in the index before the app starts serving,
+# instead of on the first request.
+WARM_UP_ON_START = True
+
+# Text generation backend: "remote" sends prompts for BASE_MODEL (or MY_MODEL)
+# to the HuggingFace Inference API; "local" runs the model in-process on CPU
+# with transformers. The local backend computes the key/value cache of the
+# static prompt prefix once and decodes up to LOCAL_GENERATION_MAX_BATCH
+# requests together; requests arriving within LOCAL_GENERATION_BATCH_WAIT_MS of
+# each other start a batch, and later ones join it between generated tokens.
+GENERATION_BACKEND = "remote"
+LOCAL_GENERATION_MAX_BATCH = 8
+LOCAL_GENERATION_BATCH_WAIT_MS = 20.0
+
+# Async generation path: maximum concurrent LLM calls, how long a request may
+# wait for a free slot before being rejected, the timeout per attempt (or per
+# streamed token) and how many times transient failures are retried.
+MAX_CONCURRENT_GENERATIONS = 8
+GENERATION_QUEUE_TIMEOUT = 30.0
+GENERATION_TIMEOUT = 60.0
+GENERATION_RETRIES = 2
+
+# Token budget for the whole prompt, counted with the model's tokenizer.
+# Retrieved schools are dropped, least relevant first, until the prompt fits.
+# None disables trimming; TinyLlama's 2048-token context with 512 new tokens
+# leaves room for about 1536.
+PROMPT_TOKEN_BUDGET = None
+
+# Semantic response cache: answers are reused for questions whose embeddings
+# have at least RESPONSE_CACHE_THRESHOLD cosine similarity with a cached one
+# and that retrieve the same schools. Set the size to 0 to disable it.
+RESPONSE_CACHE_SIZE = 512
+RESPONSE_CACHE_TTL = 3600
+RESPONSE_CACHE_THRESHOLD = 0.95
+
+# Observability: per-stage latency histograms and request counters are served
+# in Prometheus text format at http://localhost:METRICS_PORT/metrics (None
+# disables the endpoint). One request in LOG_SAMPLE_RATE is logged as a JSON
+# line with its stage breakdown; requests slower than SLOW_REQUEST_SECONDS and
+# failed ones are always logged. The endpoint listens on METRICS_HOST only;
+# set it to "0.0.0.0" to let a Prometheus server on another machine scrape it.
+METRICS_PORT = 9100
+METRICS_HOST = "127.0.0.1"
+LOG_LEVEL = "INFO"
+LOG_SAMPLE_RATE = 0.1
+SLOW_REQUEST_SECONDS = 5.0
+
+# Conversation memory: the most recent turns that fit HISTORY_TOKEN_BUDGET (at
+# most HISTORY_MAX_TURNS) are sent verbatim; older turns are folded into a short
+# rolling summary. Summaries and the schools discussed are cached for
+# CONVERSATION_CACHE_SIZE conversations.
+HISTORY_TOKEN_BUDGET = 512
+HISTORY_MAX_TURNS = 6
+CONVERSATION_CACHE_SIZE = 1024
+
+# Intent router: questions with deterministic answers (the grade for a birth
+# date, bus eligibility for a grade, which schools serve a grade) get a
+# templated answer from the age cutoffs and transportation rules without
+# calling the model. Everything else goes through RAG and the LLM.
+INTENT_ROUTER = True
+
+# Multi-process serving (python -m src.serving): number of Gradio workers and
+# the port of the first one; worker i listens on SERVING_PORT + i. Workers share
+# one embedding model process and the memory-mapped index.
+SERVING_WORKERS = 4
+SERVING_PORT = 7860
@@ -0,0 +1,266 @@
+"""
+Answer a file of questions offline, e.g. for QA runs over hundreds of parent
+questions.
+
+One SchoolChatbot (and so one loaded RAGEngine and embedding model) serves the
+whole run. Questions the intent router can answer are answered first; the
+rest are retrieved in batches of --batch-size (one encode call per batch) and
+generated with at most --workers requests in flight, while the next batch is
+retrieved.
+
+Input is JSONL with a "query" per line and optionally an "id" (the line
+number otherwise); other fields are copied to the output. Each answer is
+appended to the output JSONL as soon as it is ready, so the output file is
+also the checkpoint: rerunning the same command skips every id already
+answered and retries the ones that failed, whose newer line then supersedes
+the error. Answers are written in completion order, not input order.
+
+Example usage:
+    python -m src.batch questions.jsonl answers.jsonl --workers 8
+    python -m src.batch benchmark_queries.jsonl answers.jsonl --offline
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Sequence
+
+from config import LOG_LEVEL, MAX_CONCURRENT_GENERATIONS, MICRO_BATCH_MAX_SIZE, RETRIEVAL_MODE, RETRIEVAL_TOP_K
+from src.concurrency import call_with_retries
+from src.telemetry import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def read_queries(path: str) -> List[Dict[str, Any]]:
+    """
+    Read the questions to answer.
+
+    Args:
+        path: JSONL file with a "query" and optionally an "id" per line
+
+    Returns:
+        The records, each with a string "id"
+
+    Raises:
+        ValueError: If a line has no query or two lines share an id
+    """
+    records = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not isinstance(record.get("query"), str) or not record["query"].strip():
+                raise ValueError(f"{path}:{line_number}: no query")
+            record["id"] = str(record.get("id", line_number))
+            if record["id"] in seen:
+                raise ValueError(f"{path}:{line_number}: duplicate id {record['id']!r}")
+            seen.add(record["id"])
+            records.append(record)
+    return records
+
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Read the answers already written by an earlier run. A last line cut off
+    by an interruption is removed from the file, so appending resumes cleanly.
+
+    Args:
+        path: Output JSONL file; may not exist yet
+
+    Returns:
+        The latest answer per id
+    """
+    answers = {}
+    if not os.path.exists(path):
+        return answers
+    complete = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            answers[str(record["id"])] = record
+            complete += len(line)
+    if complete < os.path.getsize(path):
+        logger.warning("Dropping an incomplete last line from %s", path)
+        with open(path, "r+b") as f:
+            f.truncate(complete)
+    return answers
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class BatchAnswerer:
+    """
+    Answers many questions with one chatbot and appends the results to a JSONL file.
+    """
+
+    def __init__(self,
+                 chatbot: Any,
+                 workers: int = MAX_CONCURRENT_GENERATIONS,
+                 batch_size: int = MICRO_BATCH_MAX_SIZE,
+                 top_k: int = RETRIEVAL_TOP_K,
+                 fast_path: bool = True):
+        """
+        Args:
+            chatbot: SchoolChatbot whose engine, prompt and async client are used
+            workers: Most generations in flight at once
+            batch_size: Questions retrieved together
+            top_k: Most schools retrieved per question; how many are kept
+                follows the chatbot's retrieval_policy
+            fast_path: Answer deterministic questions with the intent router
+        """
+        if workers < 1 or batch_size < 1:
+            raise ValueError("workers and batch_size must be at least 1")
+        self.chatbot = chatbot
+        self.workers = workers
+        self.batch_size = batch_size
+        self.top_k = top_k
+        self.fast_path = fast_path and chatbot.intent_router is not None
+        self.counts = {"answered": 0, "fast_path": 0, "errors": 0}
+
+    def _write(self, output: Any, record: Dict[str, Any], **result: Any) -> None:
+        output.write(json.dumps({**record, **result}, ensure_ascii=False) + "\n")
+        output.flush()
+        self.counts["errors" if "error" in result else "answered"] += 1
+
+    async def _generate(self, output: Any, record: Dict[str, Any], docs: List[Any]) -> None:
+        started = time.perf_counter()
+        schools = [doc.school_name for doc in docs]
+        try:
+            prompt = self.chatbot.format_prompt(record["query"], docs)
+            response = await call_with_retries(
+                lambda: self.chatbot.async_client.text_generation(prompt, **self.chatbot.GENERATION_PARAMS),
+                timeout=self.chatbot.generation_timeout,
+                retries=self.chatbot.generation_retries,
+            )
+        except Exception as e:
+            self._write(output, record, schools=schools, outcome="error", error=f"{type(e).__name__}: {e}",
+                        seconds=time.perf_counter() - started)
+            return
+        self._write(output, record, response=response, schools=schools, outcome="generated",
+                    seconds=time.perf_counter() - started)
+
+    async def run(self, records: Sequence[Dict[str, Any]], output: Any) -> None:
+        """
+        Answer the records, appending one JSON line per answer to output.
+
+        Args:
+            records: Questions to answer, from read_queries
+            output: Text file opened for appending
+        """
+        pending = []
+        for record in records:
+            routed = self.chatbot.intent_router.route(record["query"]) if self.fast_path else None
+            if routed is None:
+                pending.append(record)
+            else:
+                self.counts["fast_path"] += 1
+                self._write(output, record, response=routed.text, schools=list(routed.schools),
+                            outcome="fast_path", intent=routed.intent, seconds=0.0)
+
+        slots = asyncio.Semaphore(self.workers)
+        tasks = set()
+
+        def finished(task):
+            tasks.discard(task)
+            slots.release()
+
+        engine = self.chatbot.rag_engine
+        for chunk in _chunks(pending, self.batch_size):
+            # Runs in a thread, so generations already in flight keep going
+            retrieved = await asyncio.to_thread(engine.retrieve_batch, [record["query"] for record in chunk],
+                                                self.top_k, True, self.chatbot.retrieval_policy)
+            for record, docs in zip(chunk, retrieved):
+                await slots.acquire()
+                task = asyncio.create_task(self._generate(output, record, docs))
+                tasks.add(task)
+                task.add_done_callback(finished)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+def run_batch(input_path: str,
+              output_path: str,
+              chatbot: Any = None,
+              **kwargs: Any) -> Dict[str, Any]:
+    """
+    Answer every question in input_path not yet answered in output_path.
+
+    Args:
+        input_path: JSONL file of questions
+        output_path: JSONL file the answers are appended to
+        chatbot: SchoolChatbot to use; created from config if None
+        **kwargs: Arguments passed to BatchAnswerer
+
+    Returns:
+        Counts of the run: total, skipped (answered before), answered,
+        fast_path, errors, seconds and queries_per_second
+    """
+    records = read_queries(input_path)
+    done = {key for key, answer in load_checkpoint(output_path).items() if "error" not in answer}
+    todo = [record for record in records if record["id"] not in done]
+    if chatbot is None:
+        from src.chat import SchoolChatbot
+        chatbot = SchoolChatbot()
+
+    answerer = BatchAnswerer(chatbot, **kwargs)
+    started = time.perf_counter()
+    logger.info("Answering %d of %d questions (%d already answered)", len(todo), len(records),
+                len(records) - len(todo))
+    try:
+        with open(output_path, "a", encoding="utf-8") as output:
+            asyncio.run(answerer.run(todo, output))
+    finally:
+        seconds = time.perf_counter() - started
+        summary = {"total": len(records), "skipped": len(records) - len(todo), **answerer.counts,
+                   "seconds": seconds}
+        summary["queries_per_second"] = (summary["answered"] + summary["errors"]) / seconds if seconds else 0.0
+        logger.info("Batch summary: %s", summary)
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions; rerun to resume.")
+    parser.add_argument("input", help="JSONL file with a \"query\" (and optionally an \"id\") per line")
+    parser.add_argument("output", help="JSONL file the answers are appended to")
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENT_GENERATIONS,
+                        help="Most generations in flight at once")
+    parser.add_argument("--batch-size", type=int, default=MICRO_BATCH_MAX_SIZE, help="Questions retrieved together")
+    parser.add_argument("--top-k", type=int, default=RETRIEVAL_TOP_K, help="Most schools retrieved per question")
+    parser.add_argument("--retrieval-mode", default=RETRIEVAL_MODE, choices=["dense", "hybrid", "lexical"])
+    parser.add_argument("--no-fast-path", action="store_true", help="Send every question to the model")
+    parser.add_argument("--offline", action="store_true",
+                        help="Answer with a fixed stand-in reply instead of calling the model")
+    args = parser.parse_args()
+
+    from src.chat import SchoolChatbot
+
+    configure_logging(LOG_LEVEL)
+    chatbot = SchoolChatbot(retrieval_mode=args.retrieval_mode)
+    if args.offline:
+        from src.benchmark import FakeAsyncInferenceClient
+        chatbot.async_client = FakeAsyncInferenceClient()
+    try:
+        summary = run_batch(args.input, args.output, chatbot, workers=args.workers, batch_size=args.batch_size,
+                            top_k=args.top_k, fast_path=not args.no_fast_path)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; rerun the same command to resume")
+        raise SystemExit(130)
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-item calls for a few milliseconds and runs them
+    through one batched function call on a background thread.
+
+    Callers block in submit() until their item's result is ready, so the
+    batcher can sit behind an ordinary synchronous API.
+
+    Example usage:
+        batcher = MicroBatcher(lambda items: [x * 2 for x in items], max_wait_ms=5)
+        result = batcher.submit(21)  # 42, computed together with concurrent submits
+    """
+
+    def __init__(self,
+                 batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0):
+        """
+        Args:
+            batch_fn: Function mapping a list of items to a list of results of the same length
+            max_batch_size: Largest number of items passed to batch_fn at once
+            max_wait_ms: How long the first item of a batch waits for others to arrive
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches_run = 0
+        self.items_processed = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        # Makes the closed check and the put in submit atomic with respect to close
+        self._close_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Any:
+        """
+        Queue an item and wait for its result.
+
+        Args:
+            item: Input for batch_fn
+
+        Returns:
+            The result batch_fn produced for this item
+        """
+        future: Future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.put((item, future))
+        return future.result()
+
+    def close(self) -> None:
+        """
+        Stop the background thread after the queued items are processed.
+        """
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join()
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.items_processed / self.batches_run if self.batches_run else 0.0
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch: List[tuple]) -> None:
+        items = [item for item, _ in batch]
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise RuntimeError("batch_fn returned a different number of results than items")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.items_processed += len(items)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,415 @@
+"""
+Retrieval and end-to-end benchmark for the Boston School Chatbot.
+
+Runs entirely offline: generation goes to FakeInferenceClient /
+FakeAsyncInferenceClient, which reply with fixed tokens after a configurable
+delay, so only our own code is measured. Retrieval quality is scored
+against the labeled queries in benchmark_queries.jsonl.
+
+For each retrieval mode it measures index build and load time, `retrieve`
+latency percentiles, retrieval throughput and end-to-end `aget_response`
+latency and throughput at several concurrency levels, recall@k and MRR,
+adaptive k against a fixed k, and peak memory. Results are written as JSON, so runs can be compared across
+commits.
+
+Example usage:
+    python -m src.benchmark --modes lexical hybrid dense --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from src.caching import SemanticResponseCache
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_QUERIES_PATH = "benchmark_queries.jsonl"
+
+
+class FakeInferenceClient:
+    """
+    Offline stand-in for huggingface_hub.InferenceClient's text_generation.
+
+    Replies with fixed tokens, after time_to_first_token seconds and then
+    token_delay seconds per further token.
+    """
+
+    def __init__(self,
+                 reply_tokens: Sequence[str] = ("Based ", "on ", "the ", "retrieved ", "schools, ", "yes."),
+                 time_to_first_token: float = 0.0,
+                 token_delay: float = 0.0):
+        self.reply_tokens = list(reply_tokens)
+        self.time_to_first_token = time_to_first_token
+        self.token_delay = token_delay
+        self.calls = 0
+
+    def _delays(self) -> Iterator[float]:
+        for i in range(len(self.reply_tokens)):
+            yield self.time_to_first_token if i == 0 else self.token_delay
+
+    def text_generation(self, prompt: str, stream: bool = False, **params: Any):
+        self.calls += 1
+        if stream:
+            return self._stream()
+        time.sleep(sum(self._delays()))
+        return "".join(self.reply_tokens)
+
+    def _stream(self) -> Iterator[str]:
+        for token, delay in zip(self.reply_tokens, self._delays()):
+            time.sleep(delay)
+            yield token
+
+
+class FakeAsyncInferenceClient(FakeInferenceClient):
+    """
+    Offline stand-in for huggingface_hub.AsyncInferenceClient's text_generation.
+    """
+
+    async def text_generation(self, prompt: str, stream: bool = False, **params: Any):
+        self.calls += 1
+        if stream:
+            return self._astream()
+        await asyncio.sleep(sum(self._delays()))
+        return "".join(self.reply_tokens)
+
+    async def _astream(self):
+        for token, delay in zip(self.reply_tokens, self._delays()):
+            await asyncio.sleep(delay)
+            yield token
+
+
+def load_labeled_queries(path: str = DEFAULT_QUERIES_PATH) -> List[Dict[str, Any]]:
+    """
+    Read labeled queries: one JSON object per line with an id, the query and
+    the names of the relevant schools.
+
+    Args:
+        path: Path to the JSONL file
+
+    Returns:
+        List of query dictionaries
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    """
+    Summarize latency samples in milliseconds.
+
+    Args:
+        seconds: Latency samples in seconds
+
+    Returns:
+        Dictionary with mean, p50, p95 and p99 in milliseconds
+    """
+    samples = np.asarray(seconds) * 1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"mean_ms": float(samples.mean()), "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def relevance_metrics(retrieve: Callable[[str, int], List[Any]],
+                      labeled_queries: Sequence[Dict[str, Any]],
+                      ks: Sequence[int] = (1, 3, 5)) -> Dict[str, float]:
+    """
+    Score retrieval against labeled queries.
+
+    recall@k is the fraction of relevant schools in the top k, out of at
+    most k (so a query with more relevant schools than k can still score 1).
+    MRR is the mean reciprocal rank of the first relevant school within the
+    top max(ks).
+
+    Args:
+        retrieve: Function mapping a query and top_k to ranked documents
+        labeled_queries: Queries with their relevant school names
+        ks: Cutoffs for recall@k
+
+    Returns:
+        Dictionary with recall@k for each k and mrr
+    """
+    depth = max(ks)
+    recalls = {k: [] for k in ks}
+    reciprocal_ranks = []
+    for item in labeled_queries:
+        relevant = set(item["relevant"])
+        ranked = [doc.school_name for doc in retrieve(item["query"], depth)]
+        for k in ks:
+            recalls[k].append(len(relevant.intersection(ranked[:k])) / min(k, len(relevant)))
+        rank = next((i for i, name in enumerate(ranked, 1) if name in relevant), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    metrics = {f"recall@{k}": float(np.mean(values)) for k, values in recalls.items()}
+    metrics["mrr"] = float(np.mean(reciprocal_ranks))
+    return metrics
+
+
+def adaptive_metrics(retrieve: Callable[[str, int], List[Any]],
+                     retrieve_adaptive: Callable[[str], List[Any]],
+                     labeled_queries: Sequence[Dict[str, Any]],
+                     format_context: Callable[[List[Any]], str],
+                     fixed_k: int = 3) -> Dict[str, float]:
+    """
+    Compare adaptive k with a fixed k: schools kept per query, precision and
+    recall of the kept schools, and the approximate size of their context.
+
+    Args:
+        retrieve: Function mapping a query and top_k to ranked documents
+        retrieve_adaptive: Function mapping a query to the documents adaptive k keeps
+        labeled_queries: Queries with their relevant school names
+        format_context: Function turning documents into the retrieved context
+        fixed_k: The fixed k to compare with
+
+    Returns:
+        Dictionary with mean_k, precision, recall and context_tokens for both
+        (the fixed ones prefixed with "fixed_")
+    """
+    from src.prompt import approximate_tokens
+
+    rows = {"adaptive": [], "fixed": []}
+    for item in labeled_queries:
+        relevant = set(item["relevant"])
+        for name, docs in (("adaptive", retrieve_adaptive(item["query"])), ("fixed", retrieve(item["query"], fixed_k))):
+            names = {doc.school_name for doc in docs}
+            found = len(relevant & names)
+            rows[name].append((len(names), found / len(names) if names else 0.0, found / len(relevant),
+                               approximate_tokens(format_context(docs))))
+
+    metrics = {}
+    for name, values in rows.items():
+        prefix = "" if name == "adaptive" else "fixed_"
+        for column, key in enumerate(("mean_k", "precision", "recall", "context_tokens")):
+            metrics[prefix + key] = float(np.mean([row[column] for row in values]))
+    return metrics
+
+
+def measure_throughput(call: Callable[[str], Any],
+                       queries: Sequence[str],
+                       concurrency: int,
+                       num_requests: int) -> Dict[str, float]:
+    """
+    Run num_requests calls from `concurrency` threads and measure completed
+    requests per second.
+    """
+    requests = [queries[i % len(queries)] for i in range(num_requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, requests))
+    elapsed = time.perf_counter() - started
+    return {"concurrency": concurrency, "requests": num_requests, "requests_per_second": num_requests / elapsed}
+
+
+async def _end_to_end(chatbot: Any, queries: Sequence[str], concurrency: int, num_requests: int) -> Dict[str, Any]:
+    requests = [queries[i % len(queries)] for i in range(num_requests)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(query):
+        async with semaphore:
+            started = time.perf_counter()
+            await chatbot.aget_response(query)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in requests))
+    elapsed = time.perf_counter() - started
+    return {"concurrency": concurrency, "requests": num_requests,
+            "requests_per_second": num_requests / elapsed, **latency_summary(latencies)}
+
+
+async def _end_to_end_levels(chatbot: Any, queries: Sequence[str], concurrency_levels: Sequence[int],
+                             num_requests: int) -> List[Dict[str, Any]]:
+    # One event loop for every level, like a server process that keeps running between bursts
+    return [await _end_to_end(chatbot, queries, level, num_requests) for level in concurrency_levels]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of this process so far, in MB.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_mode(mode: str,
+                   labeled_queries: Sequence[Dict[str, Any]],
+                   school_csv: str = "BPS.csv",
+                   programs_csv: str = "BPS-special-programs.csv",
+                   embedding_model: Any = None,
+                   index_spec: str = "flat",
+                   ks: Sequence[int] = (1, 3, 5),
+                   repeats: int = 5,
+                   concurrency_levels: Sequence[int] = (1, 4, 16),
+                   requests_per_level: int = 200,
+                   time_to_first_token: float = 0.0,
+                   token_delay: float = 0.0) -> Dict[str, Any]:
+    """
+    Benchmark one retrieval mode.
+
+    Args:
+        mode: "dense", "hybrid" or "lexical"
+        labeled_queries: Queries with their relevant school names
+        school_csv: Path to the school data CSV
+        programs_csv: Path to the special programs CSV
+        embedding_model: Model ID or EmbeddingBackend; defaults to config.py's
+        index_spec: FAISS index spec
+        ks: Cutoffs for recall@k
+        repeats: Passes over the queries for retrieve latency
+        concurrency_levels: Concurrent callers for the throughput runs
+        requests_per_level: Requests sent at each concurrency level
+        time_to_first_token: Fake model delay before the first token, in seconds
+        token_delay: Fake model delay per further token, in seconds
+
+    Returns:
+        Dictionary of measurements
+    """
+    from config import (EMBEDDING_BACKEND, EMBEDDING_MODEL, RETRIEVAL_MIN_K, RETRIEVAL_SCORE_GAP,
+                        RETRIEVAL_SCORE_THRESHOLD, RETRIEVAL_TOP_K)
+    from src.chat import SchoolChatbot
+    from src.embeddings import create_backend
+    from src.rag_engine import AdaptiveK, RAGEngine
+
+    if embedding_model is None:
+        embedding_model = create_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL)
+    queries = [item["query"] for item in labeled_queries]
+    results: Dict[str, Any] = {"mode": mode}
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        index_path = os.path.join(index_dir, "school_rag")
+
+        # Query embeddings are not cached, so every retrieve pays for encoding
+        engine = RAGEngine(embedding_model=embedding_model, query_cache_size=0,
+                           retrieval_mode=mode, index_spec=index_spec)
+        if engine.uses_embeddings:
+            engine.embedding_model.load()
+        tracemalloc.start()
+        started = time.perf_counter()
+        engine.process_school_data(school_csv, programs_csv)
+        engine.build_index(index_path)
+        results["build_seconds"] = time.perf_counter() - started
+        results["build_peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+        results["num_documents"] = len(engine.documents)
+
+        loaded = RAGEngine(embedding_model=embedding_model, query_cache_size=0,
+                           retrieval_mode=mode, index_spec=index_spec)
+        started = time.perf_counter()
+        loaded.load_index(index_path)
+        results["load_seconds"] = time.perf_counter() - started
+
+        def retrieve(query, top_k=3):
+            return loaded.retrieve(query, top_k=top_k, auto_filter=True)
+
+        results["relevance"] = relevance_metrics(retrieve, labeled_queries, ks)
+        policy = AdaptiveK(RETRIEVAL_MIN_K, RETRIEVAL_SCORE_THRESHOLD, RETRIEVAL_SCORE_GAP)
+        results["adaptive"] = adaptive_metrics(
+            retrieve,
+            lambda query: loaded.retrieve(query, top_k=RETRIEVAL_TOP_K, auto_filter=True, adaptive=policy),
+            labeled_queries, loaded.format_retrieved_context)
+
+        latencies = []
+        for _ in range(repeats):
+            for query in queries:
+                started = time.perf_counter()
+                retrieve(query)
+                latencies.append(time.perf_counter() - started)
+        results["retrieve_latency"] = latency_summary(latencies)
+        results["retrieve_throughput"] = [measure_throughput(retrieve, queries, level, requests_per_level)
+                                          for level in concurrency_levels]
+
+        # A lexical chatbot is cheap to set up; it then serves from the engine measured above
+        chatbot = SchoolChatbot(school_csv, programs_csv, index_dir=os.path.join(index_dir, "chatbot"),
+                                retrieval_mode="lexical")
+        chatbot.rag_engine = loaded
+        chatbot.client = FakeInferenceClient(time_to_first_token=time_to_first_token, token_delay=token_delay)
+        chatbot.async_client = FakeAsyncInferenceClient(time_to_first_token=time_to_first_token,
+                                                        token_delay=token_delay)
+        # Every request goes through retrieval, prompt assembly and generation
+        chatbot.response_cache = SemanticResponseCache(maxsize=0)
+        results["end_to_end"] = asyncio.run(_end_to_end_levels(chatbot, queries, concurrency_levels,
+                                                               requests_per_level))
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def run_benchmark(modes: Sequence[str] = ("lexical", "hybrid", "dense"),
+                  queries_path: str = DEFAULT_QUERIES_PATH,
+                  **kwargs: Any) -> Dict[str, Any]:
+    """
+    Benchmark each retrieval mode and collect the results with run metadata.
+
+    Args:
+        modes: Retrieval modes to benchmark
+        queries_path: Path to the labeled queries
+        **kwargs: Arguments passed to benchmark_mode
+
+    Returns:
+        JSON-serializable results
+    """
+    labeled_queries = load_labeled_queries(queries_path)
+    settings = {key: value for key, value in kwargs.items() if key != "embedding_model"}
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "num_queries": len(labeled_queries),
+        "settings": settings,
+        "modes": [benchmark_mode(mode, labeled_queries, **kwargs) for mode in modes],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval and end-to-end latency offline")
+    parser.add_argument("--modes", nargs="+", default=["lexical", "hybrid", "dense"],
+                        choices=["lexical", "hybrid", "dense"], help="Retrieval modes to benchmark")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES_PATH, help="Labeled queries (JSONL)")
+    parser.add_argument("--index-spec", default="flat", help="FAISS index spec for dense and hybrid modes")
+    parser.add_argument("--ks", nargs="+", type=int, default=[1, 3, 5], help="Cutoffs for recall@k")
+    parser.add_argument("--repeats", type=int, default=5, help="Passes over the queries for latency")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16],
+                        help="Concurrency levels for the throughput runs")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--ttft", type=float, default=0.0, help="Fake model time to first token, in seconds")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Fake model delay per token, in seconds")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.modes, args.queries, index_spec=args.index_spec, ks=args.ks,
+                            repeats=args.repeats, concurrency_levels=args.concurrency,
+                            requests_per_level=args.requests, time_to_first_token=args.ttft,
+                            token_delay=args.token_delay)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import math
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Function words, plus "school(s)": every document is a school, so those words
+# only add noise (e.g. matching the "Special Admission Schools" program).
+STOPWORDS = frozenset("""
+a an and any are as at be by can do does for from has have i in is it its
+me my near of on or our the their there to we what which with you your
+school schools
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase alphanumeric tokens, dropping stopwords.
+    Hyphenated names such as "ABA-Based" become separate tokens; zip codes
+    stay whole.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        List of tokens
+    """
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Compact in-memory Okapi BM25 scorer over a fixed set of texts.
+
+    Postings are stored per term as parallel numpy arrays of document ids and
+    term frequencies, so scoring a query touches only the documents that
+    contain its terms.
+
+    Example usage:
+        index = BM25Index(["Hernandez K-8 School ...", "Mozart Elementary ..."])
+        results = index.search("Hernandez", top_k=3)  # [(doc_id, score), ...]
+    """
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            texts: Documents to index; positions in this list are the ids
+            k1: Term-frequency saturation parameter
+            b: Document-length normalization parameter
+        """
+        self.k1 = k1
+        self.b = b
+        self.num_documents = len(texts)
+
+        term_counts: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(self.num_documents, dtype="float32")
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[doc_id] = len(tokens)
+            for token in tokens:
+                counts = term_counts.setdefault(token, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+
+        average_length = float(lengths.mean()) if self.num_documents else 0.0
+        # Per-document part of the BM25 denominator, precomputed once
+        self._length_norm = k1 * (1 - b + b * lengths / average_length) if average_length else lengths + k1
+
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.idf: Dict[str, float] = {}
+        for term, counts in term_counts.items():
+            doc_ids = np.fromiter(counts.keys(), dtype="int32", count=len(counts))
+            freqs = np.fromiter(counts.values(), dtype="float32", count=len(counts))
+            self.postings[term] = (doc_ids, freqs)
+            # Non-negative idf variant, so very common terms never penalize a match
+            self.idf[term] = math.log(1 + (self.num_documents - len(counts) + 0.5) / (len(counts) + 0.5))
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        BM25 score of every document for a query.
+
+        Args:
+            query: Query text
+
+        Returns:
+            Float32 array of scores, indexed by document id
+        """
+        scores = np.zeros(self.num_documents, dtype="float32")
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            doc_ids, freqs = posting
+            scores[doc_ids] += self.idf[term] * freqs * (self.k1 + 1) / (freqs + self._length_norm[doc_ids])
+        return scores
+
+    def search(self,
+               query: str,
+               top_k: int,
+               candidate_ids: Optional[Sequence[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Find the highest-scoring documents that share at least one term with the query.
+
+        Args:
+            query: Query text
+            top_k: Maximum number of results
+            candidate_ids: If given, only these documents are considered
+
+        Returns:
+            List of (doc_id, score) pairs, best first
+        """
+        if top_k <= 0:
+            return []
+        scores = self.scores(query)
+        if candidate_ids is not None:
+            mask = np.zeros(self.num_documents, dtype=bool)
+            mask[np.asarray(candidate_ids, dtype="int64")] = True
+            scores = np.where(mask, scores, 0.0)
+
+        matching = np.flatnonzero(scores > 0)
+        if len(matching) > top_k:
+            matching = matching[np.argpartition(-scores[matching], top_k - 1)[:top_k]]
+        ranked = matching[np.argsort(-scores[matching], kind="stable")]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in ranked]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Merge several ranked id lists with reciprocal rank fusion: each list
+    contributes 1 / (k + rank) to the score of every id it contains.
+
+    Args:
+        rankings: Ranked lists of document ids, best first
+        k: Damping constant; larger values flatten the contribution of top ranks
+
+    Returns:
+        List of (doc_id, fused_score) pairs, best first
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: (-item[1], item[0]))
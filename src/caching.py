@@ -0,0 +1,331 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU cache with optional time-to-live expiry.
+
+    Keeps hit/miss/eviction counters so the cache can be sized from
+    production traffic.
+
+    Example usage:
+        cache = LRUCache(maxsize=1024, ttl=3600)
+        value = cache.get_or_compute(key, lambda: expensive(key))
+    """
+
+    def __init__(self,
+                 maxsize: int = 1024,
+                 ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            maxsize: Maximum number of entries; 0 disables caching
+            ttl: Seconds an entry stays valid, or None for no expiry
+            clock: Monotonic time source, injectable for tests
+        """
+        if maxsize < 0:
+            raise ValueError("maxsize must be non-negative")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Look up a key, counting a hit or a miss.
+
+        Args:
+            key: The cache key
+            default: Value returned on a miss
+
+        Returns:
+            The cached value, or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is not None and self._clock() - stored_at > self.ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Insert or refresh an entry, evicting the least recently used one if full.
+
+        Args:
+            key: The cache key
+            value: The value to store
+        """
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for key, computing and storing it on a miss.
+
+        Args:
+            key: The cache key
+            compute: Zero-argument function producing the value
+
+        Returns:
+            The cached or freshly computed value
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        """
+        Drop all entries. Counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of the cache counters.
+
+        Returns:
+            Dictionary with size, capacity, hits, misses, evictions,
+            expirations and hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class SemanticResponseCache:
+    """
+    Cache of generated responses keyed by query embedding.
+
+    A lookup hits when a stored query's embedding has cosine similarity of at
+    least `threshold` with the new query and both retrieved the same set of
+    schools, so near-duplicate questions share an answer without ever
+    returning one grounded in different context. Without an embedding (e.g.
+    lexical-only retrieval) only exact matches of the normalized text hit.
+
+    Example usage:
+        cache = SemanticResponseCache(maxsize=512, ttl=3600, threshold=0.95)
+        response = cache.lookup(embedding, text_key, doc_key)
+        if response is None:
+            response = generate(...)
+            cache.store(embedding, text_key, doc_key, response)
+    """
+
+    def __init__(self,
+                 maxsize: int = 512,
+                 ttl: Optional[float] = None,
+                 threshold: float = 0.95,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            maxsize: Maximum number of responses kept; 0 disables caching
+            ttl: Seconds a response stays valid, or None for no expiry
+            threshold: Minimum cosine similarity between queries for a hit
+            clock: Monotonic time source, injectable for tests
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, dict]" = OrderedDict()
+        # Unit query embeddings, one row per entry that has one; rows are
+        # updated in place as entries come and go
+        self._matrix: Optional[np.ndarray] = None
+        self._row_keys: List[Optional[Hashable]] = []
+        self._rows: Dict[Hashable, int] = {}
+        self._free_rows: List[int] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(embedding: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype="float32").ravel()
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
+
+    def _expired(self, entry: dict) -> bool:
+        return self.ttl is not None and self._clock() - entry["stored_at"] > self.ttl
+
+    def _similar_keys(self, vector: np.ndarray) -> List[Hashable]:
+        if not self._rows or self._matrix.shape[1] != len(vector):
+            return []
+        similarities = self._matrix @ vector
+        rows = np.flatnonzero(similarities >= self.threshold)
+        rows = rows[np.argsort(-similarities[rows])]
+        return [self._row_keys[row] for row in rows if self._row_keys[row] is not None]
+
+    def _set_row(self, key: Hashable, vector: Optional[np.ndarray]) -> None:
+        if vector is None:
+            self._free_row(key)
+            return
+        if self._matrix is None or self._matrix.shape[1] != len(vector):
+            # First embedding, or a different embedding model: rows of another size can't be compared
+            self._reset_rows(len(vector))
+        row = self._rows.get(key)
+        if row is None:
+            row = self._free_rows.pop()
+            self._rows[key] = row
+            self._row_keys[row] = key
+        self._matrix[row] = vector
+
+    def _free_row(self, key: Hashable) -> None:
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._row_keys[row] = None
+            self._matrix[row] = 0.0
+            self._free_rows.append(row)
+
+    def _reset_rows(self, dimension: Optional[int] = None) -> None:
+        for key in self._rows:
+            self._entries[key]["embedding"] = None
+        self._matrix = None if dimension is None else np.zeros((self.maxsize, dimension), dtype="float32")
+        self._row_keys = [None] * self.maxsize
+        self._rows = {}
+        self._free_rows = list(range(self.maxsize - 1, -1, -1))
+
+    def lookup(self,
+               embedding: Optional[np.ndarray],
+               text_key: str,
+               doc_key: Hashable) -> Optional[str]:
+        """
+        Find a cached response for a query.
+
+        Args:
+            embedding: The query embedding, or None to match on text only
+            text_key: Normalized query text
+            doc_key: Identifies the set of schools retrieved for the query
+
+        Returns:
+            The cached response, or None on a miss
+        """
+        vector = self._unit(embedding)
+        with self._lock:
+            candidates = [text_key] if text_key in self._entries else []
+            if vector is not None:
+                candidates += self._similar_keys(vector)
+            for key in candidates:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if self._expired(entry):
+                    self._remove(key)
+                    continue
+                if entry["doc_key"] == doc_key:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["response"]
+            self.misses += 1
+            return None
+
+    def store(self,
+              embedding: Optional[np.ndarray],
+              text_key: str,
+              doc_key: Hashable,
+              response: str) -> None:
+        """
+        Cache a response, evicting the least recently used one if full.
+
+        Args:
+            embedding: The query embedding, or None
+            text_key: Normalized query text
+            doc_key: Identifies the set of schools retrieved for the query
+            response: The generated response
+        """
+        if self.maxsize == 0:
+            return
+        vector = self._unit(embedding)
+        with self._lock:
+            while text_key not in self._entries and len(self._entries) >= self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[text_key] = {
+                "embedding": vector,
+                "doc_key": doc_key,
+                "response": response,
+                "stored_at": self._clock(),
+            }
+            self._entries.move_to_end(text_key)
+            self._set_row(text_key, vector)
+
+    def _remove(self, key: Hashable) -> None:
+        self._free_row(key)
+        del self._entries[key]
+
+    def clear(self) -> None:
+        """
+        Drop all cached responses, e.g. after the index was rebuilt. Counters are kept.
+        """
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._reset_rows()
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of the cache counters.
+
+        Returns:
+            Dictionary with size, capacity, hits, misses, evictions,
+            invalidations and hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,8 +1,33 @@
-from huggingface_hub import InferenceClient
-from config import BASE_MODEL, MY_MODEL, HF_TOKEN
-import pandas as pd
+from config import (BASE_MODEL, MY_MODEL, HF_TOKEN, QUERY_CACHE_SIZE, QUERY_CACHE_TTL,
+                    MICRO_BATCHING, MICRO_BATCH_MAX_SIZE, MICRO_BATCH_WAIT_MS, RETRIEVAL_MODE,
+                    MAX_CONCURRENT_GENERATIONS, GENERATION_QUEUE_TIMEOUT, GENERATION_TIMEOUT,
+                    GENERATION_RETRIES, PROMPT_TOKEN_BUDGET, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL,
+                    RESPONSE_CACHE_THRESHOLD, EMBEDDING_BACKEND, EMBEDDING_MODEL, INDEX_SPEC,
+                    HISTORY_TOKEN_BUDGET, HISTORY_MAX_TURNS, CONVERSATION_CACHE_SIZE, INTENT_ROUTER,
+                    RETRIEVAL_TOP_K, RETRIEVAL_MIN_K, RETRIEVAL_SCORE_THRESHOLD, RETRIEVAL_SCORE_GAP,
+                    CONTEXT_TOKEN_BUDGET, GENERATION_BACKEND, LOCAL_GENERATION_MAX_BATCH,
+                    LOCAL_GENERATION_BATCH_WAIT_MS)
+import numpy as np
 import os
-from src.rag_engine import RAGEngine, SchoolDocument
+import time
+import asyncio
+import logging
+from collections import deque
+from src.caching import SemanticResponseCache
+from src.concurrency import ConcurrencyLimiter, call_with_retries
+from src.conversation import ConversationMemory, is_follow_up
+from src.embeddings import create_backend
+from src.generation import LocalGenerator, create_generation_clients
+from src.intent_router import IntentRouter, is_transportation_question
+from src.prompt import PromptTemplate, approximate_tokens, read_age_cutoffs
+from src.rag_engine import AdaptiveK, RAGEngine, SchoolDocument, load_school_data, normalize_query, program_flags
+from src.rules import RuleTable
+from src.startup import LazyModule, startup_timings, timed_phase
+from src.telemetry import REGISTRY, TIME_TO_FIRST_TOKEN, current_trace, record_stage, span, trace_request
+
+pd = LazyModule("pandas")
+
+logger = logging.getLogger(__name__)
 
 class SchoolChatbot:
     """
@@ -13,53 +38,173 @@ class SchoolChatbot:
         response = chatbot.get_response("What schools offer Spanish programs?")
     """
 
-    def __init__(self, school_csv='BPS.csv', programs_csv='BPS-special-programs.csv'):
+    def __init__(self, school_csv='BPS.csv', programs_csv='BPS-special-programs.csv',
+                 model_id=None, index_dir='models', retrieval_mode=RETRIEVAL_MODE, embedding_backend=None):
         """
         Initialize the chatbot with a HF model ID
+
+        Args:
+            school_csv (str): Path to the main school data CSV.
+            programs_csv (str): Path to the special programs CSV.
+            model_id (str or None): Model ID or inference endpoint URL; defaults to MY_MODEL or BASE_MODEL.
+            index_dir (str): Directory where the RAG index is cached.
+            retrieval_mode (str): "dense", "hybrid" or "lexical"; see RAGEngine.
+            embedding_backend (EmbeddingBackend or None): Query embedding backend, e.g. a
+                RemoteEmbeddingBackend shared by several workers; built from config if None.
         """
-        model_id = MY_MODEL if MY_MODEL else BASE_MODEL # define MY_MODEL in config.py if you create a new model in the HuggingFace Hub
-        self.client = InferenceClient(model=model_id, token=HF_TOKEN)
+        if model_id is None:
+            model_id = MY_MODEL if MY_MODEL else BASE_MODEL # define MY_MODEL in config.py if you create a new model in the HuggingFace Hub
+        # A single async client for the chatbot's lifetime, so HTTP connections (or the local model) are shared
+        # across requests. The local backend reuses the cache of the prompt template's static prefix.
+        self.client, self.async_client = create_generation_clients(
+            GENERATION_BACKEND, model_id, token=HF_TOKEN,
+            prefix=lambda: self.prompt_template.static_prefix,
+            max_batch_size=LOCAL_GENERATION_MAX_BATCH,
+            batch_wait_ms=LOCAL_GENERATION_BATCH_WAIT_MS,
+        )
+        self.generation_limiter = ConcurrencyLimiter(MAX_CONCURRENT_GENERATIONS, GENERATION_QUEUE_TIMEOUT)
+        self.generation_timeout = GENERATION_TIMEOUT
+        self.generation_retries = GENERATION_RETRIES
         self.school_csv = school_csv
         self.programs_csv = programs_csv
+        self.index_dir = index_dir
+        self.prompt_template = PromptTemplate(max_prompt_tokens=PROMPT_TOKEN_BUDGET, tokenizer_id=model_id)
+
+        # Latency of the most recent responses: time to first token and total, in seconds
+        self.response_timings = deque(maxlen=1000)
+
+        # Answers to recent questions, reused for near-duplicates that retrieve the same schools
+        self.response_cache = SemanticResponseCache(maxsize=RESPONSE_CACHE_SIZE,
+                                                    ttl=RESPONSE_CACHE_TTL,
+                                                    threshold=RESPONSE_CACHE_THRESHOLD)
+        self._response_cache_index_version = None
+
+        # Recent turns within HISTORY_TOKEN_BUDGET, a summary of older ones and the schools discussed.
+        # Turns are counted with the model's tokenizer when it is loaded anyway for the prompt budget.
+        count_tokens = approximate_tokens if PROMPT_TOKEN_BUDGET is None else self.prompt_template.count_tokens
+        self.memory = ConversationMemory(
+            max_history_tokens=HISTORY_TOKEN_BUDGET,
+            max_recent_turns=HISTORY_MAX_TURNS,
+            count_tokens=count_tokens,
+            cache_size=CONVERSATION_CACHE_SIZE,
+        )
+
+        # Up to RETRIEVAL_TOP_K schools per question, as many as their retrieval scores justify
+        self.retrieval_top_k = RETRIEVAL_TOP_K
+        self.retrieval_policy = AdaptiveK(min_k=RETRIEVAL_MIN_K,
+                                          threshold=RETRIEVAL_SCORE_THRESHOLD,
+                                          gap=RETRIEVAL_SCORE_GAP,
+                                          max_tokens=CONTEXT_TOKEN_BUDGET,
+                                          count_tokens=count_tokens)
         
         # Initialize the RAG engine
-        self.rag_engine = RAGEngine()
+        self.rag_engine = self.create_rag_engine(embedding_backend, retrieval_mode)
         
         # Set up the RAG index
-        self._setup_rag()
+        with timed_phase("setup_rag"):
+            self._setup_rag()
+        if MICRO_BATCHING:
+            self.rag_engine.enable_micro_batching(MICRO_BATCH_MAX_SIZE, MICRO_BATCH_WAIT_MS)
+
+        # Templated answers for deterministic questions, e.g. the grade for a birth date
+        self.intent_router = None
+        if INTENT_ROUTER:
+            try:
+                self.intent_router = IntentRouter(RuleTable.load(), self.rag_engine)
+            except ValueError as e:
+                logger.warning("Intent router disabled: %s", e)
+        self._register_gauges()
+
+    @staticmethod
+    def create_rag_engine(embedding_backend=None, retrieval_mode=RETRIEVAL_MODE):
+        """
+        Create a RAG engine configured like the chatbot's, e.g. to build the
+        index once before starting several workers.
+
+        Args:
+            embedding_backend (EmbeddingBackend or None): Query embedding backend; built from config if None.
+            retrieval_mode (str): "dense", "hybrid" or "lexical"; see RAGEngine.
+
+        Returns:
+            RAGEngine: An engine without an index yet.
+        """
+        if embedding_backend is None:
+            embedding_backend = create_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL)
+        return RAGEngine(embedding_model=embedding_backend,
+                         query_cache_size=QUERY_CACHE_SIZE,
+                         query_cache_ttl=QUERY_CACHE_TTL,
+                         retrieval_mode=retrieval_mode,
+                         index_spec=INDEX_SPEC)
+
+    def _register_gauges(self):
+        """
+        Expose cache and generation queue state on the metrics endpoint.
+        """
+        REGISTRY.gauge("chatbot_query_cache_hit_rate", "Hit rate of the query embedding cache.",
+                       lambda: self.rag_engine.query_cache_stats()["hit_rate"])
+        REGISTRY.gauge("chatbot_response_cache_hit_rate", "Hit rate of the semantic response cache.",
+                       lambda: self.response_cache.stats()["hit_rate"])
+        REGISTRY.gauge("chatbot_response_cache_size", "Responses held in the semantic response cache.",
+                       lambda: self.response_cache.stats()["size"])
+        REGISTRY.gauge("chatbot_fast_path_rate", "Share of questions answered by the intent router without the LLM.",
+                       lambda: self.intent_router.stats()["fast_path_rate"] if self.intent_router else 0.0)
+        REGISTRY.gauge("chatbot_generations_in_flight", "Generations currently running.",
+                       lambda: self.generation_limiter.in_flight)
+        REGISTRY.gauge("chatbot_generations_waiting", "Requests waiting for a generation slot.",
+                       lambda: self.generation_limiter.waiting)
+        REGISTRY.gauge("chatbot_generations_rejected", "Requests rejected after waiting too long for a slot.",
+                       lambda: self.generation_limiter.rejected)
+        if isinstance(self.client, LocalGenerator):
+            REGISTRY.gauge("chatbot_local_generation_batch_size", "Average requests per local decoding batch.",
+                           lambda: self.client.stats()["average_batch_size"])
 
     def _setup_rag(self):
         """
         Set up the RAG engine by either loading a pre-built index or building a new one.
         """
-        index_dir = 'models'
-        index_path = os.path.join(index_dir, 'school_rag')
+        index_path = os.path.join(self.index_dir, 'school_rag')
         
-        # Check if index files exist
-        if (os.path.exists(f"{index_path}_documents.pkl") and 
-            os.path.exists(f"{index_path}_embeddings.pkl") and 
-            os.path.exists(f"{index_path}_faiss.index")):
-            # Load existing index
-            try:
-                self.rag_engine.load_index(index_path)
-                print("Loaded existing RAG index.")
-                return
-            except Exception as e:
-                print(f"Error loading index: {e}. Building new index...")
+        # Reuse the cached index if it was built from the current CSVs, embedding
+        # model and document-building code; apply only the changed rows otherwise
+        try:
+            status = self.rag_engine.load_or_build(index_path, self.school_csv, self.programs_csv)
+            if status == "loaded":
+                logger.info("Loaded existing RAG index.")
+            elif status == "updated":
+                logger.info("Updated existing RAG index with changed schools.")
+            else:
+                logger.info("Built and saved new RAG index.")
+            return
+        except Exception as e:
+            logger.warning("Error loading index: %s. Building new index...", e)
         
         # Build new index
-        os.makedirs(index_dir, exist_ok=True)
         self.rag_engine.process_school_data(self.school_csv, self.programs_csv)
         self.rag_engine.build_index(index_path)
-        print("Built and saved new RAG index.")
+        logger.info("Built and saved new RAG index.")
+
+    def warm_up(self):
+        """
+        Load the embedding model, page in the index and precompile the prompt
+        prefix (and, with the local generation backend, load the model and
+        cache the prefix's keys and values) before serving, so the first user
+        doesn't wait for them.
+
+        Returns:
+            dict: Seconds spent in each startup phase so far.
+        """
+        self.rag_engine.warm_up()
+        with timed_phase("warm_up"):
+            self.prompt_template.static_prefix
+        if isinstance(self.client, LocalGenerator):
+            self.client.warm_up()
+        timings = startup_timings()
+        logger.info("Startup phases: %s", ", ".join(f"{name}={seconds:.2f}s" for name, seconds in timings.items()))
+        return timings
 
     @staticmethod
     def load_age_cutoffs(filepath='age_cutoffs_2025.txt'):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return f.read()
-        except FileNotFoundError:
-            return "# AGE_CUTOFFS\n<Error: age cutoff file not found>"
+        return read_age_cutoffs(filepath)
         
     @staticmethod
     def format_school_data(
@@ -78,23 +223,17 @@ class SchoolChatbot:
             str: Formatted string for # SCHOOL_DATA section.
         """
         try:
-            # Load both datasets
-            schools_df = pd.read_csv(school_csv)
-            programs_df = pd.read_csv(programs_csv)
-
-            # Merge on School Name
-            merged_df = pd.merge(schools_df, programs_df, on="School Name", how="left")
+            # Load and merge both datasets
+            merged_df, program_columns = load_school_data(school_csv, programs_csv)
 
             # Use more concise formatting
-            school_lines = []
-            for _, row in merged_df.iterrows():
-                # Collect all programs marked "Yes"
-                programs_offered = [col for col in programs_df.columns[1:] if row.get(col, "") == "Yes"]
-                programs_str = "Y" if programs_offered else "N"
-
-                school_lines.append(
-                    f'- {row["School Name"]}: {row["Grades Served"]}, {row["School Type"]}, {programs_str}'
-                )    
+            programs_str = pd.Series(
+                np.where(program_flags(merged_df, program_columns).any(axis=1), "Y", "N"),
+                index=merged_df.index)
+            school_lines = (
+                "- " + merged_df["School Name"].astype(str) + ": " + merged_df["Grades Served"].astype(str)
+                + ", " + merged_df["School Type"].astype(str) + ", " + programs_str
+            ).tolist()
             school_lines = list(set(school_lines))  # Remove duplicates
             return "# SCHOOL_DATA\n" + "\n".join(school_lines)
 
@@ -102,92 +241,389 @@ class SchoolChatbot:
             return f"# SCHOOL_DATA\n<Error loading or merging data: {e}>"
 
         
-    def format_prompt(self, user_input):
+    def format_prompt(self, user_input, retrieved_docs=None, conversation=None):
         """
         Format the user's input into a proper prompt using RAG to retrieve relevant context.
+
+        The system message, age cutoffs, transportation rules and examples form
+        a static prefix that is built once (see PromptTemplate); only the
+        retrieved schools, the bounded conversation so far and the user's
+        question change per request.
         
         Args:
             user_input (str): The user's question about Boston schools
+            retrieved_docs (list or None): Documents already retrieved for this input;
+                retrieved here if None
+            conversation (Conversation or None): Earlier turns, from ConversationMemory.prepare
 
         Returns:
             str: A formatted prompt ready for the model
         """
-        system_message = """You are a helpful and accurate school enrollment assistant for Boston Public Schools (BPS).
-        You can provide information about school options, locations, programs, and other details
-        to help families make informed decisions about their children's education.
-        
-        Provide clear, fact-based, and non-misleading information using the data provided below.
-        Focus on answering only the user's specific question using the relevant school information.
-        
-        When answering questions about specific schools, neighborhoods, or programs, prioritize information 
-        from the RETRIEVED_SCHOOLS section, which contains the most relevant schools for the user's query.
+        # Instead of including all school data, retrieve relevant schools using RAG
+        if retrieved_docs is None:
+            with span("retrieve"):
+                retrieved_docs = self.rag_engine.retrieve(user_input, top_k=self.retrieval_top_k, auto_filter=True,
+                                                          adaptive=self.retrieval_policy)
+
+        # Distances from a zip code or neighborhood in the question. They are measured between
+        # area centroids, which can be off by more than the gaps between the bus thresholds
+        # (0.75, 1 and 1.5 miles), so transportation questions get none.
+        distances = None
+        if not is_transportation_question(user_input):
+            distances = self.rag_engine.distances_from(user_input, retrieved_docs)
+
+        def format_context(docs):
+            with span("format_context"):
+                return self.rag_engine.format_retrieved_context(docs, distances)
+
+        with span("prompt_assembly"):
+            prompt = self.prompt_template.render(user_input, retrieved_docs, format_context,
+                                                 conversation.render() if conversation is not None else "")
+
+        logger.debug("Prompt:\n%s", prompt)
+        return prompt
+
+    def _prepare_conversation(self, history):
+        """
+        Bound the chat history for the next turn; see ConversationMemory.
+        """
+        with span("conversation"):
+            return self.memory.prepare(history, self.rag_engine.find_school_names)
 
-        DO NOT make up or hallucinate any school information.
+    def _with_carried_schools(self, user_input, conversation, retrieved_docs):
+        """
+        For a follow-up such as "Where is it located?", put the schools
+        discussed in earlier turns ahead of the freshly retrieved ones,
+        keeping at most retrieval_top_k schools.
+        """
+        if not conversation.schools or not is_follow_up(user_input):
+            return retrieved_docs
+        docs = []
+        for doc in self.rag_engine.documents_by_name(conversation.schools) + list(retrieved_docs):
+            if all(doc.school_name != kept.school_name for kept in docs):
+                docs.append(doc)
+        return docs[:self.retrieval_top_k]
+
+    def _retrieve(self, user_input, conversation):
+        with span("retrieve"):
+            docs = self.rag_engine.retrieve(conversation.retrieval_query(user_input), top_k=self.retrieval_top_k,
+                                            auto_filter=True, adaptive=self.retrieval_policy)
+        return self._with_carried_schools(user_input, conversation, docs)
+
+    async def _aretrieve(self, user_input, conversation):
+        with span("retrieve"):
+            docs = await self.rag_engine.aretrieve(conversation.retrieval_query(user_input),
+                                                   top_k=self.retrieval_top_k, auto_filter=True,
+                                                   adaptive=self.retrieval_policy)
+        return self._with_carried_schools(user_input, conversation, docs)
+
+    # Sampling parameters shared by the blocking and streaming generation paths
+    GENERATION_PARAMS = {
+        "max_new_tokens": 512,
+        "temperature": 0.7,
+        "do_sample": True,
+        "repetition_penalty": 1.1,
+    }
+
+    def _record_timing(self, started, first_token_at=None):
+        """
+        Record the latency of one response. Time to first token is kept
+        separately from total latency; both are measured from the start of
+        the request, so they include retrieval and prompt assembly.
+        """
+        finished = time.perf_counter()
+        trace = current_trace()
+        if first_token_at is not None and trace is not None:
+            TIME_TO_FIRST_TOKEN.observe(first_token_at - started, path=trace.path)
+        self.response_timings.append({
+            "time_to_first_token": None if first_token_at is None else first_token_at - started,
+            "total": finished - started,
+        })
 
-        If the retrieved schools don't match what the user is looking for, acknowledge this limitation
-        and suggest they contact BPS directly at (617) 635-9010 for more information.
+    def _fast_path(self, user_input, conversation, trace):
         """
+        Answer deterministic questions (grade for a birth date, bus
+        eligibility, schools serving a grade) from the rule table, without
+        retrieval or generation; see IntentRouter. Follow-ups about schools
+        discussed earlier always go to the LLM.
 
-        age_cutoffs_section = SchoolChatbot.load_age_cutoffs()
+        Returns:
+            str or None: The templated answer, or None if the question needs RAG and the LLM
+        """
+        if self.intent_router is None or (conversation.schools and is_follow_up(user_input)):
+            return None
+        with span("intent_router"):
+            routed = self.intent_router.route(user_input)
+        if routed is None:
+            return None
+        trace.outcome = "fast_path"
+        trace.set(intent=routed.intent, turns=len(conversation.turns))
+        self.memory.remember(conversation, user_input, routed.text, list(routed.schools))
+        return routed.text
+
+    def intent_router_stats(self):
+        """
+        How many questions the intent router answered without the LLM.
 
-        transportation_section = """# TRANSPORTATION_ELIGIBILITY
-        - K0–K1: Bus eligible if >0.75 miles from school
-        - K2–5: Bus eligible if >1 mile
-        - Grades 6–8: Bus eligible if >1.5 miles
-        - Grades 9–12: MBTA pass provided
+        Returns:
+            dict: Router statistics, including fast_path_rate (empty if the router is disabled)
+        """
+        return self.intent_router.stats() if self.intent_router is not None else {}
+
+    def _response_cache_key(self, user_input, retrieved_docs):
+        """
+        Build the response cache key for a query: its embedding (already in the
+        RAG engine's query cache after retrieval), its normalized text and the
+        set of retrieved schools. Cached responses are dropped whenever the
+        index has been rebuilt or updated since they were stored.
         """
+        if self.rag_engine.index_version != self._response_cache_index_version:
+            self.response_cache.clear()
+            self._response_cache_index_version = self.rag_engine.index_version
+
+        # Skip encoding when caching is disabled (RESPONSE_CACHE_SIZE = 0)
+        uses_embedding = self.rag_engine.uses_embeddings and self.response_cache.maxsize > 0
+        embedding = self.rag_engine.encode_query(user_input) if uses_embedding else None
+        doc_key = frozenset(doc.school_name for doc in retrieved_docs)
+        return embedding, normalize_query(user_input), doc_key
+
+    def response_cache_stats(self):
+        """
+        Hit/miss counters of the semantic response cache.
+
+        Returns:
+            dict: Cache statistics, including hit_rate
+        """
+        return self.response_cache.stats()
+
+    def _lookup_response(self, user_input, retrieved_docs, trace, conversation):
+        """
+        Look up a cached response for the query, marking the trace as a cache
+        hit if there is one. Answers within a conversation depend on the
+        earlier turns, so only a conversation's first message uses the cache.
+
+        Returns:
+            tuple: The cache key, for storing the response later (None if it
+            shouldn't be stored), and the cached response or None
+        """
+        trace.set(schools=[doc.school_name for doc in retrieved_docs], turns=len(conversation.turns))
+        if not conversation.is_empty:
+            trace.outcome = "generated"
+            return None, None
+        with span("cache_lookup"):
+            cache_key = self._response_cache_key(user_input, retrieved_docs)
+            response = self.response_cache.lookup(*cache_key)
+        trace.outcome = "generated" if response is None else "cache_hit"
+        return cache_key, response
+
+    def _finish_response(self, user_input, response, retrieved_docs, conversation, cache_key=None):
+        """
+        Cache a generated response (if given its cache key) and remember the
+        turn for the conversation's next message.
+        """
+        if cache_key is not None:
+            self.response_cache.store(*cache_key, response)
+        self.memory.remember(conversation, user_input, response, [doc.school_name for doc in retrieved_docs])
+
+    def get_response(self, user_input, history=None):
+        """
+        Generate responses to user questions using RAG and the language model.
+
+        Deterministic questions, such as the grade for a birth date, are
+        answered from the rule table (see IntentRouter), and near-duplicate
+        questions that retrieve the same schools from the response cache,
+        both without calling the model.
+
+        With history, a token-bounded window of recent turns and a rolling
+        summary of older ones go into the prompt, and follow-up questions are
+        answered about the schools discussed earlier (see ConversationMemory),
+        so each turn costs about the same however long the conversation runs.
         
-        # Instead of including all school data, retrieve relevant schools using RAG
-        retrieved_docs = self.rag_engine.retrieve(user_input, top_k=3)
-        retrieved_context = self.rag_engine.format_retrieved_context(retrieved_docs)
+        Args:
+            user_input (str): The user's question about Boston schools
+            history (list or None): Earlier messages, as sent by gr.ChatInterface
+
+        Returns:
+            str: The chatbot's response
+        """
+        with trace_request("get_response") as trace:
+            started = time.perf_counter()
+            conversation = self._prepare_conversation(history)
+            response = self._fast_path(user_input, conversation, trace)
+            if response is not None:
+                self._record_timing(started)
+                return response
+            retrieved_docs = self._retrieve(user_input, conversation)
+            cache_key, response = self._lookup_response(user_input, retrieved_docs, trace, conversation)
+            if response is not None:
+                self._finish_response(user_input, response, retrieved_docs, conversation)
+                self._record_timing(started)
+                return response
+
+            prompt = self.format_prompt(user_input, retrieved_docs, conversation)
+            
+            # Generate response using the model
+            with span("generation"):
+                response = self.client.text_generation(prompt, **self.GENERATION_PARAMS)
+            
+            self._finish_response(user_input, response, retrieved_docs, conversation, cache_key)
+            self._record_timing(started)
+            return response
+
+    def get_response_stream(self, user_input, history=None):
+        """
+        Generate a response like get_response, yielding tokens as the model produces them.
         
-        # Comment out the full dataset reference to reduce token usage
-        # school_data_section = SchoolChatbot.format_school_data(
-        #     school_csv=self.school_csv,
-        #     programs_csv=self.programs_csv,
-        # )
-
-        examples_section = """# EXAMPLES
-            User: My child is turning 5 on August 15 and we live in 02124. What grade can they enter, and what schools are available?
-            Assistant: Since your child turns 5 before September 1, they are eligible for K2. Based on your zip code (02124), eligible schools may include Joseph Lee K-8, Mildred Avenue, and TechBoston Academy.
-            """
-
-        # Combine all sections into the final prompt
-        # f"{school_data_section}\n"  # Comment out the full dataset section
-        prompt = (
-            f"<|system|>\n{system_message}\n"
-            f"{age_cutoffs_section}\n"
-            f"{transportation_section}\n"
-            f"{retrieved_context}\n"
-            f"{examples_section}\n"
-            f"<|user|>\n{user_input}\n<|assistant|>\n"
-        )
+        Args:
+            user_input (str): The user's question about Boston schools
+            history (list or None): Earlier messages, as sent by gr.ChatInterface
 
-        print(prompt)
-        return prompt
-    
+        Yields:
+            str: The next piece of generated text
+        """
+        with trace_request("get_response_stream") as trace:
+            started = time.perf_counter()
+            conversation = self._prepare_conversation(history)
+            answer = self._fast_path(user_input, conversation, trace)
+            if answer is not None:
+                self._record_timing(started, time.perf_counter())
+                yield answer
+                return
+            retrieved_docs = self._retrieve(user_input, conversation)
+            cache_key, cached = self._lookup_response(user_input, retrieved_docs, trace, conversation)
+            if cached is not None:
+                self._finish_response(user_input, cached, retrieved_docs, conversation)
+                self._record_timing(started, time.perf_counter())
+                yield cached
+                return
 
+            first_token_at = None
+            prompt = self.format_prompt(user_input, retrieved_docs, conversation)
+
+            tokens = []
+            # Includes the time the caller spends between tokens
+            with span("generation"):
+                for token in self.client.text_generation(prompt, stream=True, **self.GENERATION_PARAMS):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    tokens.append(token)
+                    yield token
+
+            self._finish_response(user_input, "".join(tokens), retrieved_docs, conversation, cache_key)
+            self._record_timing(started, first_token_at)
+
+    async def aformat_prompt(self, user_input, history=None):
+        """
+        Async version of format_prompt: retrieval runs in an executor so
+        query encoding doesn't block the event loop.
         
-    def get_response(self, user_input):
+        Args:
+            user_input (str): The user's question about Boston schools
+            history (list or None): Earlier messages, as sent by gr.ChatInterface
+
+        Returns:
+            str: A formatted prompt ready for the model
         """
-        Generate responses to user questions using RAG and the language model.
+        conversation = self._prepare_conversation(history)
+        retrieved_docs = await self._aretrieve(user_input, conversation)
+        return self.format_prompt(user_input, retrieved_docs, conversation)
+
+    async def aget_response(self, user_input, history=None):
+        """
+        Async version of get_response. At most MAX_CONCURRENT_GENERATIONS
+        generations are in flight; further requests wait for a slot and fail
+        with OverloadedError after GENERATION_QUEUE_TIMEOUT. Each attempt is
+        bounded by GENERATION_TIMEOUT and transient failures are retried.
         
         Args:
             user_input (str): The user's question about Boston schools
+            history (list or None): Earlier messages, as sent by gr.ChatInterface
 
         Returns:
             str: The chatbot's response
         """
-        prompt = self.format_prompt(user_input)
-        
-        # Generate response using the model
-        response = self.client.text_generation(
-            prompt,
-            max_new_tokens=512,
-            temperature=0.7,
-            do_sample=True,
-            repetition_penalty=1.1
-        )
+        with trace_request("aget_response") as trace:
+            started = time.perf_counter()
+            conversation = self._prepare_conversation(history)
+            response = self._fast_path(user_input, conversation, trace)
+            if response is not None:
+                self._record_timing(started)
+                return response
+            retrieved_docs = await self._aretrieve(user_input, conversation)
+            cache_key, response = self._lookup_response(user_input, retrieved_docs, trace, conversation)
+            if response is not None:
+                self._finish_response(user_input, response, retrieved_docs, conversation)
+                self._record_timing(started)
+                return response
+
+            prompt = self.format_prompt(user_input, retrieved_docs, conversation)
+
+            queued = time.perf_counter()
+            async with self.generation_limiter.slot():
+                record_stage("queue_wait", time.perf_counter() - queued)
+                with span("generation"):
+                    response = await call_with_retries(
+                        lambda: self.async_client.text_generation(prompt, **self.GENERATION_PARAMS),
+                        timeout=self.generation_timeout,
+                        retries=self.generation_retries,
+                    )
+
+            self._finish_response(user_input, response, retrieved_docs, conversation, cache_key)
+            self._record_timing(started)
+            return response
+
+    async def aget_response_stream(self, user_input, history=None):
+        """
+        Async version of get_response_stream. Opening the stream is retried
+        like aget_response; once tokens flow, each must arrive within
+        GENERATION_TIMEOUT.
         
-        return response
+        Args:
+            user_input (str): The user's question about Boston schools
+            history (list or None): Earlier messages, as sent by gr.ChatInterface
+
+        Yields:
+            str: The next piece of generated text
+        """
+        with trace_request("aget_response_stream") as trace:
+            started = time.perf_counter()
+            conversation = self._prepare_conversation(history)
+            answer = self._fast_path(user_input, conversation, trace)
+            if answer is not None:
+                self._record_timing(started, time.perf_counter())
+                yield answer
+                return
+            retrieved_docs = await self._aretrieve(user_input, conversation)
+            cache_key, cached = self._lookup_response(user_input, retrieved_docs, trace, conversation)
+            if cached is not None:
+                self._finish_response(user_input, cached, retrieved_docs, conversation)
+                self._record_timing(started, time.perf_counter())
+                yield cached
+                return
+
+            first_token_at = None
+            prompt = self.format_prompt(user_input, retrieved_docs, conversation)
+
+            tokens = []
+            queued = time.perf_counter()
+            async with self.generation_limiter.slot():
+                record_stage("queue_wait", time.perf_counter() - queued)
+                # Includes the time the caller spends between tokens
+                with span("generation"):
+                    stream = await call_with_retries(
+                        lambda: self.async_client.text_generation(prompt, stream=True, **self.GENERATION_PARAMS),
+                        timeout=self.generation_timeout,
+                        retries=self.generation_retries,
+                    )
+                    while True:
+                        try:
+                            token = await asyncio.wait_for(stream.__anext__(), timeout=self.generation_timeout)
+                        except StopAsyncIteration:
+                            break
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        tokens.append(token)
+                        yield token
 
+            self._finish_response(user_input, "".join(tokens), retrieved_docs, conversation, cache_key)
+            self._record_timing(started, first_token_at)
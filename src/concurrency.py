@@ -0,0 +1,121 @@
+import asyncio
+import random
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+# HTTP statuses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class OverloadedError(RuntimeError):
+    """
+    Raised when a request waited too long for a free generation slot.
+    """
+
+
+class ConcurrencyLimiter:
+    """
+    Caps the number of in-flight operations. Callers beyond the cap wait for a
+    slot (back-pressure) and give up with OverloadedError after queue_timeout.
+
+    The semaphore is created in the running event loop and replaced when the
+    limiter is used from a new one, so one limiter can serve successive
+    asyncio.run calls (e.g. from the batch command or the benchmark).
+
+    Example usage:
+        limiter = ConcurrencyLimiter(max_in_flight=8, queue_timeout=30)
+        async with limiter.slot():
+            await generate(...)
+    """
+
+    def __init__(self, max_in_flight: int, queue_timeout: Optional[float] = None):
+        """
+        Args:
+            max_in_flight: Maximum number of concurrent operations
+            queue_timeout: Seconds to wait for a slot, or None to wait indefinitely
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def _loop_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._loop = loop
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        semaphore = self._loop_semaphore()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise OverloadedError(
+                f"No generation slot free after {self.queue_timeout}s "
+                f"({self.max_in_flight} in flight)") from None
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a failed inference call is worth retrying: timeouts, connection
+    failures and rate-limit or transient server errors.
+
+    Args:
+        error: The exception raised by the call
+
+    Returns:
+        True if the call may succeed when retried
+    """
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ == "InferenceTimeoutError":
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # Transport-level failures of the HTTP library underneath the inference client
+    return type(error).__module__.split(".")[0] in ("httpx", "aiohttp")
+
+
+async def call_with_retries(call: Callable[[], Awaitable[Any]],
+                            timeout: Optional[float] = None,
+                            retries: int = 2,
+                            backoff: float = 0.5) -> Any:
+    """
+    Await call() with a per-attempt timeout, retrying retryable failures with
+    jittered exponential backoff.
+
+    Args:
+        call: Zero-argument function returning a fresh awaitable per attempt
+        timeout: Seconds allowed per attempt, or None for no limit
+        retries: Number of retries after the first attempt
+        backoff: Base delay in seconds; attempt n waits about backoff * 2**n
+
+    Returns:
+        The result of the first successful attempt
+    """
+    for attempt in range(retries + 1):
+        try:
+            return await asyncio.wait_for(call(), timeout=timeout)
+        except Exception as error:
+            if attempt == retries or not is_retryable(error):
+                raise
+            await asyncio.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
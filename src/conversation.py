@@ -0,0 +1,302 @@
+"""
+Bounded conversation memory for multi-turn chats.
+
+The chat UI sends the whole history with every message. Sending it all to the
+model would make every turn more expensive than the last, so only a window of
+recent turns that fits a token budget is kept verbatim. Older turns are
+folded into a short rolling summary, and the schools discussed so far are
+carried forward by name and looked up again instead of re-sending the text
+of earlier answers.
+
+Both the summary and the carried schools are cached under a fingerprint of
+the conversation, so each turn only summarizes the turns that just left the
+window. If the cache no longer has a conversation (e.g. after a restart), its
+state is rebuilt once from the history.
+
+Example usage:
+    memory = ConversationMemory(max_history_tokens=512)
+    conversation = memory.prepare(history)
+    docs = retrieve(conversation.retrieval_query(message))
+    ...
+    memory.remember(conversation, message, response, [doc.school_name for doc in docs])
+"""
+
+import hashlib
+import re
+from functools import lru_cache
+from typing import Any, Callable, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from src.caching import LRUCache
+from src.prompt import approximate_tokens
+
+
+class Turn(NamedTuple):
+    user: str
+    assistant: str
+
+
+class ConversationState(NamedTuple):
+    """
+    Cached state of a conversation after one of its turns.
+    """
+    summarized_turns: int
+    summary: str
+    schools: Tuple[str, ...]
+
+
+def _message_text(content: Any) -> str:
+    """
+    Text of a chat message, which Gradio sends as a string or as a list of
+    content blocks; files and other components have no text.
+    """
+    if isinstance(content, str):
+        return content
+    if isinstance(content, (list, tuple)):
+        return "".join(item.get("text", "") if isinstance(item, dict) else (item if isinstance(item, str) else "")
+                       for item in content)
+    if isinstance(content, dict):
+        return content.get("text", "") if isinstance(content.get("text"), str) else ""
+    return ""
+
+
+def normalize_history(history: Optional[Sequence[Any]]) -> List[Turn]:
+    """
+    Turn chat history into (user, assistant) pairs.
+
+    Args:
+        history: Either OpenAI-style messages ({"role": ..., "content": ...}),
+            as sent by gr.ChatInterface, or [user, assistant] pairs
+
+    Returns:
+        Completed turns, oldest first
+    """
+    turns = []
+    pending_user = None
+    for item in history or []:
+        if isinstance(item, dict):
+            text = _message_text(item.get("content")).strip()
+            if item.get("role") == "user":
+                # Consecutive user messages (e.g. text and a file) form one turn
+                pending_user = text if pending_user is None else f"{pending_user}\n{text}".strip()
+            elif item.get("role") == "assistant" and pending_user is not None:
+                turns.append(Turn(pending_user, text))
+                pending_user = None
+            elif item.get("role") == "assistant" and turns:
+                turns[-1] = Turn(turns[-1].user, f"{turns[-1].assistant}\n{text}".strip())
+        else:
+            user, assistant = item
+            turns.append(Turn(_message_text(user).strip(), _message_text(assistant).strip()))
+    return turns
+
+
+def conversation_key(turns: Sequence[Turn]) -> str:
+    """
+    Fingerprint of a conversation's turns.
+    """
+    digest = hashlib.sha1()
+    for turn in turns:
+        digest.update(turn.user.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(turn.assistant.encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+def _shorten(text: str, max_words: int) -> str:
+    words = text.split()
+    return " ".join(words[:max_words]) + (" ..." if len(words) > max_words else "")
+
+
+def summarize_turns(previous: Optional[str], turns: Sequence[Turn], max_lines: int = 8) -> str:
+    """
+    Extend a rolling summary with turns leaving the window: one line per turn
+    with the question and the start of the answer. Only the last max_lines
+    lines are kept, so the summary stays bounded however long the
+    conversation runs.
+
+    Args:
+        previous: Summary of the turns before these, or None
+        turns: Turns to add, oldest first
+        max_lines: Maximum number of lines kept
+
+    Returns:
+        The updated summary
+    """
+    lines = previous.splitlines() if previous else []
+    for turn in turns:
+        first_sentence = re.split(r"(?<=[.!?])\s", turn.assistant, maxsplit=1)[0]
+        lines.append(f"- User asked: {_shorten(turn.user, 30)} Assistant: {_shorten(first_sentence, 30)}")
+    return "\n".join(lines[-max_lines:])
+
+
+# Words that point back to something said earlier, as in "Where is it located?"
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|it's|they|them|their|theirs|this one|that one|the school|this school|that school|"
+    r"those schools|these schools|the same|either|both|which one|what about|how about)\b",
+    re.IGNORECASE,
+)
+
+
+def is_follow_up(message: str, max_words: int = 12) -> bool:
+    """
+    Whether a message probably refers back to earlier turns: a short message
+    containing a referring word.
+
+    Args:
+        message: The user's message
+        max_words: Longer messages are treated as self-contained
+
+    Returns:
+        True if the message looks like a follow-up
+    """
+    return len(message.split()) <= max_words and FOLLOW_UP_PATTERN.search(message) is not None
+
+
+class Conversation:
+    """
+    The part of a conversation sent with the next turn: a summary of older
+    turns, the recent turns verbatim and the schools discussed so far.
+    """
+
+    def __init__(self,
+                 turns: Sequence[Turn],
+                 recent_turns: Sequence[Turn],
+                 summary: str,
+                 summarized_turns: int,
+                 schools: Sequence[str]):
+        self.turns = list(turns)
+        self.recent_turns = list(recent_turns)
+        self.summary = summary
+        self.summarized_turns = summarized_turns
+        self.schools = list(schools)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.turns
+
+    def retrieval_query(self, message: str) -> str:
+        """
+        Query to retrieve schools with: the message itself, or for a
+        follow-up, the message together with the previous question.
+        """
+        if self.turns and is_follow_up(message):
+            return f"{self.turns[-1].user} {message}"
+        return message
+
+    def render(self) -> str:
+        """
+        Summary section and recent turns, in the prompt's chat format.
+        """
+        parts = []
+        if self.summary:
+            parts.append(f"# CONVERSATION_SUMMARY\n{self.summary}\n")
+        for turn in self.recent_turns:
+            parts.append(f"<|user|>\n{turn.user}\n<|assistant|>\n{turn.assistant}\n")
+        return "".join(parts)
+
+
+class ConversationMemory:
+    """
+    Keeps a token-bounded window of recent turns, a cached rolling summary of
+    older ones and the schools carried forward between turns.
+    """
+
+    def __init__(self,
+                 max_history_tokens: int = 512,
+                 max_recent_turns: int = 6,
+                 max_carried_schools: int = 3,
+                 count_tokens: Callable[[str], int] = approximate_tokens,
+                 summarize: Callable[[Optional[str], Sequence[Turn]], str] = summarize_turns,
+                 cache_size: int = 1024,
+                 cache_ttl: Optional[float] = 24 * 3600):
+        """
+        Args:
+            max_history_tokens: Token budget for the verbatim recent turns
+            max_recent_turns: Most turns kept verbatim, whatever their length
+            max_carried_schools: Schools carried forward from earlier turns
+            count_tokens: Function counting the tokens in a text
+            summarize: Function extending a summary with turns leaving the window
+            cache_size: Number of conversations whose state is cached
+            cache_ttl: Seconds a conversation's state stays cached
+        """
+        self.max_history_tokens = max_history_tokens
+        self.max_recent_turns = max_recent_turns
+        self.max_carried_schools = max_carried_schools
+        # Turns are counted once, not again on every later turn
+        self.count_tokens = lru_cache(maxsize=4096)(count_tokens)
+        self.summarize = summarize
+        self.states = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def _window_start(self, turns: Sequence[Turn]) -> int:
+        """
+        Index of the oldest turn kept verbatim.
+        """
+        start = len(turns)
+        used = 0
+        while start > 0 and len(turns) - start < self.max_recent_turns:
+            turn = turns[start - 1]
+            tokens = self.count_tokens(turn.user) + self.count_tokens(turn.assistant)
+            if used + tokens > self.max_history_tokens:
+                break
+            used += tokens
+            start -= 1
+        return start
+
+    def prepare(self,
+                history: Optional[Sequence[Any]],
+                find_schools: Optional[Callable[[str], List[str]]] = None) -> Conversation:
+        """
+        Bound the history for the next turn.
+
+        Args:
+            history: Chat history as sent by the UI; see normalize_history
+            find_schools: Function returning the schools named in a text, used
+                to recover the carried schools when the conversation's state
+                is no longer cached
+
+        Returns:
+            The conversation to send with the next turn
+        """
+        turns = normalize_history(history)
+        if not turns:
+            return Conversation([], [], "", 0, [])
+
+        state = self.states.get(conversation_key(turns))
+        if state is None:
+            schools = []
+            if find_schools is not None:
+                for turn in reversed(turns):
+                    schools.extend(name for name in find_schools(f"{turn.user}\n{turn.assistant}")
+                                   if name not in schools)
+            state = ConversationState(0, "", tuple(schools[:self.max_carried_schools]))
+
+        # The window only moves forward, so already summarized turns stay summarized
+        start = max(self._window_start(turns), state.summarized_turns)
+        summary = state.summary
+        if start > state.summarized_turns:
+            summary = self.summarize(summary or None, turns[state.summarized_turns:start])
+        return Conversation(turns, turns[start:], summary, start, state.schools)
+
+    def remember(self,
+                 conversation: Conversation,
+                 message: str,
+                 response: str,
+                 schools: Iterable[str]) -> None:
+        """
+        Cache the state after a completed turn, keyed by the history the UI
+        will send with the next message.
+
+        Args:
+            conversation: The conversation the turn was answered with
+            message: The user's message
+            response: The full response shown to the user
+            schools: Schools used to answer, most relevant first
+        """
+        carried = []
+        for name in list(schools) + conversation.schools:
+            if name not in carried:
+                carried.append(name)
+        turns = conversation.turns + [Turn(message.strip(), response.strip())]
+        self.states.put(conversation_key(turns),
+                        ConversationState(conversation.summarized_turns, conversation.summary,
+                                          tuple(carried[:self.max_carried_schools])))
@@ -0,0 +1,245 @@
+"""
+Query embedding as a local service shared by several worker processes.
+
+One process loads the embedding model and serves encode requests over a Unix
+socket (or a localhost TCP port where Unix sockets aren't available).
+Requests from all workers go through a MicroBatcher, so concurrent queries
+share one forward pass, and the model's memory is paid for once instead of
+once per worker.
+
+Example usage:
+    service = EmbeddingService(functools.partial(create_backend, "sentence-transformers", "all-MiniLM-L6-v2"))
+    service.start()
+    backend = service.client()          # an EmbeddingBackend, usable by RAGEngine
+    vectors = backend.encode(["Spanish programs in Roxbury"])
+    service.stop()
+"""
+
+import logging
+import multiprocessing
+import os
+import secrets
+import socket
+import tempfile
+import threading
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, List, Optional, Sequence
+
+import numpy as np
+
+from src.batching import MicroBatcher
+from src.embeddings import EmbeddingBackend
+
+logger = logging.getLogger(__name__)
+
+
+def _default_address() -> Any:
+    if hasattr(socket, "AF_UNIX"):
+        return os.path.join(tempfile.mkdtemp(prefix="bps-embeddings-"), "embeddings.sock")
+    return ("127.0.0.1", 0)
+
+
+def _handle_connection(conn: Any, backend: EmbeddingBackend, batcher: MicroBatcher) -> None:
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                command, payload = request
+                if command == "encode":
+                    reply = batcher.submit(list(payload))
+                elif command == "model_id":
+                    reply = backend.model_id
+                elif command == "stats":
+                    reply = {"batches_run": batcher.batches_run, "items_processed": batcher.items_processed}
+                else:
+                    raise ValueError(f"Unknown command: {command!r}")
+                conn.send(("ok", reply))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def serve_embeddings(backend_factory: Callable[[], EmbeddingBackend],
+                     address: Any,
+                     authkey: bytes,
+                     ready: Any,
+                     max_batch_size: int = 32,
+                     max_wait_ms: float = 2.0) -> None:
+    """
+    Load the embedding model and serve encode requests until the process is
+    terminated. Runs in the embedding service's own process.
+
+    Args:
+        backend_factory: Picklable callable returning the EmbeddingBackend to serve
+        address: Unix socket path or (host, port) to listen on
+        authkey: Shared secret clients must present
+        ready: Connection the bound address is sent on once the model is loaded
+        max_batch_size: Most texts encoded in one forward pass
+        max_wait_ms: How long a request waits for others to share its batch
+    """
+    backend = backend_factory()
+    backend.load()
+
+    def encode_batch(requests: List[List[str]]) -> List[np.ndarray]:
+        texts = [text for request in requests for text in request]
+        embeddings = backend.encode(texts)
+        results, start = [], 0
+        for request in requests:
+            results.append(embeddings[start:start + len(request)])
+            start += len(request)
+        return results
+
+    batcher = MicroBatcher(encode_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    with Listener(address, authkey=authkey) as listener:
+        ready.send(listener.address)
+        ready.close()
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_handle_connection, args=(conn, backend, batcher), daemon=True).start()
+
+
+class RemoteEmbeddingBackend(EmbeddingBackend):
+    """
+    EmbeddingBackend that sends texts to an embedding service. Each thread
+    (and each process after a fork) opens its own connection.
+    """
+
+    def __init__(self, address: Any, authkey: bytes, model_id: Optional[str] = None):
+        """
+        Args:
+            address: Address of the embedding service
+            authkey: The service's shared secret
+            model_id: The served model's id, if known; asked from the service otherwise
+        """
+        super().__init__()
+        self.address = address
+        self.authkey = authkey
+        self._model_id = model_id
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # Connections and locks stay behind; the copy connects on first use
+        return {"address": self.address, "authkey": self.authkey, "model_id": self._model_id}
+
+    def __setstate__(self, state):
+        self.__init__(state["address"], state["authkey"], state["model_id"])
+
+    @property
+    def model_id(self) -> str:
+        if self._model_id is None:
+            self._model_id = self._request("model_id")
+        return self._model_id
+
+    def _connection(self) -> Any:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = Client(self.address, authkey=self.authkey)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _request(self, command: str, payload: Any = None) -> Any:
+        conn = self._connection()
+        try:
+            conn.send((command, payload))
+            status, reply = conn.recv()
+        except (EOFError, OSError):
+            # Drop the broken connection so the next call reconnects
+            self._local.conn = None
+            raise
+        if status == "error":
+            raise RuntimeError(f"Embedding service error: {reply}")
+        return reply
+
+    def stats(self) -> dict:
+        """
+        Batching counters of the embedding service.
+        """
+        return self._request("stats")
+
+    def close(self) -> None:
+        """
+        Close this thread's connection, e.g. before forking.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    def _load(self) -> None:
+        self.model_id
+
+    def _encode(self, texts: Sequence[str]) -> np.ndarray:
+        return self._request("encode", list(texts))
+
+
+class EmbeddingService:
+    """
+    Runs serve_embeddings in a separate process and hands out clients for it.
+    """
+
+    def __init__(self,
+                 backend_factory: Callable[[], EmbeddingBackend],
+                 address: Any = None,
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0):
+        """
+        Args:
+            backend_factory: Picklable callable returning the EmbeddingBackend to serve
+            address: Unix socket path or (host, port); a private socket by default
+            max_batch_size: Most texts encoded in one forward pass
+            max_wait_ms: How long a request waits for others to share its batch
+        """
+        self.backend_factory = backend_factory
+        self._owns_address = address is None
+        self.address = address if address is not None else _default_address()
+        self.authkey = secrets.token_bytes(32)
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.process = None
+
+    def start(self, timeout: Optional[float] = 300.0) -> None:
+        """
+        Start the service process and wait until the model is loaded.
+
+        Args:
+            timeout: Seconds to wait for the model to load
+        """
+        # A fresh interpreter, so the model's threads never meet a fork
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=serve_embeddings,
+            args=(self.backend_factory, self.address, self.authkey, sender, self.max_batch_size, self.max_wait_ms),
+            name="embedding-service",
+            daemon=True,
+        )
+        self.process.start()
+        sender.close()
+        if not receiver.poll(timeout):
+            self.stop()
+            raise TimeoutError(f"Embedding service did not start within {timeout}s")
+        try:
+            self.address = receiver.recv()
+        except EOFError:
+            self.stop()
+            raise RuntimeError("Embedding service exited during startup") from None
+        logger.info("Embedding service (pid %d) listening on %s", self.process.pid, self.address)
+
+    def client(self) -> RemoteEmbeddingBackend:
+        """
+        A backend that encodes through this service.
+        """
+        client = RemoteEmbeddingBackend(self.address, self.authkey)
+        client.model_id
+        return client
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+        if self._owns_address and isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+            os.rmdir(os.path.dirname(self.address))
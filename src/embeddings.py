@@ -0,0 +1,374 @@
+"""
+Embedding backends for the RAG engine.
+
+All backends share one interface: `encode(texts)` returns a float32 matrix
+with one row per text. Models are loaded on first use (or by an explicit
+`load()` during warm-up), so constructing a backend is cheap.
+
+Two implementations are provided:
+- SentenceTransformerBackend runs the model with PyTorch via sentence-transformers.
+- OnnxEmbeddingBackend runs a model exported with `export_onnx` on ONNX Runtime,
+  optionally int8-quantized, without importing torch at all.
+
+Example usage:
+    # One-off export, e.g. when building the serving image
+    python -m src.embeddings export all-MiniLM-L6-v2 models/onnx-all-MiniLM-L6-v2
+
+    backend = create_backend("onnx", "models/onnx-all-MiniLM-L6-v2")
+    engine = RAGEngine(embedding_model=backend)
+"""
+
+import argparse
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from src.startup import timed_phase
+
+# Files written by export_onnx
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+ONNX_CONFIG_FILE = "embedding_config.json"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+class EmbeddingBackend(ABC):
+    """
+    Base class for embedding backends.
+
+    Subclasses implement `model_id`, `_load` and `_encode`; loading is done
+    once, on first use, and is thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @property
+    @abstractmethod
+    def model_id(self) -> str:
+        """
+        Identifier of the embeddings this backend produces. Indexes built
+        with different ids are never mixed.
+        """
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    def load(self) -> None:
+        """
+        Load the model now instead of on the first encode call.
+        """
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    with timed_phase("load_embedding_model"):
+                        self._load()
+                    self._loaded = True
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Embed texts.
+
+        Args:
+            texts: The texts to embed
+
+        Returns:
+            Float32 matrix of shape (len(texts), dimension)
+        """
+        self.load()
+        return np.asarray(self._encode(list(texts)), dtype="float32")
+
+    @abstractmethod
+    def _load(self) -> None:
+        """
+        Load the model; called once, under the lock.
+        """
+
+    @abstractmethod
+    def _encode(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Embed texts with the loaded model.
+        """
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """
+    Embeddings from a sentence-transformers model running on PyTorch.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", model: Optional[Any] = None):
+        """
+        Args:
+            model_name: HuggingFace model ID or local path
+            model: Already-loaded SentenceTransformer, used instead of model_name
+        """
+        super().__init__()
+        self.model_name = model_name
+        self.model = model
+        self._loaded = model is not None
+
+    @property
+    def model_id(self) -> str:
+        return self.model_name
+
+    def _load(self) -> None:
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(self.model_name)
+
+    def _encode(self, texts: Sequence[str]) -> np.ndarray:
+        return self.model.encode(texts)
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """
+    Embeddings from a transformer exported to ONNX by `export_onnx`, with the
+    same mean pooling and normalization as the sentence-transformers model it
+    was exported from. Only onnxruntime and tokenizers are needed at runtime.
+    """
+
+    def __init__(self,
+                 model_dir: str,
+                 quantized: bool = True,
+                 batch_size: int = 32,
+                 num_threads: Optional[int] = None):
+        """
+        Args:
+            model_dir: Directory written by export_onnx
+            quantized: Use the int8-quantized model instead of the float32 one
+            batch_size: Number of texts run through the model at once
+            num_threads: Intra-op threads for ONNX Runtime, or None for its default
+        """
+        super().__init__()
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.config = self._read_config(model_dir)
+        self.session = None
+        self.tokenizer = None
+        self._input_names = ()
+
+    @staticmethod
+    def _read_config(model_dir: str) -> Dict[str, Any]:
+        path = os.path.join(model_dir, ONNX_CONFIG_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No exported ONNX model found in {model_dir}; run export_onnx first.")
+
+    @property
+    def model_id(self) -> str:
+        variant = "onnx-int8" if self.quantized else "onnx"
+        return f"{variant}:{self.config['source_model']}"
+
+    def _load(self) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        if self.num_threads is not None:
+            options.intra_op_num_threads = self.num_threads
+        model_file = ONNX_QUANTIZED_MODEL_FILE if self.quantized else ONNX_MODEL_FILE
+        self.session = ort.InferenceSession(os.path.join(self.model_dir, model_file), options,
+                                            providers=["CPUExecutionProvider"])
+        self._input_names = tuple(i.name for i in self.session.get_inputs())
+
+        tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, TOKENIZER_FILE))
+        tokenizer.enable_truncation(max_length=self.config["max_length"])
+        tokenizer.enable_padding(pad_id=self.config["pad_id"], pad_token=self.config["pad_token"])
+        self.tokenizer = tokenizer
+
+    def _encode(self, texts: Sequence[str]) -> np.ndarray:
+        batches = [self._encode_batch(texts[start:start + self.batch_size])
+                   for start in range(0, len(texts), self.batch_size)]
+        if not batches:
+            return np.empty((0, self.config["dimension"]), dtype="float32")
+        return np.concatenate(batches)
+
+    def _encode_batch(self, texts: Sequence[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(list(texts))
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype="int64"),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype="int64"),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype="int64"),
+        }
+        hidden = self.session.run(None, {name: feeds[name] for name in self._input_names})[0]
+
+        # Mean pooling over real (non-padding) tokens
+        mask = feeds["attention_mask"][:, :, None].astype("float32")
+        embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config.get("normalize", True):
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.clip(norms, 1e-12, None)
+        return embeddings.astype("float32")
+
+
+def create_backend(name: str, model: str, **kwargs: Any) -> EmbeddingBackend:
+    """
+    Create an embedding backend by name.
+
+    Args:
+        name: "sentence-transformers", "onnx" (int8-quantized) or "onnx-fp32"
+        model: Model ID for sentence-transformers, export directory for ONNX
+        **kwargs: Extra backend arguments
+
+    Returns:
+        The (not yet loaded) backend
+    """
+    if name == "sentence-transformers":
+        return SentenceTransformerBackend(model, **kwargs)
+    if name in ("onnx", "onnx-fp32"):
+        return OnnxEmbeddingBackend(model, quantized=name == "onnx", **kwargs)
+    raise ValueError(f"Unknown embedding backend: {name!r}")
+
+
+def export_onnx(model_name: str,
+                output_dir: str,
+                quantize: bool = True,
+                opset: int = 17,
+                model: Optional[Any] = None) -> Dict[str, str]:
+    """
+    Export a sentence-transformers model for OnnxEmbeddingBackend.
+
+    Writes the transformer as ONNX (and, if requested, an int8 dynamically
+    quantized copy), its tokenizer and the pooling settings. Only models using
+    mean pooling, like all-MiniLM-L6-v2, are supported.
+
+    Args:
+        model_name: HuggingFace model ID of the sentence-transformers model
+        output_dir: Directory to write the exported files to
+        quantize: Also write the int8-quantized model
+        opset: ONNX opset version
+        model: Already-loaded SentenceTransformer, used instead of downloading model_name
+
+    Returns:
+        Paths of the written files
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if model is None:
+        model = SentenceTransformer(model_name)
+
+    transformer = model[0]
+    pooling = next((module for module in model if type(module).__name__ == "Pooling"), None)
+    if pooling is not None:
+        # sentence-transformers >= 6 stores a single mode name, older versions one flag per mode
+        pooling_config = pooling.get_config_dict()
+        modes = ([pooling_config["pooling_mode"]] if "pooling_mode" in pooling_config else
+                 [key for key, value in pooling_config.items() if key.startswith("pooling_mode_") and value is True])
+        if modes not in (["mean"], ["pooling_mode_mean_tokens"]):
+            raise ValueError(f"Only mean pooling is supported, model uses {modes}")
+    normalize = any(type(module).__name__ == "Normalize" for module in model)
+    tokenizer = transformer.tokenizer
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids")
+                   if name in tokenizer.model_input_names]
+
+    class HiddenStates(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {"model": os.path.join(output_dir, ONNX_MODEL_FILE)}
+    sample = tokenizer(["An example sentence", "Another one"], padding=True, return_tensors="pt")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    wrapper = HiddenStates(transformer.auto_model.eval())
+    sample_inputs = tuple(sample[name] for name in input_names)
+    with torch.no_grad():
+        dimension = wrapper(*sample_inputs).shape[-1]
+        torch.onnx.export(wrapper,
+                          sample_inputs,
+                          paths["model"],
+                          input_names=input_names,
+                          output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic_axes,
+                          opset_version=opset,
+                          dynamo=False)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        paths["quantized_model"] = os.path.join(output_dir, ONNX_QUANTIZED_MODEL_FILE)
+        quantize_dynamic(paths["model"], paths["quantized_model"], weight_type=QuantType.QInt8)
+
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILE))
+    paths["tokenizer"] = os.path.join(output_dir, TOKENIZER_FILE)
+
+    config = {
+        "source_model": model_name,
+        "dimension": int(dimension),
+        "max_length": model.max_seq_length,
+        "normalize": normalize,
+        "pad_token": tokenizer.pad_token,
+        "pad_id": tokenizer.pad_token_id,
+    }
+    paths["config"] = os.path.join(output_dir, ONNX_CONFIG_FILE)
+    with open(paths["config"], "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return paths
+
+
+def compare_backends(reference: EmbeddingBackend,
+                     candidate: EmbeddingBackend,
+                     texts: Sequence[str]) -> Dict[str, float]:
+    """
+    Measure how closely a candidate backend reproduces the reference embeddings.
+
+    Args:
+        reference: Backend producing the expected embeddings
+        candidate: Backend under test
+        texts: Texts to embed with both
+
+    Returns:
+        Dictionary with max_abs_diff, min_cosine and mean_cosine
+    """
+    expected = reference.encode(texts)
+    actual = candidate.encode(texts)
+    cosines = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1))
+    return {
+        "max_abs_diff": float(np.abs(expected - actual).max()),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and check ONNX embedding models")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export a sentence-transformers model to ONNX")
+    export_parser.add_argument("model", help="HuggingFace model ID, e.g. all-MiniLM-L6-v2")
+    export_parser.add_argument("output_dir", help="Directory to write the ONNX files to")
+    export_parser.add_argument("--no-quantize", action="store_true", help="Skip the int8-quantized model")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare ONNX embeddings with the original model")
+    compare_parser.add_argument("model_dir", help="Directory written by export")
+    compare_parser.add_argument("--fp32", action="store_true", help="Check the float32 model instead of int8")
+    compare_parser.add_argument("--school-csv", default="BPS.csv", help="Schools whose descriptions are embedded")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        for name, path in export_onnx(args.model, args.output_dir, quantize=not args.no_quantize).items():
+            print(f"{name}: {path}")
+    else:
+        from src.rag_engine import RAGEngine
+        engine = RAGEngine(retrieval_mode="lexical")
+        texts = [doc.content for doc in engine.process_school_data(args.school_csv)]
+        candidate = OnnxEmbeddingBackend(args.model_dir, quantized=not args.fp32)
+        reference = SentenceTransformerBackend(candidate.config["source_model"])
+        print(json.dumps(compare_backends(reference, candidate, texts), indent=2))
+
+
+if __name__ == "__main__":
+    main()
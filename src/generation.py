@@ -0,0 +1,707 @@
+"""
+Text generation backends for the chatbot.
+
+Both backends expose huggingface_hub's `text_generation(prompt, stream=False,
+**params)` in a blocking and an async client, so they are interchangeable with
+each other and with the benchmark's fake clients:
+- "remote" sends every prompt to the HuggingFace Inference API.
+- "local" runs the model in-process on CPU with transformers (LocalGenerator).
+
+LocalGenerator runs the static prompt prefix (system message, age cutoffs,
+transportation rules and examples; see PromptTemplate) through the model once
+and starts every request from its key/value cache, so per request only the
+retrieved schools, the conversation and the question are processed. Requests
+arriving within batch_wait_ms of each other start decoding together, with one
+forward pass per generated token for the whole batch, and requests arriving
+while a batch is decoding join it between two tokens instead of waiting for
+it to finish.
+
+Example usage:
+    client, async_client = create_generation_clients("local", "TinyLlama/TinyLlama-1.1B-Chat-v1.0",
+                                                     prefix=lambda: template.static_prefix)
+    answer = client.text_generation(prompt, max_new_tokens=256)
+"""
+
+import asyncio
+import copy
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from src.startup import LazyModule, timed_phase
+
+torch = LazyModule("torch")
+
+logger = logging.getLogger(__name__)
+
+# Attention implementation LocalGenerator switches the "sdpa" models it loads to,
+# see LocalGenerator._use_gqa_attention
+GQA_ATTENTION = "sdpa_gqa"
+
+# Guards the registration of GQA_ATTENTION with transformers
+_register_lock = threading.Lock()
+
+
+class SamplingParams(NamedTuple):
+    """
+    Generation parameters accepted by text_generation, with the Inference
+    API's defaults.
+    """
+    max_new_tokens: int = 20
+    do_sample: bool = False
+    temperature: Optional[float] = None
+    top_k: Optional[int] = None
+    top_p: Optional[float] = None
+    repetition_penalty: Optional[float] = None
+    seed: Optional[int] = None
+
+
+class GenerationRequest:
+    """
+    One prompt queued for or being decoded by a LocalGenerator.
+
+    `done` resolves with the generated text; cancelling it stops decoding of
+    this request at the next token.
+    """
+
+    def __init__(self, prompt: str, params: SamplingParams, emit: Optional[Callable[[Any], None]] = None):
+        """
+        Args:
+            prompt: The full prompt
+            params: Sampling parameters
+            emit: Called from the decoding thread with each new piece of text,
+                then with None when done, or with the exception if decoding failed
+        """
+        self.prompt = prompt
+        self.params = params
+        self.emit = emit
+        self.done: Future = Future()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.done.cancelled()
+
+    def cancel(self) -> None:
+        self.done.cancel()
+
+    def _piece(self, text: str) -> None:
+        if self.emit is not None and text and not self.cancelled:
+            self.emit(text)
+
+    def _finish(self, text: str) -> None:
+        try:
+            self.done.set_result(text)
+        except InvalidStateError:
+            return
+        if self.emit is not None:
+            self.emit(None)
+
+    def _fail(self, error: BaseException) -> None:
+        try:
+            self.done.set_exception(error)
+        except InvalidStateError:
+            return
+        if self.emit is not None:
+            self.emit(error)
+
+
+class _Rows:
+    """
+    Requests being decoded together; row i of every tensor belongs to requests[i].
+
+    The key/value cache and attention_mask cover the same positions. Rows are
+    left-padded to a common length, and the padding is masked out.
+    """
+
+    def __init__(self, requests: List[GenerationRequest], limits: List[int], cache: Any, attention_mask: Any,
+                 positions: Any, logits: Any, seen: Any):
+        self.requests = requests
+        # Most tokens each row may generate
+        self.limits = limits
+        self.cache = cache
+        self.attention_mask = attention_mask
+        # Position id of each row's last token
+        self.positions = positions
+        # Logits of each row's next token
+        self.logits = logits
+        # Tokens of each row's prompt and output, for the repetition penalty
+        self.seen = seen
+        self.generators = [None if request.params.seed is None else torch.Generator().manual_seed(request.params.seed)
+                           for request in requests]
+        self.generated: List[List[int]] = [[] for _ in requests]
+        self.sent = [""] * len(requests)
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+    @property
+    def can_extend(self) -> bool:
+        """
+        Whether other rows can join: only plain key/value caches can be
+        padded and concatenated (not e.g. sliding-window ones).
+        """
+        from transformers.cache_utils import DynamicLayer
+
+        return all(type(layer) is DynamicLayer for layer in self.cache.layers)
+
+    def select(self, keep: List[int]) -> None:
+        """
+        Keep only the given rows, then drop leading positions that are
+        padding in every remaining row.
+        """
+        index = torch.tensor(keep)
+        self.cache.batch_select_indices(index)
+        self.attention_mask = self.attention_mask[index]
+        self.positions = self.positions[index]
+        self.logits = self.logits[index]
+        self.seen = self.seen[index]
+        for name in ("requests", "limits", "generators", "generated", "sent"):
+            values = getattr(self, name)
+            setattr(self, name, [values[row] for row in keep])
+
+        start = int(self.attention_mask.any(0).int().argmax())
+        if start and self.can_extend:
+            self.attention_mask = self.attention_mask[:, start:]
+            for layer in self.cache.layers:
+                layer.keys = layer.keys[:, :, start:]
+                layer.values = layer.values[:, :, start:]
+
+    def extend(self, other: "_Rows") -> None:
+        """
+        Append the rows of other, left-padding the shorter of the two caches.
+        """
+        length = max(self.attention_mask.shape[1], other.attention_mask.shape[1])
+        for mine, theirs in zip(self.cache.layers, other.cache.layers):
+            mine.keys = torch.cat([_left_pad(mine.keys, length, 2), _left_pad(theirs.keys, length, 2)])
+            mine.values = torch.cat([_left_pad(mine.values, length, 2), _left_pad(theirs.values, length, 2)])
+        self.attention_mask = torch.cat([_left_pad(self.attention_mask, length, 1),
+                                         _left_pad(other.attention_mask, length, 1)])
+        self.positions = torch.cat([self.positions, other.positions])
+        self.logits = torch.cat([self.logits, other.logits])
+        self.seen = torch.cat([self.seen, other.seen])
+        for name in ("requests", "limits", "generators", "generated", "sent"):
+            getattr(self, name).extend(getattr(other, name))
+
+
+def _left_pad(tensor: Any, length: int, dim: int) -> Any:
+    """
+    Pad dimension dim of tensor with zeros at the front up to length.
+    """
+    padding = [0, 0] * (tensor.dim() - dim - 1) + [length - tensor.shape[dim], 0]
+    return torch.nn.functional.pad(tensor, padding)
+
+
+class LocalGenerator:
+    """
+    Causal language model running in-process on CPU, with the key/value cache
+    of the static prompt prefix reused across requests and concurrent
+    requests decoded in one batch.
+
+    A background thread decodes the queued requests. Those queued within
+    batch_wait_ms of the first start together; later ones join the running
+    batch before its next token while it has fewer than max_batch_size rows,
+    so a request arriving mid-batch only waits for one forward pass.
+
+    Prompts that start with the current prefix are tokenized as the prefix's
+    tokens followed by the rest, so a token can differ from tokenizing the
+    whole prompt at the seam (see PromptTemplate.fit_documents). Other
+    prompts are run in full.
+    """
+
+    def __init__(self,
+                 model_id: str,
+                 prefix: Optional[Callable[[], str]] = None,
+                 max_batch_size: int = 8,
+                 batch_wait_ms: float = 20.0,
+                 model: Optional[Any] = None,
+                 tokenizer: Optional[Any] = None,
+                 token: Optional[str] = None):
+        """
+        Args:
+            model_id: HuggingFace model ID or local path
+            prefix: Function returning the current static prompt prefix, e.g.
+                PromptTemplate.static_prefix; its cache is rebuilt when it changes
+            max_batch_size: Most requests decoded together
+            batch_wait_ms: How long the first request of a batch waits for others
+            model: Already-loaded causal LM, used with tokenizer instead of model_id
+                and as it is (only models loaded from model_id get _sdpa_gqa_attention)
+            tokenizer: Tokenizer of model
+            token: HuggingFace token for gated or private models
+        """
+        self.model_id = model_id
+        self.prefix = prefix
+        self.model = model
+        self.tokenizer = tokenizer
+        self.token = token
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000.0
+        self._lock = threading.Lock()
+        self._prefix_lock = threading.Lock()
+        self._prefix_state: Optional[Tuple[str, List[int], Any]] = None
+        self.prefix_builds = 0
+        self.requests = 0
+        self.prefix_reuses = 0
+        self.batches = 0
+        self.joined = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._stopping = False
+        self._worker = threading.Thread(target=self._run, name="local-generator", daemon=True)
+        self._worker.start()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None and self.tokenizer is not None
+
+    def load(self) -> None:
+        """
+        Load the model now instead of on the first request.
+        """
+        if not self.is_loaded:
+            with self._lock:
+                if not self.is_loaded:
+                    with timed_phase("load_generation_model"):
+                        from transformers import AutoModelForCausalLM, AutoTokenizer
+                        self.tokenizer = AutoTokenizer.from_pretrained(self.model_id, token=self.token)
+                        self.model = AutoModelForCausalLM.from_pretrained(self.model_id, token=self.token)
+                        self.model.eval()
+                        self._use_gqa_attention()
+
+    def _use_gqa_attention(self) -> None:
+        """
+        Switch the model loaded from model_id from "sdpa" attention to
+        _sdpa_gqa_attention.
+
+        This changes global state: transformers looks attention functions up
+        by name in process-wide registries, so the first call adds
+        GQA_ATTENTION to AttentionInterface and AttentionMaskInterface for
+        the whole process. Models that don't ask for that name are unaffected.
+        """
+        if getattr(self.model.config, "_attn_implementation", None) != "sdpa":
+            return
+        from transformers import AttentionInterface, AttentionMaskInterface
+        from transformers.masking_utils import sdpa_mask
+
+        with _register_lock:
+            if GQA_ATTENTION not in AttentionInterface().valid_keys():
+                AttentionInterface.register(GQA_ATTENTION, _sdpa_gqa_attention)
+                AttentionMaskInterface.register(GQA_ATTENTION, sdpa_mask)
+        self.model.set_attn_implementation(GQA_ATTENTION)
+
+    def warm_up(self) -> None:
+        """
+        Load the model and compute the prefix cache before serving.
+        """
+        self.load()
+        with timed_phase("prefix_cache"), torch.inference_mode():
+            self._current_prefix()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Requests served, how many started from the prefix cache, how often
+        the cache was built, how many joined a batch that was already decoding
+        and the average number of requests per batch.
+        """
+        return {
+            "requests": self.requests,
+            "prefix_reuses": self.prefix_reuses,
+            "prefix_builds": self.prefix_builds,
+            "prefix_tokens": len(self._prefix_state[1]) if self._prefix_state else 0,
+            "batches": self.batches,
+            "joined": self.joined,
+            "average_batch_size": self.requests / self.batches if self.batches else 0.0,
+        }
+
+    def submit(self, prompt: str, params: Dict[str, Any], emit: Optional[Callable[[Any], None]] = None
+               ) -> GenerationRequest:
+        """
+        Queue a prompt for decoding without waiting for it.
+
+        Args:
+            prompt: The full prompt
+            params: Sampling parameters, see SamplingParams
+            emit: Receives the text as it is generated, see GenerationRequest
+
+        Returns:
+            The queued request
+        """
+        if self._closed:
+            raise RuntimeError("LocalGenerator is closed")
+        request = GenerationRequest(prompt, SamplingParams(**params), emit)
+        self._queue.put(request)
+        return request
+
+    def text_generation(self, prompt: str, stream: bool = False, **params: Any):
+        """
+        Generate a continuation of prompt, like InferenceClient.text_generation.
+
+        Args:
+            prompt: The full prompt
+            stream: Return an iterator over pieces of text instead of the whole text
+            **params: Sampling parameters, see SamplingParams
+
+        Returns:
+            The generated text, or an iterator over it if stream is set
+        """
+        if not stream:
+            return self.submit(prompt, params).done.result()
+        pieces: "queue.Queue" = queue.Queue()
+        return self._stream(self.submit(prompt, params, pieces.put), pieces)
+
+    @staticmethod
+    def _stream(request: GenerationRequest, pieces: "queue.Queue") -> Iterator[str]:
+        try:
+            while True:
+                piece = pieces.get()
+                if piece is None:
+                    return
+                if isinstance(piece, BaseException):
+                    raise piece
+                yield piece
+        finally:
+            request.cancel()
+
+    def close(self) -> None:
+        """
+        Stop the decoding thread after the queued requests are done.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._worker.join()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            first = self._queue.get()
+            if first is None:
+                return
+            requests = [first]
+            deadline = time.monotonic() + self.batch_wait
+            while len(requests) < self.max_batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._stopping = True
+                else:
+                    requests.append(request)
+            self._decode_batch(requests)
+
+    def _take(self, room: int) -> List[GenerationRequest]:
+        """
+        Up to room requests that are already queued, without waiting.
+        """
+        requests = []
+        while len(requests) < room and not self._stopping:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._stopping = True
+            else:
+                requests.append(request)
+        return requests
+
+    def _current_prefix(self) -> Optional[Tuple[str, List[int], Any]]:
+        text = self.prefix() if self.prefix is not None else None
+        if not text:
+            return None
+        with self._prefix_lock:
+            if self._prefix_state is None or self._prefix_state[0] != text:
+                ids = self.tokenizer(text)["input_ids"]
+                output = self.model(input_ids=torch.tensor([ids]), use_cache=True, logits_to_keep=1)
+                self._prefix_state = (text, ids, output.past_key_values)
+                self.prefix_builds += 1
+                logger.info("Cached %d prompt prefix tokens", len(ids))
+            return self._prefix_state
+
+    def _decode_batch(self, requests: List[GenerationRequest]) -> None:
+        """
+        Decode requests until all are done, letting queued requests join
+        between tokens while there is room.
+        """
+        admitted = list(requests)
+        try:
+            self.load()
+            with torch.inference_mode():
+                stop_ids = self._stop_ids()
+                pending = self._prefill(requests)
+                self.batches += 1 if pending else 0
+                rows = None
+                while pending or rows is not None:
+                    # Groups that can't be merged (see _Rows.can_extend) are decoded one after another
+                    while pending and (rows is None or rows.can_extend):
+                        group = pending.pop(0)
+                        if rows is None:
+                            rows = group
+                        else:
+                            rows.extend(group)
+                    rows = self._step(rows, stop_ids)
+                    if rows is not None and not pending and rows.can_extend and len(rows) < self.max_batch_size:
+                        joining = self._take(self.max_batch_size - len(rows))
+                        admitted.extend(joining)
+                        pending = self._prefill(joining)
+                        self.joined += sum(len(group) for group in pending)
+        except Exception as e:
+            logger.exception("Local generation failed")
+            for request in admitted:
+                request._fail(e)
+
+    def _stop_ids(self) -> set:
+        stop = set()
+        for eos in (getattr(self.model.generation_config, "eos_token_id", None), self.tokenizer.eos_token_id):
+            if isinstance(eos, int):
+                stop.add(eos)
+            elif eos is not None:
+                stop.update(eos)
+        return stop
+
+    def _prefill(self, requests: List[GenerationRequest]) -> List[_Rows]:
+        """
+        Run the prompts of requests through the model: those starting with
+        the current prefix from its cache, the others in full.
+        """
+        prefix = self._current_prefix()
+        with_prefix, without_prefix = [], []
+        live = [request for request in requests if not request.cancelled]
+        self.requests += len(live)
+        for request in live:
+            if prefix is not None and request.prompt.startswith(prefix[0]):
+                suffix = self.tokenizer(request.prompt[len(prefix[0]):], add_special_tokens=False)
+                with_prefix.append((request, suffix["input_ids"]))
+            else:
+                without_prefix.append((request, self.tokenizer(request.prompt)["input_ids"]))
+        groups = []
+        if with_prefix:
+            self.prefix_reuses += len(with_prefix)
+            groups.append(self._prefill_group(with_prefix, prefix[1], prefix[2]))
+        if without_prefix:
+            groups.append(self._prefill_group(without_prefix, [], None))
+        return [group for group in groups if group is not None]
+
+    def _prefill_group(self, rows: Sequence[Tuple[GenerationRequest, List[int]]], prefix_ids: List[int],
+                       prefix_cache: Any) -> Optional[_Rows]:
+        """
+        Run prompts through the model together from an optional shared prefix cache.
+
+        Each row is left-padded between the prefix and its own tokens; padding
+        is masked out and positions skip it, so every row is decoded as if it
+        were alone.
+        """
+        max_positions = getattr(self.model.config, "max_position_embeddings", None)
+        limits = []
+        kept = []
+        for request, ids in rows:
+            limit = request.params.max_new_tokens
+            if max_positions is not None:
+                limit = min(limit, max_positions - len(prefix_ids) - len(ids))
+            if limit <= 0 or not ids:
+                request._fail(ValueError(f"Prompt of {len(prefix_ids) + len(ids)} tokens leaves no room to generate "
+                                         f"within the model's {max_positions} positions"))
+                continue
+            kept.append((request, ids))
+            limits.append(limit)
+        if not kept:
+            return None
+        batch = len(kept)
+        width = max(len(ids) for _, ids in kept)
+        pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else 0
+
+        input_ids = torch.full((batch, width), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((batch, len(prefix_ids) + width), dtype=torch.long)
+        attention_mask[:, :len(prefix_ids)] = 1
+        for row, (_, ids) in enumerate(kept):
+            input_ids[row, width - len(ids):] = torch.tensor(ids)
+            attention_mask[row, attention_mask.shape[1] - len(ids):] = 1
+        positions = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, len(prefix_ids):]
+
+        cache = None
+        if prefix_cache is not None:
+            cache = copy.deepcopy(prefix_cache)
+            if batch > 1:
+                cache.batch_repeat_interleave(batch)
+
+        output = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=positions,
+                            past_key_values=cache, use_cache=True, logits_to_keep=1)
+        logits = output.logits[:, -1, :].float()
+        seen = torch.zeros((batch, logits.shape[-1]), dtype=torch.bool)
+        for row, (_, ids) in enumerate(kept):
+            seen[row, torch.tensor(prefix_ids + ids)] = True
+        return _Rows([request for request, _ in kept], limits, output.past_key_values, attention_mask,
+                     positions[:, -1], logits, seen)
+
+    def _step(self, rows: _Rows, stop_ids: set) -> Optional[_Rows]:
+        """
+        Pick each row's next token and stream it, drop the rows that are done
+        and run the others' tokens through the model.
+
+        Returns:
+            The rows still decoding, or None if all are done
+        """
+        next_tokens = []
+        keep = []
+        for row, request in enumerate(rows.requests):
+            token = _next_token(rows.logits[row], rows.seen[row], request.params, rows.generators[row])
+            generated = rows.generated[row]
+            finished = token in stop_ids or request.cancelled
+            if token not in stop_ids:
+                generated.append(token)
+                rows.seen[row, token] = True
+                text = self.tokenizer.decode(generated, skip_special_tokens=True)
+                # Hold back a partial multi-byte character until it is complete
+                if text.startswith(rows.sent[row]) and not text.endswith("\ufffd"):
+                    request._piece(text[len(rows.sent[row]):])
+                    rows.sent[row] = text
+            if finished or len(generated) >= rows.limits[row]:
+                text = self.tokenizer.decode(generated, skip_special_tokens=True)
+                if text.startswith(rows.sent[row]):
+                    request._piece(text[len(rows.sent[row]):])
+                request._finish(text)
+            else:
+                keep.append(row)
+                next_tokens.append(token)
+        if not keep:
+            return None
+        if len(keep) < len(rows):
+            rows.select(keep)
+
+        rows.attention_mask = torch.cat([rows.attention_mask, rows.attention_mask.new_ones((len(rows), 1))], dim=1)
+        rows.positions = rows.positions + 1
+        output = self.model(input_ids=torch.tensor(next_tokens)[:, None], attention_mask=rows.attention_mask,
+                            position_ids=rows.positions[:, None], past_key_values=rows.cache, use_cache=True)
+        rows.logits = output.logits[:, -1, :].float()
+        rows.cache = output.past_key_values
+        return rows
+
+
+def _sdpa_gqa_attention(module: Any, query: Any, key: Any, value: Any, attention_mask: Any, **kwargs: Any):
+    """
+    transformers' "sdpa" attention, except that grouped-query attention with
+    a mask keeps the key/value heads shared instead of copying them per query
+    head. A batch of padded rows always has a mask, and on CPU the copy of the
+    whole cache at every step would otherwise cost more than batching saves.
+    """
+    from transformers.integrations.sdpa_attention import sdpa_attention_forward
+
+    if (attention_mask is None or getattr(module, "num_key_value_groups", 1) == 1
+            or kwargs.get("position_bias") is not None or kwargs.get("cache") is not None):
+        return sdpa_attention_forward(module, query, key, value, attention_mask, **kwargs)
+    output = torch.nn.functional.scaled_dot_product_attention(
+        query, key, value, attn_mask=attention_mask, dropout_p=kwargs.get("dropout", 0.0),
+        scale=kwargs.get("scaling"), enable_gqa=True)
+    return output.transpose(1, 2).contiguous(), None
+
+
+def _next_token(logits: Any, seen: Any, params: SamplingParams, generator: Optional[Any]) -> int:
+    """
+    Pick the next token of one row, applying the repetition penalty,
+    temperature, top-k and top-p in the same order as transformers' generate.
+    """
+    if params.repetition_penalty is not None and params.repetition_penalty != 1.0:
+        penalized = torch.where(logits > 0, logits / params.repetition_penalty, logits * params.repetition_penalty)
+        logits = torch.where(seen, penalized, logits)
+    if not params.do_sample:
+        return int(torch.argmax(logits))
+    if params.temperature:
+        logits = logits / params.temperature
+    if params.top_k:
+        kth = torch.topk(logits, min(params.top_k, logits.shape[-1])).values[-1]
+        logits = logits.masked_fill(logits < kth, float("-inf"))
+    if params.top_p is not None and params.top_p < 1.0:
+        sorted_logits, order = torch.sort(logits, descending=True)
+        probs = torch.softmax(sorted_logits, dim=-1)
+        # Drop tokens once the more likely ones already cover top_p; the most likely is always kept
+        drop = probs.cumsum(-1) - probs > params.top_p
+        logits = logits.masked_fill(torch.zeros_like(drop).scatter(0, order, drop), float("-inf"))
+    probs = torch.softmax(logits, dim=-1)
+    return int(torch.multinomial(probs, 1, generator=generator))
+
+
+class AsyncLocalClient:
+    """
+    Async interface to a LocalGenerator, like AsyncInferenceClient.text_generation.
+    Cancelling the awaiting task (e.g. on a timeout) stops its decoding.
+    """
+
+    def __init__(self, generator: LocalGenerator):
+        self.generator = generator
+
+    async def text_generation(self, prompt: str, stream: bool = False, **params: Any):
+        """
+        Generate a continuation of prompt.
+
+        Args:
+            prompt: The full prompt
+            stream: Return an async iterator over pieces of text instead of the whole text
+            **params: Sampling parameters, see SamplingParams
+
+        Returns:
+            The generated text, or an async iterator over it if stream is set
+        """
+        if not stream:
+            return await asyncio.wrap_future(self.generator.submit(prompt, params).done)
+        loop = asyncio.get_running_loop()
+        pieces: "asyncio.Queue" = asyncio.Queue()
+
+        def emit(piece):
+            try:
+                loop.call_soon_threadsafe(pieces.put_nowait, piece)
+            except RuntimeError:
+                # The caller's event loop is gone; stop decoding for it
+                request.cancel()
+
+        request = self.generator.submit(prompt, params, emit)
+        return self._astream(request, pieces)
+
+    @staticmethod
+    async def _astream(request: GenerationRequest, pieces: "asyncio.Queue"):
+        try:
+            while True:
+                piece = await pieces.get()
+                if piece is None:
+                    return
+                if isinstance(piece, BaseException):
+                    raise piece
+                yield piece
+        finally:
+            request.cancel()
+
+
+def create_generation_clients(name: str,
+                              model_id: str,
+                              token: Optional[str] = None,
+                              prefix: Optional[Callable[[], str]] = None,
+                              max_batch_size: int = 8,
+                              batch_wait_ms: float = 20.0) -> Tuple[Any, Any]:
+    """
+    Create the blocking and async generation clients by backend name.
+
+    Args:
+        name: "remote" (HuggingFace Inference API) or "local" (transformers on CPU)
+        model_id: Model ID, or an inference endpoint URL for "remote"
+        token: HuggingFace token
+        prefix: Function returning the static prompt prefix to cache ("local" only)
+        max_batch_size: Most requests decoded together ("local" only)
+        batch_wait_ms: How long a request waits for others to batch with ("local" only)
+
+    Returns:
+        The blocking and the async client; the local model is loaded on first use
+    """
+    if name == "remote":
+        from huggingface_hub import AsyncInferenceClient, InferenceClient
+        return InferenceClient(model=model_id, token=token), AsyncInferenceClient(model=model_id, token=token)
+    if name == "local":
+        generator = LocalGenerator(model_id, prefix=prefix, max_batch_size=max_batch_size,
+                                   batch_wait_ms=batch_wait_ms, token=token)
+        return generator, AsyncLocalClient(generator)
+    raise ValueError(f"Unknown generation backend: {name!r}")
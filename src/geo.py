@@ -0,0 +1,189 @@
+"""
+Proximity search over school locations.
+
+Locations come from a bundled table of approximate Boston zip code and
+neighborhood centroids (boston_locations.csv). Schools are placed at the
+centroid of the zip code in their address, unless the table has a "school"
+row for them with geocoded coordinates, so distances between schools in
+different zip codes are accurate to within about half a mile.
+
+Example usage:
+    table = LocationTable.load()
+    locator = SchoolLocator(documents, table)
+    for position, miles in locator.nearest(table.resolve("Jamaica Plain")[1], k=5):
+        print(documents[position].school_name, round(miles, 1))
+"""
+
+import csv
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.metadata_index import BOSTON_NEIGHBORHOODS, NEIGHBORHOOD_ALIASES, canonical_neighborhood
+from src.startup import LazyModule
+
+sklearn_neighbors = LazyModule("sklearn.neighbors")
+
+DEFAULT_LOCATIONS_PATH = "boston_locations.csv"
+
+EARTH_RADIUS_MILES = 3958.8
+
+Point = Tuple[float, float]
+
+_ZIP_PATTERN = re.compile(r"\b(02\d{3})\b")
+_LAT_LON_PATTERN = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+def haversine_miles(a: Point, b: Point) -> float:
+    """
+    Great-circle distance in miles between two (latitude, longitude) points.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(h))
+
+
+class LocationTable:
+    """
+    Coordinates of Boston zip codes, neighborhoods and (optionally) schools.
+    """
+
+    def __init__(self,
+                 zips: Dict[str, Point],
+                 neighborhoods: Dict[str, Point],
+                 schools: Optional[Dict[str, Point]] = None):
+        self.zips = zips
+        self.neighborhoods = neighborhoods
+        self.schools = schools or {}
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_LOCATIONS_PATH) -> "LocationTable":
+        """
+        Read the location table: rows of kind ("zip", "neighborhood" or
+        "school"), name, latitude and longitude.
+
+        Args:
+            path: Path to the CSV file
+
+        Returns:
+            The location table
+        """
+        tables: Dict[str, Dict[str, Point]] = {"zip": {}, "neighborhood": {}, "school": {}}
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                tables[row["kind"]][row["name"]] = (float(row["latitude"]), float(row["longitude"]))
+        return cls(tables["zip"], tables["neighborhood"], tables["school"])
+
+    def resolve(self, location: Any) -> Optional[Tuple[str, Point]]:
+        """
+        Find the coordinates of a location.
+
+        Args:
+            location: A zip code, a neighborhood name or alias, text containing
+                one of them (zip codes first), "lat, lon" or a (lat, lon) pair
+
+        Returns:
+            Tuple of a display label and the (latitude, longitude), or None if unknown
+        """
+        if isinstance(location, (tuple, list)) and len(location) == 2:
+            return f"{location[0]:.4f}, {location[1]:.4f}", (float(location[0]), float(location[1]))
+        text = str(location)
+        match = _LAT_LON_PATTERN.match(text)
+        if match:
+            return text.strip(), (float(match.group(1)), float(match.group(2)))
+        for zip_code in _ZIP_PATTERN.findall(text):
+            if zip_code in self.zips:
+                return zip_code, self.zips[zip_code]
+        name = canonical_neighborhood(text)
+        if name is None:
+            lowered = text.lower()
+            for candidate in sorted(BOSTON_NEIGHBORHOODS, key=len, reverse=True):
+                if re.search(r"\b" + re.escape(candidate.lower()) + r"\b", lowered):
+                    name = candidate
+                    break
+            else:
+                name = next((alias_name for alias, alias_name in NEIGHBORHOOD_ALIASES.items()
+                             if re.search(r"\b" + alias + r"\b", lowered)), None)
+        if name in self.neighborhoods:
+            return name, self.neighborhoods[name]
+        return None
+
+    def school_point(self, school_name: str, metadata: Dict[str, Any]) -> Optional[Point]:
+        """
+        Coordinates of a school: its own row if the table has one, else the
+        centroid of its zip code, else of its neighborhood.
+        """
+        if school_name in self.schools:
+            return self.schools[school_name]
+        zip_code = metadata.get("zip_code")
+        if zip_code in self.zips:
+            return self.zips[zip_code]
+        neighborhood = canonical_neighborhood(metadata.get("neighborhood", ""))
+        return self.neighborhoods.get(neighborhood)
+
+
+class SchoolLocator:
+    """
+    Ball tree over school coordinates with the haversine metric, answering
+    k-nearest and radius queries in O(log n).
+    """
+
+    def __init__(self, documents: Sequence[Any], table: LocationTable):
+        """
+        Args:
+            documents: School documents with zip_code/neighborhood metadata
+            table: Location table placing the schools
+        """
+        self.table = table
+        positions, points = [], []
+        for position, doc in enumerate(documents):
+            point = table.school_point(doc.school_name, doc.metadata)
+            if point is not None:
+                positions.append(position)
+                points.append(point)
+        self.positions = np.asarray(positions, dtype="int64")
+        self.tree = (sklearn_neighbors.BallTree(np.radians(np.asarray(points)), metric="haversine")
+                     if points else None)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def _results(self, indices: np.ndarray, distances: np.ndarray) -> List[Tuple[int, float]]:
+        # Stable order for schools at the same distance, e.g. in the same zip code
+        pairs = [(int(self.positions[i]), float(d) * EARTH_RADIUS_MILES) for i, d in zip(indices, distances)]
+        return sorted(pairs, key=lambda pair: (round(pair[1], 6), pair[0]))
+
+    def nearest(self, point: Point, k: int) -> List[Tuple[int, float]]:
+        """
+        The k schools closest to a point.
+
+        Args:
+            point: (latitude, longitude)
+            k: Number of schools
+
+        Returns:
+            List of (document position, distance in miles), nearest first
+        """
+        if self.tree is None or k <= 0:
+            return []
+        distances, indices = self.tree.query(np.radians([point]), k=min(k, len(self)))
+        return self._results(indices[0], distances[0])
+
+    def within(self, point: Point, radius_miles: float) -> List[Tuple[int, float]]:
+        """
+        All schools within a radius of a point.
+
+        Args:
+            point: (latitude, longitude)
+            radius_miles: Search radius in miles
+
+        Returns:
+            List of (document position, distance in miles), nearest first
+        """
+        if self.tree is None:
+            return []
+        indices, distances = self.tree.query_radius(np.radians([point]), r=radius_miles / EARTH_RADIUS_MILES,
+                                                    return_distance=True, sort_results=True)
+        return self._results(indices[0], distances[0])
@@ -0,0 +1,344 @@
+"""
+Fast path for questions with deterministic answers.
+
+Some questions need no retrieval and no model: the grade for a birth date
+(or an age), whether a grade is eligible for the school bus, and which
+schools serve a grade in an area. The router answers those from the rule
+table (src.rules) and the metadata index with a templated answer, and
+returns None for everything else so it goes through RAG and the LLM.
+
+A question is only answered when it is unambiguous: exactly one birth date,
+an explicit grade, and nothing else in it that the template would ignore,
+such as a school name, a program or a question about routes.
+
+Example usage:
+    router = IntentRouter(RuleTable.load(), rag_engine)
+    answer = router.route("What grade will my daughter born March 3, 2020 be in?")
+    if answer is not None:
+        print(answer.text)
+    router.stats()["fast_path_rate"]
+"""
+
+import calendar
+import datetime
+import re
+import threading
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from src.metadata_index import NEIGHBORHOOD_ALIASES, canonical_neighborhood, parse_grade, parse_grade_range
+from src.rules import MONTHS, RuleTable, grade_label, grade_span
+
+# Schools listed in a "which schools serve ..." answer before "and N more"
+MAX_LISTED_SCHOOLS = 15
+# Oldest age the overage rule covers (students aged 18–22)
+MAX_STUDENT_AGE = 22
+
+_MONTH = r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sept?(?:ember)?|" \
+         r"oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+_MONTH_NUMBERS = {name[:3]: number for name, number in MONTHS.items()}
+
+# Full dates first, so a date's year isn't also read as a year on its own
+_DATE_PATTERNS = [
+    ("mdy", re.compile(_MONTH + r"\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})\b", re.I)),
+    ("dmy", re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH + r",?\s+(\d{4})\b", re.I)),
+    ("iso", re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")),
+    ("numeric", re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{4})\b")),
+    ("month", re.compile(r"\b" + _MONTH + r",?\s+(?:of\s+)?(\d{4})\b", re.I)),
+    ("year", re.compile(r"\b((?:19|20)\d{2})\b")),
+]
+
+_BIRTH_PATTERN = re.compile(r"\b(born|birthday|birth\s*date|date of birth|dob|birth year)\b", re.I)
+_AGE_PATTERN = re.compile(r"\b(\d{1,2})[\s-]*(?:years?|yrs?)[\s-]*old\b", re.I)
+_GRADE_QUESTION_PATTERN = re.compile(
+    r"\b(grades?|k[012]|kindergarten|pre-?k|level|enroll|enrol|start|eligible|old enough|placed|placement)\b",
+    re.I)
+_BUS_PATTERN = re.compile(r"\b(bus|buses|busing|bussing|transportation|mbta|t pass)\b", re.I)
+_ELIGIBILITY_PATTERN = re.compile(
+    r"\b(eligible|eligibility|qualify|qualifies|entitled|get|gets|receive|provided|provide|offered|ride|take|there)\b",
+    re.I)
+_MILES_PATTERN = re.compile(r"\b(\d+(?:\.\d+)?|\.\d+)\s*(?:miles?|mi)\b", re.I)
+_SCHOOLS_QUESTION_PATTERN = re.compile(r"\b(which|what|list|show)\b.*\bschools\b", re.I)
+
+# Words that make a question more specific than the templates can answer
+_BIRTH_BLOCKERS = re.compile(r"\b(schools|bus|transportation|program|programs|near|recommend|best|apply|lottery)\b",
+                             re.I)
+_BUS_BLOCKERS = re.compile(
+    r"\b(route|routes|stop|stops|schedule|time|times|late|pick|pickup|drop|dropoff|app|track|iep|sped|special|"
+    r"disability|disabilities|accommodations?|summer|trip|monitor|driver|charter|private|parochial|cost)\b", re.I)
+
+# Everything a "which schools serve <grade> in <area>" question may contain
+# besides the grade and the area; any other word sends it to the LLM
+_SCHOOL_LIST_WORDS = set("""
+    which what list show me all the a an any are is there do does that who schools school public bps boston
+    serve serves serving offer offers offering have has teach teaches take takes accept accepts enroll
+    for in at of with to my our child children kid kids son daughter student students can i we attend go
+    grade grades level levels located area neighborhood zip code please available
+""".split())
+# Pieces of grade names once digits are dropped ("K2" -> "k", "6th" -> "th")
+_GRADE_NAME_WORDS = set("""
+    k kindergarten pre prek first second third fourth fifth sixth seventh eighth ninth tenth eleventh twelfth
+    st nd rd th
+""".split())
+
+
+class RoutedAnswer(NamedTuple):
+    intent: str
+    text: str
+    # Schools named in the answer, carried into the conversation like retrieved ones
+    schools: Tuple[str, ...] = ()
+
+
+def _format_date(day: datetime.date) -> str:
+    return f"{day:%B} {day.day}, {day.year}"
+
+
+def _format_miles(distance: float) -> str:
+    return f"{distance:g} mile{'' if distance == 1 else 's'}"
+
+
+def is_transportation_question(message: str) -> bool:
+    """
+    Whether a message asks about buses or other school transportation.
+
+    Args:
+        message: The user's message
+
+    Returns:
+        True if it mentions buses, transportation or the MBTA
+    """
+    return _BUS_PATTERN.search(message) is not None
+
+
+def parse_birth_period(text: str) -> Optional[Tuple[datetime.date, datetime.date, str]]:
+    """
+    Find the one date, month or year in a text.
+
+    Args:
+        text: The user's message
+
+    Returns:
+        (earliest, latest, description) of the birth period, or None if the
+        text mentions no date, more than one, or an invalid one
+    """
+    found = []
+    remaining = text
+    for kind, pattern in _DATE_PATTERNS:
+        for match in pattern.finditer(remaining):
+            found.append((kind, match.groups()))
+        remaining = pattern.sub(" ", remaining)
+    if len(found) != 1:
+        return None
+
+    kind, groups = found[0]
+    try:
+        if kind == "year":
+            year = int(groups[0])
+            return datetime.date(year, 1, 1), datetime.date(year, 12, 31), f"in {year}"
+        if kind == "month":
+            year, month = int(groups[1]), _MONTH_NUMBERS[groups[0][:3].lower()]
+            first = datetime.date(year, month, 1)
+            return first, first.replace(day=calendar.monthrange(year, month)[1]), f"in {first:%B} {year}"
+        if kind == "mdy":
+            day = datetime.date(int(groups[2]), _MONTH_NUMBERS[groups[0][:3].lower()], int(groups[1]))
+        elif kind == "dmy":
+            day = datetime.date(int(groups[2]), _MONTH_NUMBERS[groups[1][:3].lower()], int(groups[0]))
+        elif kind == "iso":
+            day = datetime.date(int(groups[0]), int(groups[1]), int(groups[2]))
+        else:
+            day = datetime.date(int(groups[2]), int(groups[0]), int(groups[1]))
+    except ValueError:
+        return None
+    return day, day, f"on {_format_date(day)}"
+
+
+class IntentRouter:
+    """
+    Answers deterministic eligibility questions without the LLM and counts
+    how many questions it answered.
+    """
+
+    def __init__(self, rules: RuleTable, rag_engine):
+        """
+        Args:
+            rules: Age cutoffs and transportation rules
+            rag_engine: RAGEngine whose documents and metadata index list the schools
+        """
+        self.rules = rules
+        self.rag_engine = rag_engine
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.by_intent: Dict[str, int] = {}
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Snapshot of the router counters.
+
+        Returns:
+            Dictionary with routed (questions seen), fast_path (answered here),
+            fast_path_rate and the answered count per intent
+        """
+        with self._lock:
+            fast_path = sum(self.by_intent.values())
+            return {
+                "routed": self.routed,
+                "fast_path": fast_path,
+                "fast_path_rate": fast_path / self.routed if self.routed else 0.0,
+                "by_intent": dict(self.by_intent),
+            }
+
+    def route(self, message: str) -> Optional[RoutedAnswer]:
+        """
+        Answer a question from the rules if it can be answered with confidence.
+
+        Args:
+            message: The user's question
+
+        Returns:
+            The templated answer, or None to send the question to RAG and the LLM
+        """
+        answer = None
+        if self.rag_engine.find_school_names(message):
+            # Questions about a particular school need its details
+            pass
+        elif _BIRTH_PATTERN.search(message) or _AGE_PATTERN.search(message):
+            answer = self._grade_for_birth(message)
+        elif _BUS_PATTERN.search(message):
+            answer = self._bus_eligibility(message)
+        elif _SCHOOLS_QUESTION_PATTERN.search(message):
+            answer = self._schools_for_grade(message)
+
+        with self._lock:
+            self.routed += 1
+            if answer is not None:
+                self.by_intent[answer.intent] = self.by_intent.get(answer.intent, 0) + 1
+        return answer
+
+    def _placement(self, age: int) -> Optional[str]:
+        """
+        What happens to a child of this age on the cutoff date, as a verb phrase.
+        """
+        level = self.rules.grade_for_age(age)
+        if level is not None:
+            return f"enters {grade_label(level)}"
+        if 0 <= age < self.rules.min_age:
+            return f"is too young to enroll (K0 needs age {self.rules.min_age})"
+        if self.rules.max_age < age <= MAX_STUDENT_AGE and self.rules.overage_note:
+            note = self.rules.overage_note.rstrip(".")
+            return f"is past the grade table, so {note[0].lower() + note[1:]}"
+        return None
+
+    def _grade_for_birth(self, message: str) -> Optional[RoutedAnswer]:
+        if not _GRADE_QUESTION_PATTERN.search(message) or _BIRTH_BLOCKERS.search(message):
+            return None
+        cutoff, year = _format_date(self.rules.cutoff_date), self.rules.school_year
+
+        if not _BIRTH_PATTERN.search(message):
+            ages = {int(age) for age in _AGE_PATTERN.findall(message)}
+            if len(ages) != 1:
+                return None
+            age = ages.pop()
+            placement = self._placement(age)
+            if placement is None:
+                return None
+            return RoutedAnswer("grade_for_age",
+                                f"For the {year} school year, a child who is {age} on {cutoff} {placement}.")
+
+        period = parse_birth_period(message)
+        if period is None:
+            return None
+        earliest, latest, description = period
+        early_age, late_age = self.rules.age_on_cutoff(earliest), self.rules.age_on_cutoff(latest)
+        early, late = self._placement(early_age), self._placement(late_age)
+        if early is None or late is None:
+            return None
+
+        if early_age == late_age:
+            text = f"For the {year} school year, a child born {description} is {early_age} on {cutoff} and {early}."
+        elif early == late:
+            text = f"For the {year} school year, a child born {description} {early}."
+        else:
+            boundary = earliest.replace(month=self.rules.cutoff_date.month, day=self.rules.cutoff_date.day)
+            text = (f"For the {year} school year, a child born {description} {early} if born on or before "
+                    f"{_format_date(boundary)}, and {late} if born after. "
+                    f"BPS places students by their age on {cutoff}.")
+        return RoutedAnswer("grade_for_birth_date", text)
+
+    def _bus_eligibility(self, message: str) -> Optional[RoutedAnswer]:
+        if not _ELIGIBILITY_PATTERN.search(message) or _BUS_BLOCKERS.search(message):
+            return None
+        level = parse_grade(message)
+        rule = self.rules.transportation_for_grade(level) if level is not None else None
+        if rule is None:
+            return None
+        miles = {float(value) for value in _MILES_PATTERN.findall(message)}
+        if len(miles) > 1:
+            return None
+        filters = self.rag_engine.metadata_index.extract_filters(message) if self.rag_engine.metadata_index else {}
+        if not miles and ("zip_code" in filters or "neighborhood" in filters):
+            # The distance depends on the school; RAG adds it to the context
+            return None
+
+        label = grade_label(level)
+        scope = grade_span(rule.low, rule.high)
+        if rule.min_miles is None:
+            text = f"Students in {label} don't ride school buses: BPS provides an MBTA pass for {scope}."
+        else:
+            threshold = _format_miles(rule.min_miles)
+            text = f"Students in {label} are eligible for a school bus if they live more than {threshold} from school"
+            if not miles:
+                text += f" (the rule for {scope})."
+            else:
+                distance = miles.pop()
+                if distance > rule.min_miles:
+                    text = f"Yes. {text}, and {_format_miles(distance)} is farther than that."
+                else:
+                    text = (f"No. {text}, and {_format_miles(distance)} is within that distance, "
+                            f"so they walk or get to school another way.")
+        return RoutedAnswer("bus_eligibility", text)
+
+    def _schools_for_grade(self, message: str) -> Optional[RoutedAnswer]:
+        index = self.rag_engine.metadata_index
+        level = parse_grade(message)
+        if index is None or level is None:
+            return None
+        filters = index.extract_filters(message)
+        if set(filters) - {"grade", "neighborhood", "zip_code"}:
+            return None
+
+        # Anything left once the grade and area are taken out must be filler
+        remaining = message.lower()
+        for name in filters.get("neighborhood", []):
+            aliases = [alias for alias, canonical in NEIGHBORHOOD_ALIASES.items() if canonical == name]
+            for text in [name.lower()] + aliases:
+                remaining = re.sub(r"\b" + re.escape(text) + r"\b", " ", remaining)
+        words = re.findall(r"[a-z]+", remaining)
+        if any(word not in _SCHOOL_LIST_WORDS and word not in _GRADE_NAME_WORDS for word in words):
+            return None
+
+        # Schools with several campuses have a document per campus; list each school once
+        docs = {}
+        for position in index.select(**filters) or []:
+            docs.setdefault(self.rag_engine.documents[position].school_name, self.rag_engine.documents[position])
+        docs = [docs[name] for name in sorted(docs)]
+        areas = filters.get("neighborhood", []) + filters.get("zip_code", [])
+        where = f" in {' or '.join(areas)}" if areas else ""
+        label = grade_label(level)
+        if not docs:
+            return RoutedAnswer("schools_for_grade", f"I couldn't find any BPS schools serving {label}{where}.")
+
+        lines = [f"{len(docs)} BPS school{'' if len(docs) == 1 else 's'} serve{'s' if len(docs) == 1 else ''} "
+                 f"{label}{where}:"]
+        for doc in docs[:MAX_LISTED_SCHOOLS]:
+            lines.append(f"- {doc.school_name} ({self._describe(doc)})")
+        if len(docs) > MAX_LISTED_SCHOOLS:
+            lines.append(f"...and {len(docs) - MAX_LISTED_SCHOOLS} more. Add a neighborhood or zip code to narrow "
+                         f"the list.")
+        shown = tuple(doc.school_name for doc in docs[:MAX_LISTED_SCHOOLS])
+        return RoutedAnswer("schools_for_grade", "\n".join(lines), shown)
+
+    @staticmethod
+    def _describe(doc) -> str:
+        grade_range = parse_grade_range(doc.metadata.get("grades"))
+        parts = [grade_span(*grade_range) if grade_range else ""]
+        parts.append(canonical_neighborhood(doc.metadata.get("neighborhood", "")) or "")
+        return ", ".join(part for part in parts if part)
@@ -0,0 +1,271 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+# Boston neighborhoods recognized in addresses and queries. Longer names are
+# matched first so that "West Roxbury" is not mistaken for "Roxbury".
+BOSTON_NEIGHBORHOODS = [
+    "Allston", "Back Bay", "Bay Village", "Beacon Hill", "Brighton", "Charlestown",
+    "Chinatown", "Dorchester", "Downtown", "East Boston", "Fenway", "Hyde Park",
+    "Jamaica Plain", "Leather District", "Longwood", "Mattapan", "Mission Hill",
+    "North End", "Roslindale", "Roxbury", "South Boston", "South End", "West End",
+    "West Roxbury",
+]
+
+NEIGHBORHOOD_ALIASES = {
+    "jp": "Jamaica Plain",
+    "eastie": "East Boston",
+    "southie": "South Boston",
+    "rozzie": "Roslindale",
+    "kenmore": "Fenway",
+}
+
+# Numeric grade levels: K0 = -2, K1 = -1, K2 = 0, then grades 1-12.
+MIN_GRADE = -2
+MAX_GRADE = 12
+
+_GRADE_WORDS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6,
+    "seventh": 7, "eighth": 8, "ninth": 9, "tenth": 10, "eleventh": 11, "twelfth": 12,
+}
+
+# Grades 1-12 written as numbers; no leading zeros, and no grade 0 (that is K2)
+_GRADE_NUMBER = r"(1[0-2]|[1-9])"
+
+_PRE_K_PATTERN = re.compile(r"\b(?:pre-?k|pre-?kindergarten)\b", re.I)
+_KINDERGARTEN_PATTERN = re.compile(r"\bkindergarten\b", re.I)
+
+_GRADE_PATTERNS = [
+    (re.compile(r"\bk([012])\b", re.I), lambda m: int(m.group(1)) - 2),
+    (_PRE_K_PATTERN, lambda m: -1),
+    (_KINDERGARTEN_PATTERN, lambda m: 0),
+    (re.compile(r"\b" + _GRADE_NUMBER + r"(?:st|nd|rd|th)?\s+grade\b", re.I), lambda m: int(m.group(1))),
+    (re.compile(r"\bgrade\s+" + _GRADE_NUMBER + r"\b", re.I), lambda m: int(m.group(1))),
+    (re.compile(r"\b(" + "|".join(_GRADE_WORDS) + r")\s+grade\b", re.I),
+     lambda m: _GRADE_WORDS[m.group(1).lower()]),
+]
+
+# Words that name several grade levels when filtering: BPS kindergarten runs
+# from K0 to K2, and pre-kindergarten covers K0 and K1
+_GRADE_SPANS = {
+    _PRE_K_PATTERN: [-2, -1],
+    _KINDERGARTEN_PATTERN: [-2, -1, 0],
+}
+
+_ZIP_PATTERN = re.compile(r"\b(02\d{3})\b")
+
+FilterValue = Union[str, int, Sequence[Union[str, int]]]
+
+
+def parse_grade_range(grades: Any) -> Optional[Tuple[int, int]]:
+    """
+    Parse a "Grades Served" value such as "0 - 6" into a numeric range.
+
+    In the BPS data a lower bound of 0 stands for the kindergarten years, so
+    ranges starting at 0 are widened to include K0 and K1.
+
+    Args:
+        grades: Value of the "Grades Served" column
+
+    Returns:
+        Inclusive (low, high) grade levels, or None if the value can't be parsed
+    """
+    if not isinstance(grades, str):
+        return None
+    match = re.match(r"\s*(\d{1,2})\s*-\s*(\d{1,2})\s*$", grades)
+    if not match:
+        return None
+    low, high = int(match.group(1)), int(match.group(2))
+    if low == 0:
+        low = MIN_GRADE
+    return low, high
+
+
+def parse_grade(value: Union[str, int]) -> Optional[int]:
+    """
+    Parse a single grade such as "K2", "kindergarten", "6th grade" or 6.
+    Numbers in text are only read as grades 1-12 written without leading
+    zeros; K0-K2 must be spelled out.
+
+    Args:
+        value: Grade name or number
+
+    Returns:
+        Numeric grade level, or None if the value can't be parsed
+    """
+    if isinstance(value, int):
+        return value if MIN_GRADE <= value <= MAX_GRADE else None
+    text = str(value).strip()
+    if re.fullmatch(_GRADE_NUMBER, text):
+        return int(text)
+    for pattern, to_level in _GRADE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return parse_grade(to_level(match))
+    return None
+
+
+def grade_filter(text: str) -> Optional[FilterValue]:
+    """
+    The grade levels a query asks about: like parse_grade, except that
+    "kindergarten" and "pre-k" stand for all the years they cover.
+
+    Args:
+        text: Free text
+
+    Returns:
+        A numeric grade level, a list of them, or None if no grade is named
+    """
+    for pattern, to_level in _GRADE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return _GRADE_SPANS.get(pattern, parse_grade(to_level(match)))
+    return None
+
+
+def canonical_neighborhood(text: str) -> Optional[str]:
+    """
+    Map free text ending in a neighborhood name (e.g. the neighborhood part of
+    an address, "Mt Vernon St West Roxbury") to the canonical neighborhood.
+
+    Args:
+        text: Text whose last words name a neighborhood
+
+    Returns:
+        Canonical neighborhood name, or None if none matches
+    """
+    if not isinstance(text, str):
+        return None
+    lowered = " ".join(text.lower().split())
+    for name in sorted(BOSTON_NEIGHBORHOODS, key=len, reverse=True):
+        if lowered == name.lower() or lowered.endswith(" " + name.lower()):
+            return name
+    return NEIGHBORHOOD_ALIASES.get(lowered)
+
+
+def _as_list(value: FilterValue) -> List[Union[str, int]]:
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+class MetadataIndex:
+    """
+    Inverted indexes over the structured fields of school documents (grade,
+    neighborhood, zip code and program), used to restrict vector search to the
+    schools that match a query's constraints.
+
+    Example usage:
+        index = MetadataIndex(documents)
+        ids = index.select(grade="K2", neighborhood="Jamaica Plain")
+    """
+
+    FIELDS = ("grade", "neighborhood", "zip_code", "program")
+
+    def __init__(self, documents: Sequence[Any]):
+        """
+        Args:
+            documents: SchoolDocument objects; positions in this list are the ids
+        """
+        self.num_documents = len(documents)
+        self.by_grade: Dict[int, Set[int]] = {}
+        self.by_neighborhood: Dict[str, Set[int]] = {}
+        self.by_zip: Dict[str, Set[int]] = {}
+        self.by_program: Dict[str, Set[int]] = {}
+        self.program_names: Dict[str, str] = {}
+
+        for doc_id, doc in enumerate(documents):
+            metadata = doc.metadata
+            grade_range = parse_grade_range(metadata.get("grades"))
+            if grade_range:
+                for level in range(grade_range[0], grade_range[1] + 1):
+                    self.by_grade.setdefault(level, set()).add(doc_id)
+
+            neighborhood = canonical_neighborhood(metadata.get("neighborhood", ""))
+            if neighborhood:
+                self.by_neighborhood.setdefault(neighborhood.lower(), set()).add(doc_id)
+
+            zip_code = metadata.get("zip_code")
+            if zip_code:
+                self.by_zip.setdefault(zip_code, set()).add(doc_id)
+
+            for program in metadata.get("programs", []):
+                self.by_program.setdefault(program.lower(), set()).add(doc_id)
+                self.program_names[program.lower()] = program
+
+    def _ids_for(self, field: str, values: Iterable[Union[str, int]]) -> Set[int]:
+        ids: Set[int] = set()
+        for value in values:
+            if field == "grade":
+                level = parse_grade(value)
+                ids |= self.by_grade.get(level, set()) if level is not None else set()
+            elif field == "neighborhood":
+                name = canonical_neighborhood(str(value))
+                ids |= self.by_neighborhood.get(name.lower(), set()) if name else set()
+            elif field == "zip_code":
+                ids |= self.by_zip.get(str(value).strip(), set())
+            elif field == "program":
+                ids |= self.by_program.get(str(value).strip().lower(), set())
+            else:
+                raise ValueError(f"Unknown filter field: {field}")
+        return ids
+
+    def select(self, **filters: Optional[FilterValue]) -> Optional[List[int]]:
+        """
+        Find the ids of documents matching all given filters. A filter value may
+        be a list, in which case documents matching any of its values pass.
+
+        Args:
+            **filters: Any of grade, neighborhood, zip_code and program
+
+        Returns:
+            Sorted matching ids, or None if no filter was given
+        """
+        selected: Optional[Set[int]] = None
+        for field, value in filters.items():
+            if value is None or value == [] or value == "":
+                continue
+            ids = self._ids_for(field, _as_list(value))
+            selected = ids if selected is None else selected & ids
+        return None if selected is None else sorted(selected)
+
+    def extract_filters(self, query: str) -> Dict[str, FilterValue]:
+        """
+        Pull grade, neighborhood, zip code and program constraints out of a
+        free-text query.
+
+        Args:
+            query: The user's query
+
+        Returns:
+            Dictionary of the filters found, suitable for select()
+        """
+        filters: Dict[str, FilterValue] = {}
+
+        zip_codes = _ZIP_PATTERN.findall(query)
+        if zip_codes:
+            filters["zip_code"] = sorted(set(zip_codes))
+
+        neighborhoods = []
+        remaining = query.lower()
+        for name in sorted(BOSTON_NEIGHBORHOODS, key=len, reverse=True):
+            pattern = re.compile(r"\b" + re.escape(name.lower()) + r"\b")
+            if pattern.search(remaining):
+                neighborhoods.append(name)
+                remaining = pattern.sub(" ", remaining)
+        for alias, name in NEIGHBORHOOD_ALIASES.items():
+            if name not in neighborhoods and re.search(r"\b" + alias + r"\b", remaining):
+                neighborhoods.append(name)
+        if neighborhoods:
+            filters["neighborhood"] = neighborhoods
+
+        grade = grade_filter(query)
+        if grade is not None:
+            filters["grade"] = grade
+
+        # Whole program names only, optionally plural, so "art" would not match "start"
+        programs = [name for key, name in self.program_names.items()
+                    if re.search(r"\b" + re.escape(key) + r"s?\b", query, re.I)]
+        if programs:
+            filters["program"] = programs
+
+        return filters
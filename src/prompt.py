@@ -0,0 +1,221 @@
+import logging
+import math
+import os
+import threading
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_MESSAGE = """You are a helpful and accurate school enrollment assistant for Boston Public Schools (BPS).
+You can provide information about school options, locations, programs, and other details
+to help families make informed decisions about their children's education.
+
+Provide clear, fact-based, and non-misleading information using the data provided below.
+Focus on answering only the user's specific question using the relevant school information.
+
+When answering questions about specific schools, neighborhoods, or programs, prioritize information
+from the RETRIEVED_SCHOOLS section, which contains the most relevant schools for the user's query.
+
+DO NOT make up or hallucinate any school information.
+
+If the retrieved schools don't match what the user is looking for, acknowledge this limitation
+and suggest they contact BPS directly at (617) 635-9010 for more information.
+"""
+
+TRANSPORTATION_SECTION = """# TRANSPORTATION_ELIGIBILITY
+- K0–K1: Bus eligible if >0.75 miles from school
+- K2–5: Bus eligible if >1 mile
+- Grades 6–8: Bus eligible if >1.5 miles
+- Grades 9–12: MBTA pass provided
+"""
+
+EXAMPLES_SECTION = """# EXAMPLES
+User: My child is turning 5 on August 15 and we live in 02124. What grade can they enter, and what schools are available?
+Assistant: Since your child turns 5 before September 1, they are eligible for K2. Based on your zip code (02124), eligible schools may include Joseph Lee K-8, Mildred Avenue, and TechBoston Academy.
+"""
+
+MISSING_AGE_CUTOFFS = "# AGE_CUTOFFS\n<Error: age cutoff file not found>"
+
+
+def approximate_tokens(text: str) -> int:
+    """
+    Rough token count (about four characters per token), used when no
+    tokenizer is at hand.
+    """
+    return math.ceil(len(text) / 4)
+
+
+def read_age_cutoffs(filepath: str = 'age_cutoffs_2025.txt') -> str:
+    """
+    Read the age cutoff section from disk.
+
+    Args:
+        filepath: Path to the age cutoff text file
+
+    Returns:
+        The file contents, or an error placeholder if the file is missing
+    """
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return MISSING_AGE_CUTOFFS
+
+
+class PromptTemplate:
+    """
+    Prompt template with a precompiled static prefix.
+
+    Everything that does not depend on the request (system message, age
+    cutoffs, transportation rules and examples) is assembled once, in a fixed
+    order, so the prefix is byte-identical across requests and server-side
+    prefix caching can reuse it. The prefix is rebuilt only when the age
+    cutoff file changes on disk.
+
+    With a token budget, retrieved schools are dropped from the end (least
+    relevant first) until the whole prompt fits. Earlier turns of a
+    conversation, already bounded by ConversationMemory, go between the
+    retrieved schools and the user's message.
+
+    Example usage:
+        template = PromptTemplate(max_prompt_tokens=1536, tokenizer_id="TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+        prompt = template.render(user_input, docs, rag_engine.format_retrieved_context)
+    """
+
+    def __init__(self,
+                 age_cutoffs_path: str = 'age_cutoffs_2025.txt',
+                 max_prompt_tokens: Optional[int] = None,
+                 tokenizer_id: Optional[str] = None,
+                 tokenizer: Optional[Any] = None):
+        """
+        Args:
+            age_cutoffs_path: Path to the age cutoff text file
+            max_prompt_tokens: Token budget for the whole prompt, or None for no limit
+            tokenizer_id: HuggingFace model ID whose tokenizer counts tokens
+            tokenizer: Already-loaded tokenizer, used instead of tokenizer_id
+        """
+        self.age_cutoffs_path = age_cutoffs_path
+        self.max_prompt_tokens = max_prompt_tokens
+        self.tokenizer_id = tokenizer_id
+        self._tokenizer = tokenizer
+        self._lock = threading.Lock()
+        # (age cutoff file signature, prefix, prefix token count or None),
+        # replaced as a whole so readers never mix two versions
+        self._prefix_state: Optional[Tuple[Optional[Tuple], str, Optional[int]]] = None
+
+    def _signature(self) -> Optional[Tuple]:
+        try:
+            stat = os.stat(self.age_cutoffs_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _current_prefix(self, count_tokens: bool = False) -> Tuple[str, Optional[int]]:
+        """
+        The static prefix and, if count_tokens is set, its token count. Both
+        are rebuilt together, under the lock, when the age cutoff file
+        changed since the prefix was last built.
+        """
+        signature = self._signature()
+        state = self._prefix_state
+        if state is None or state[0] != signature or (count_tokens and state[2] is None):
+            with self._lock:
+                state = self._prefix_state
+                if state is None or state[0] != signature:
+                    prefix = (
+                        f"<|system|>\n{SYSTEM_MESSAGE}\n"
+                        f"{read_age_cutoffs(self.age_cutoffs_path)}\n"
+                        f"{TRANSPORTATION_SECTION}\n"
+                        f"{EXAMPLES_SECTION}\n"
+                    )
+                    state = (signature, prefix, None)
+                if count_tokens and state[2] is None:
+                    state = (signature, state[1], self.count_tokens(state[1]))
+                self._prefix_state = state
+        return state[1], state[2]
+
+    @property
+    def static_prefix(self) -> str:
+        """
+        The request-independent start of every prompt, rebuilt only if the
+        age cutoff file changed since it was last built.
+        """
+        return self._current_prefix()[0]
+
+    @property
+    def tokenizer(self) -> Any:
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_id)
+        return self._tokenizer
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Number of tokens the model's tokenizer produces for text.
+
+        Args:
+            text: Text to tokenize
+
+        Returns:
+            Token count, excluding special tokens
+        """
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    @staticmethod
+    def request_suffix(user_input: str, retrieved_context: str, conversation: str = "") -> str:
+        return f"{retrieved_context}\n{conversation}<|user|>\n{user_input}\n<|assistant|>\n"
+
+    def fit_documents(self,
+                      user_input: str,
+                      docs: Sequence[Any],
+                      format_context: Callable[[List[Any]], str],
+                      conversation: str = "") -> List[Any]:
+        """
+        Keep the most relevant documents whose context fits the token budget.
+
+        Token counts of the prefix and the request part are added, which can
+        differ from tokenizing the joined prompt by a token or two at the seam.
+
+        Args:
+            user_input: The user's question
+            docs: Retrieved documents, most relevant first
+            format_context: Function turning documents into the context section
+            conversation: Rendered earlier turns, see Conversation.render
+
+        Returns:
+            The leading documents that fit
+        """
+        kept = list(docs)
+        if self.max_prompt_tokens is None:
+            return kept
+
+        _, prefix_tokens = self._current_prefix(count_tokens=True)
+        budget = self.max_prompt_tokens - prefix_tokens
+
+        while kept and self.count_tokens(self.request_suffix(user_input, format_context(kept), conversation)) > budget:
+            kept.pop()
+        if len(kept) < len(docs):
+            logger.debug("Trimmed retrieved context from %d to %d documents to fit %d tokens",
+                         len(docs), len(kept), self.max_prompt_tokens)
+        return kept
+
+    def render(self,
+               user_input: str,
+               docs: Sequence[Any],
+               format_context: Callable[[List[Any]], str],
+               conversation: str = "") -> str:
+        """
+        Assemble the full prompt: static prefix, retrieved context, earlier
+        turns, then the user turn.
+
+        Args:
+            user_input: The user's question
+            docs: Retrieved documents, most relevant first
+            format_context: Function turning documents into the context section
+            conversation: Rendered earlier turns, see Conversation.render
+
+        Returns:
+            The prompt ready for the model
+        """
+        kept = self.fit_documents(user_input, docs, format_context, conversation)
+        return self.static_prefix + self.request_suffix(user_input, format_context(kept), conversation)
@@ -1,12 +1,101 @@
-import pandas as pd
+from __future__ import annotations
+
 import numpy as np
-import faiss
 import os
-from typing import List, Dict, Tuple, Any, Optional
-from sentence_transformers import SentenceTransformer
-import pickle
+import json
+import hashlib
+import asyncio
+import contextvars
+import functools
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Any, Callable, Optional, Sequence, Union
 import re
 
+from src.batching import MicroBatcher
+from src.bm25 import BM25Index, reciprocal_rank_fusion
+from src.caching import LRUCache
+from src.embeddings import EmbeddingBackend, SentenceTransformerBackend
+from src.geo import DEFAULT_LOCATIONS_PATH, LocationTable, SchoolLocator, haversine_miles
+from src.metadata_index import MetadataIndex
+from src.prompt import approximate_tokens
+from src.startup import LazyModule, timed_phase
+from src.telemetry import span
+from src.vector_index import (build_vector_index, normalize_rows, read_vector_index, reconstruct, replace_vectors,
+                              resolve_index_spec, search, stores_exact_vectors)
+
+# Heavy dependencies are imported on first use, so a worker that only loads a
+# prebuilt index doesn't pay for them at import time
+pd = LazyModule("pandas")
+faiss = LazyModule("faiss")
+
+# Bump whenever process_school_data changes the documents it produces, so that
+# indexes cached on disk by older code are rebuilt instead of served stale.
+DOCUMENT_BUILDER_VERSION = 1
+
+# Version of the on-disk layout written by RAGEngine.build_index.
+# 4: cosine similarity (inner product over unit-length vectors) instead of L2.
+INDEX_FORMAT_VERSION = 4
+
+
+def compute_index_key(source_files: Sequence[str],
+                      model_id: str,
+                      builder_version: Optional[int] = None) -> str:
+    """
+    Compute the content-addressed cache key for an index.
+
+    The key changes whenever the bytes of any source file, the embedding model
+    or the document-building code version change.
+
+    Args:
+        source_files: Paths of the CSV files the documents are built from
+        model_id: Identifier of the embedding model
+        builder_version: Version of the document-building code. Defaults to
+            the current DOCUMENT_BUILDER_VERSION
+
+    Returns:
+        Hex digest identifying the index contents
+    """
+    if builder_version is None:
+        builder_version = DOCUMENT_BUILDER_VERSION
+    hasher = hashlib.sha256()
+    hasher.update(f"format={INDEX_FORMAT_VERSION};builder={builder_version};model={model_id}".encode("utf-8"))
+    for path in source_files:
+        file_hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                file_hasher.update(chunk)
+        hasher.update(b";source=" + file_hasher.hexdigest().encode("ascii"))
+    return hasher.hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize query text for cache lookups: case-fold, collapse whitespace and
+    drop trailing punctuation, so trivially different phrasings share an entry.
+    
+    Args:
+        query: The user's query
+        
+    Returns:
+        Normalized query text
+    """
+    return " ".join(query.casefold().split()).rstrip(" ?!.")
+
+
+def _atomic_write(path: str, write_fn) -> None:
+    """
+    Write a file through a temporary sibling and rename it into place, so that
+    readers never observe a partially written file.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
 class SchoolDocument:
     """
     Represents a document containing information about a school,
@@ -23,6 +112,169 @@ class SchoolDocument:
     def __str__(self):
         return f"{self.school_name}: {self.content}"
 
+
+@dataclass(frozen=True)
+class AdaptiveK:
+    """
+    How many retrieved schools to keep, chosen per query from their scores.
+
+    Results are kept in rank order until one scores below threshold, falls
+    more than gap below the best score kept, or would take the formatted
+    context over max_tokens. At least min_k and at most top_k are kept, and
+    each school only once; min_k may not exceed the top_k it is used with.
+    """
+    min_k: int = 1
+    # Lowest relevance score kept (see RAGEngine.retrieve_scored), or None
+    threshold: Optional[float] = 0.3
+    # Largest drop below the best score kept, or None
+    gap: Optional[float] = 0.15
+    # Token budget for the retrieved schools' context, or None
+    max_tokens: Optional[int] = None
+    # Token counter for max_tokens; approximate_tokens if None
+    count_tokens: Optional[Callable[[str], int]] = None
+
+    def __post_init__(self):
+        if self.min_k < 0:
+            raise ValueError(f"min_k must not be negative, got {self.min_k}")
+
+
+def load_school_data(school_csv: str = 'BPS.csv',
+                     programs_csv: str = 'BPS-special-programs.csv') -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Load the school and special program CSVs and merge them on school name.
+    
+    Args:
+        school_csv: Path to the school data CSV
+        programs_csv: Path to the special programs CSV
+        
+    Returns:
+        Tuple of the merged DataFrame and the list of program column names
+    """
+    schools_df = pd.read_csv(school_csv)
+    programs_df = pd.read_csv(programs_csv)
+    merged_df = pd.merge(schools_df, programs_df, on="School Name", how="left")
+    return merged_df, list(programs_df.columns[1:])
+
+
+def program_flags(merged_df: pd.DataFrame, program_columns: Sequence[str]) -> np.ndarray:
+    """
+    Boolean matrix of which programs each school offers (cells marked "Yes").
+    
+    Args:
+        merged_df: Merged school and program data
+        program_columns: Program column names, in output order
+        
+    Returns:
+        Array of shape (num_schools, num_programs)
+    """
+    return merged_df.reindex(columns=list(program_columns)).eq("Yes").to_numpy(dtype=bool)
+
+
+def build_school_documents(merged_df: pd.DataFrame, program_columns: Sequence[str]) -> List[SchoolDocument]:
+    """
+    Build one SchoolDocument per row of the merged school data.
+
+    Works column-wise: zip codes and neighborhoods are pulled out with
+    ``str.extract``, program flags come from a boolean matrix and content
+    strings are concatenated as whole columns.
+    
+    Args:
+        merged_df: Merged school and program data
+        program_columns: Program column names from the programs CSV
+        
+    Returns:
+        List of SchoolDocument objects, in row order
+    """
+    num_rows = len(merged_df)
+
+    def column(name: str, default: Any) -> pd.Series:
+        if name in merged_df.columns:
+            return merged_df[name].astype(object)
+        return pd.Series([default] * num_rows, index=merged_df.index, dtype=object)
+
+    names = column("School Name", "")
+    school_types = column("School Type", "N/A")
+    grades = column("Grades Served", "N/A")
+    addresses = column("Address", "").fillna("").astype(str)
+    has_address = addresses != ""
+
+    # Extract address components to identify the neighborhood
+    zip_codes = addresses.str.extract(r'MA\s+(\d{5})', expand=False).fillna("")
+    neighborhoods = addresses.str.extract(r'([A-Za-z\s]+),\s+MA', expand=False).str.strip().fillna("")
+
+    # Collect all programs marked "Yes"
+    flags = program_flags(merged_df, program_columns)
+    program_names = np.array(program_columns, dtype=object)
+    programs_offered = [program_names[row].tolist() for row in flags]
+
+    # Format program names to be more readable
+    readable_names = np.array([p.replace('_', ' ').title() for p in program_columns], dtype=object)
+    programs_text = pd.Series(
+        [f" Special programs include: {', '.join(readable_names[row])}." if row.any() else "" for row in flags],
+        index=merged_df.index, dtype=object)
+
+    # Create the content strings
+    contents = (names.astype(str) + " is a " + school_types.astype(str)
+                + " school serving grades " + grades.astype(str) + ".")
+    contents = contents + (" Located at " + addresses + ".").where(has_address, "")
+    contents = contents + programs_text
+
+    metadata_grades = column("Grades Served", "").tolist()
+    metadata_types = column("School Type", "").tolist()
+    phones = column("Phone Number", "").tolist()
+    emails = column("Email Address", "").tolist()
+
+    documents = []
+    for i, (name, content) in enumerate(zip(names.tolist(), contents.tolist())):
+        metadata = {
+            "grades": metadata_grades[i],
+            "type": metadata_types[i],
+            "address": addresses.iat[i],
+            "zip_code": zip_codes.iat[i],
+            "neighborhood": neighborhoods.iat[i],
+            "programs": programs_offered[i],
+            "phone": phones[i],
+            "email": emails[i]
+        }
+        documents.append(SchoolDocument(name, content, metadata))
+    return documents
+
+def document_keys(documents: Sequence[SchoolDocument]) -> List[str]:
+    """
+    Stable per-school keys used to match documents across data refreshes: the
+    normalized school name, suffixed with "#2", "#3", ... for repeated names
+    (the programs CSV lists some schools more than once).
+    
+    Args:
+        documents: Documents in row order
+        
+    Returns:
+        One key per document
+    """
+    seen: Dict[str, int] = {}
+    keys = []
+    for doc in documents:
+        name = " ".join(str(doc.school_name).casefold().split())
+        seen[name] = seen.get(name, 0) + 1
+        keys.append(name if seen[name] == 1 else f"{name}#{seen[name]}")
+    return keys
+
+
+def content_hash(doc: SchoolDocument) -> str:
+    """
+    Hash of everything a document contributes to the index, used to detect
+    schools whose data changed.
+    
+    Args:
+        doc: The school document
+        
+    Returns:
+        Hex digest of the document's name, content and metadata
+    """
+    payload = json.dumps([doc.school_name, doc.content, doc.metadata], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 class RAGEngine:
     """
     Retrieval-Augmented Generation engine for the Boston School Chatbot.
@@ -30,18 +282,70 @@ class RAGEngine:
     to provide context-relevant responses.
     """
     
-    def __init__(self, embedding_model: str = "all-MiniLM-L6-v2"):
+    RETRIEVAL_MODES = ("dense", "hybrid", "lexical")
+
+    def __init__(self, 
+                 embedding_model: Union[str, EmbeddingBackend] = "all-MiniLM-L6-v2",
+                 query_cache_size: int = 1024,
+                 query_cache_ttl: Optional[float] = None,
+                 retrieval_mode: str = "hybrid",
+                 rrf_k: int = 60,
+                 index_spec: str = "flat",
+                 locations_path: str = DEFAULT_LOCATIONS_PATH):
         """
         Initialize the RAG engine with a sentence transformer model for embeddings.
+        The model is loaded on first use or by warm_up, not here.
         
         Args:
-            embedding_model: The HuggingFace model ID to use for embeddings
+            embedding_model: The HuggingFace model ID to use for embeddings, or an
+                EmbeddingBackend (e.g. the ONNX one)
+            query_cache_size: Maximum number of query embeddings kept in the LRU cache (0 disables it)
+            query_cache_ttl: Seconds a cached query embedding stays valid, or None for no expiry
+            retrieval_mode: "dense" for FAISS only, "lexical" for BM25 only (the embedding
+                model is never loaded), or "hybrid" to fuse both with reciprocal rank fusion
+            rrf_k: Damping constant for reciprocal rank fusion in hybrid mode
+            index_spec: FAISS index type: "flat", "hnsw", "sq8", "ivfpq" or an
+                index_factory string; see src.vector_index
+            locations_path: Table of zip code and neighborhood coordinates used by
+                retrieve_nearby; see src.geo
         """
-        self.embedding_model = SentenceTransformer(embedding_model)
+        if retrieval_mode not in self.RETRIEVAL_MODES:
+            raise ValueError(f"retrieval_mode must be one of {self.RETRIEVAL_MODES}, got {retrieval_mode!r}")
+        self.retrieval_mode = retrieval_mode
+        self.rrf_k = rrf_k
+        if isinstance(embedding_model, str):
+            embedding_model = SentenceTransformerBackend(embedding_model)
+        self.embedding_model_name = embedding_model.model_id
+        self.embedding_model = None if retrieval_mode == "lexical" else embedding_model
+        self.query_cache = LRUCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+        self.batcher = None
+        # Executor for aretrieve; None uses the event loop's default thread pool
+        self.executor = None
         self.documents = []
+        self.index_spec = index_spec
+        # index_factory string the current index was built from
+        self.index_factory = None
+        # Original vectors, kept only for compressed indexes that can't reproduce them
         self.embeddings = None
         self.faiss_index = None
+        self.doc_ids = np.empty(0, dtype='int64')
+        self.doc_keys = []
+        self.doc_hashes = []
+        self._id_to_position = {}
+        self._by_name = {}
+        self._name_pattern = None
+        self.next_doc_id = 0
+        self.index_version = 0
+        self.lexical_index = None
+        self.metadata_index = None
         self.index_built = False
+        self.source_files = []
+        self.index_key = None
+        self.locations_path = locations_path
+        self._location_table = None
+        # Ball tree over school locations, built on first use for the current index_version
+        self._locator = None
+        self._locator_version = None
         
     def process_school_data(self, 
                            school_csv: str = 'BPS.csv',
@@ -56,71 +360,80 @@ class RAGEngine:
         Returns:
             List of SchoolDocument objects
         """
-        # Load both datasets
-        schools_df = pd.read_csv(school_csv)
-        programs_df = pd.read_csv(programs_csv)
-        
-        # Merge on School Name
-        merged_df = pd.merge(schools_df, programs_df, on="School Name", how="left")
-        
-        # Create documents for each school
-        documents = []
-        
-        for _, row in merged_df.iterrows():
-            school_name = row["School Name"]
-            
-            # Extract address components to identify the neighborhood
-            address = row["Address"] if "Address" in row else ""
-            zip_code = ""
-            neighborhood = ""
-            
-            if address:
-                # Extract zip code from address
-                zip_match = re.search(r'MA\s+(\d{5})', address)
-                if zip_match:
-                    zip_code = zip_match.group(1)
-                
-                # Extract neighborhood from address
-                neighborhood_match = re.search(r'([A-Za-z\s]+),\s+MA', address)
-                if neighborhood_match:
-                    neighborhood = neighborhood_match.group(1).strip()
-            
-            # Collect all programs marked "Yes"
-            programs_offered = []
-            for col in programs_df.columns[1:]:
-                if row.get(col) == "Yes":
-                    programs_offered.append(col)
-            
-            # Create the content string
-            content = f"{school_name} is a {row.get('School Type', 'N/A')} school serving grades {row.get('Grades Served', 'N/A')}."
-            
-            if address:
-                content += f" Located at {address}."
-            
-            if programs_offered:
-                # Format program names to be more readable
-                readable_programs = [p.replace('_', ' ').title() for p in programs_offered]
-                content += f" Special programs include: {', '.join(readable_programs)}."
-            
-            # Create metadata
-            metadata = {
-                "grades": row.get("Grades Served", ""),
-                "type": row.get("School Type", ""),
-                "address": address,
-                "zip_code": zip_code,
-                "neighborhood": neighborhood,
-                "programs": programs_offered,
-                "phone": row.get("Phone Number", "") if "Phone Number" in row else "",
-                "email": row.get("Email Address", "") if "Email Address" in row else ""
-            }
-            
-            # Create document
-            doc = SchoolDocument(school_name, content, metadata)
-            documents.append(doc)
+        merged_df, program_columns = load_school_data(school_csv, programs_csv)
+        documents = build_school_documents(merged_df, program_columns)
         
         self.documents = documents
+        self.source_files = [school_csv, programs_csv]
         return documents
+
+    def cache_key(self, 
+                  school_csv: str = 'BPS.csv',
+                  programs_csv: str = 'BPS-special-programs.csv') -> str:
+        """
+        Compute the cache key an index built from these CSVs would be stored under.
+        
+        Args:
+            school_csv: Path to the school data CSV
+            programs_csv: Path to the special programs CSV
+            
+        Returns:
+            Hex digest of the source data, embedding model and builder version
+        """
+        return compute_index_key([school_csv, programs_csv], self.index_model_id)
+
+    @property
+    def uses_embeddings(self) -> bool:
+        return self.retrieval_mode != "lexical"
+
+    @property
+    def index_model_id(self) -> str:
+        """
+        Identifier of what the saved index depends on besides the data: the
+        embedding model and index spec, or "bm25" for a lexical-only index
+        without vectors.
+        """
+        return f"{self.embedding_model_name}|{self.index_spec}" if self.uses_embeddings else "bm25"
+
+    @staticmethod
+    def lexical_text(doc: SchoolDocument) -> str:
+        """
+        Text indexed by BM25 for a document: its content plus the metadata
+        fields users search for by exact name.
+        """
+        metadata = doc.metadata
+        fields = [doc.content, metadata.get("neighborhood", ""), metadata.get("zip_code", "")]
+        fields.extend(metadata.get("programs", []))
+        return " ".join(str(field) for field in fields if isinstance(field, str) and field)
+
+    def _build_auxiliary_indexes(self) -> None:
+        """
+        Build the in-memory BM25 and metadata indexes from self.documents.
+        """
+        self.lexical_index = BM25Index([self.lexical_text(doc) for doc in self.documents])
+        self.metadata_index = MetadataIndex(self.documents)
     
+    def _set_documents(self, 
+                       documents: List[SchoolDocument],
+                       doc_ids: Sequence[int],
+                       doc_keys: Sequence[str],
+                       doc_hashes: Sequence[str]) -> None:
+        """
+        Replace the document store together with its stable ids, keys and
+        content hashes, and rebuild the in-memory lexical and metadata indexes.
+        """
+        self.documents = documents
+        self.doc_ids = np.asarray(doc_ids, dtype='int64')
+        self.doc_keys = list(doc_keys)
+        self.doc_hashes = list(doc_hashes)
+        self._id_to_position = {int(doc_id): pos for pos, doc_id in enumerate(self.doc_ids)}
+        self._by_name = {doc.school_name: doc for doc in documents}
+        self._name_pattern = None
+        self.next_doc_id = int(self.doc_ids.max()) + 1 if len(self.doc_ids) else 0
+        self._build_auxiliary_indexes()
+        # Bumped on every build, load or update so dependent caches can invalidate
+        self.index_version += 1
+
     def build_index(self, save_path: Optional[str] = None) -> None:
         """
         Build the FAISS index for fast similarity search.
@@ -131,85 +444,902 @@ class RAGEngine:
         if not self.documents:
             raise ValueError("No documents to index. Call process_school_data first.")
         
-        # Create text chunks for embedding
-        texts = [doc.content for doc in self.documents]
-        
-        # Generate embeddings
-        embeddings = self.embedding_model.encode(texts)
-        self.embeddings = embeddings.astype('float32')
-        
-        # Build the FAISS index
-        dimension = self.embeddings.shape[1]
-        self.faiss_index = faiss.IndexFlatL2(dimension)
-        self.faiss_index.add(self.embeddings)
+        doc_ids = np.arange(len(self.documents), dtype='int64')
+
+        if self.uses_embeddings:
+            # Create text chunks for embedding
+            texts = [doc.content for doc in self.documents]
+            
+            # Generate embeddings, unit length so inner products are cosine similarities
+            embeddings = normalize_rows(self.embedding_model.encode(texts))
+            
+            # Build the FAISS index, keyed by stable document ids so they
+            # survive incremental updates
+            self.index_factory = resolve_index_spec(self.index_spec, *embeddings.shape)
+            self.faiss_index = build_vector_index(self.index_factory, embeddings, doc_ids, faiss.METRIC_INNER_PRODUCT)
+            self.embeddings = None if stores_exact_vectors(self.index_factory) else embeddings
+
+        self._set_documents(self.documents, doc_ids, document_keys(self.documents),
+                            [content_hash(doc) for doc in self.documents])
         self.index_built = True
+        self.index_key = self.cache_key(*self.source_files) if self.source_files else None
         
         # Save if a path is provided
         if save_path:
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            with open(f"{save_path}_documents.pkl", "wb") as f:
-                pickle.dump(self.documents, f)
-            with open(f"{save_path}_embeddings.pkl", "wb") as f:
-                pickle.dump(self.embeddings, f)
-            faiss.write_index(self.faiss_index, f"{save_path}_faiss.index")
+            self.save_index(save_path)
+
+    def update_index(self, 
+                     school_csv: str = 'BPS.csv',
+                     programs_csv: str = 'BPS-special-programs.csv',
+                     save_path: Optional[str] = None) -> Dict[str, int]:
+        """
+        Bring a built or loaded index up to date with the CSVs without a full rebuild.
+
+        New documents are matched to stored ones by their stable per-school
+        key. Only added schools and schools whose content hash changed are
+        re-embedded; removed schools are deleted from the FAISS index by id.
+        
+        Args:
+            school_csv: Path to the school data CSV
+            programs_csv: Path to the special programs CSV
+            save_path: Optional path to save the updated index
+            
+        Returns:
+            Counts of added, changed, removed and unchanged documents
+        """
+        if not self.index_built:
+            raise ValueError("Index not built. Call build_index or load_index first.")
+
+        merged_df, program_columns = load_school_data(school_csv, programs_csv)
+        new_documents = build_school_documents(merged_df, program_columns)
+        new_keys = document_keys(new_documents)
+        new_hashes = [content_hash(doc) for doc in new_documents]
+
+        old_positions = {key: pos for pos, key in enumerate(self.doc_keys)}
+        new_key_set = set(new_keys)
+        removed_ids = [int(self.doc_ids[pos]) for key, pos in old_positions.items() if key not in new_key_set]
+
+        next_doc_id = self.next_doc_id
+        new_ids = []
+        reembed_positions = []
+        stats = {"added": 0, "changed": 0, "removed": len(removed_ids), "unchanged": 0}
+        for pos, (key, digest) in enumerate(zip(new_keys, new_hashes)):
+            old_pos = old_positions.get(key)
+            if old_pos is None:
+                new_ids.append(next_doc_id)
+                next_doc_id += 1
+                reembed_positions.append(pos)
+                stats["added"] += 1
+            else:
+                new_ids.append(int(self.doc_ids[old_pos]))
+                if self.doc_hashes[old_pos] != digest:
+                    reembed_positions.append(pos)
+                    stats["changed"] += 1
+                else:
+                    stats["unchanged"] += 1
+
+        if self.uses_embeddings:
+            dimension = self.faiss_index.d
+            new_vectors = np.empty((len(reembed_positions), dimension), dtype='float32')
+            if reembed_positions:
+                texts = [new_documents[pos].content for pos in reembed_positions]
+                new_vectors = normalize_rows(self.embedding_model.encode(texts))
+
+            # Files loaded from disk are memory-mapped read-only, so this works on a copy
+            changed_ids = [new_ids[pos] for pos in reembed_positions if new_keys[pos] in old_positions]
+            self.faiss_index = replace_vectors(self.faiss_index, removed_ids + changed_ids, new_vectors,
+                                               [new_ids[pos] for pos in reembed_positions])
+
+            if self.embeddings is not None:
+                # Keep the embeddings matrix aligned with the new document order
+                embeddings = np.empty((len(new_documents), dimension), dtype='float32')
+                reembedded = dict(zip(reembed_positions, new_vectors))
+                for pos, key in enumerate(new_keys):
+                    if pos in reembedded:
+                        embeddings[pos] = reembedded[pos]
+                    else:
+                        embeddings[pos] = self.embeddings[old_positions[key]]
+                self.embeddings = embeddings
+
+        self._set_documents(new_documents, new_ids, new_keys, new_hashes)
+        self.next_doc_id = max(self.next_doc_id, next_doc_id)
+        self.source_files = [school_csv, programs_csv]
+        self.index_key = self.cache_key(school_csv, programs_csv)
+
+        if save_path:
+            self.save_index(save_path)
+        return stats
+
+    def save_index(self, save_path: str) -> None:
+        """
+        Save the index, documents and embeddings to disk.
+
+        Documents are written as a columnar JSON file, so nothing is unpickled
+        on load. Embeddings are written as a raw ``.npy`` array only for
+        compressed indexes; flat and HNSW indexes already hold the vectors. Each save writes
+        a new generation of data files and then atomically replaces the
+        manifest that points at them, so readers see either the old or the
+        new index, never a mix. The previous generation is kept for readers
+        that already hold the old manifest; older ones are deleted.
+        
+        Args:
+            save_path: Path prefix for the saved files
+        """
+        if not self.index_built:
+            raise ValueError("Index not built. Call build_index first.")
+
+        save_dir = os.path.dirname(save_path)
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+
+        previous = self.read_manifest(save_path)
+        generation = previous.get("generation", 0) + 1 if previous else 1
+        prefix = f"{save_path}_g{generation}"
+
+        columns = {
+            "doc_id": self.doc_ids.tolist(),
+            "key": self.doc_keys,
+            "content_hash": self.doc_hashes,
+            "school_name": [doc.school_name for doc in self.documents],
+            "content": [doc.content for doc in self.documents],
+            "metadata": [doc.metadata for doc in self.documents],
+        }
+
+        def write_documents(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(columns, f)
+
+        def write_embeddings(path):
+            with open(path, "wb") as f:
+                np.save(f, np.ascontiguousarray(self.embeddings, dtype="float32"))
+
+        has_vectors = self.faiss_index is not None
+        files = {"documents": f"{prefix}_documents.json"}
+        _atomic_write(files["documents"], write_documents)
+        if has_vectors:
+            files["faiss"] = f"{prefix}_faiss.index"
+            _atomic_write(files["faiss"], lambda path: faiss.write_index(self.faiss_index, path))
+        if self.embeddings is not None:
+            files["embeddings"] = f"{prefix}_embeddings.npy"
+            _atomic_write(files["embeddings"], write_embeddings)
+
+        manifest = {
+            "format_version": INDEX_FORMAT_VERSION,
+            "generation": generation,
+            "index_key": self.index_key,
+            "model_id": self.index_model_id,
+            "has_vectors": has_vectors,
+            "index_spec": self.index_spec if has_vectors else None,
+            "index_factory": self.index_factory if has_vectors else None,
+            "metric": "cosine" if has_vectors else None,
+            "builder_version": DOCUMENT_BUILDER_VERSION,
+            "num_documents": len(self.documents),
+            "next_doc_id": self.next_doc_id,
+            "files": {name: os.path.basename(path) for name, path in files.items()},
+        }
+
+        def write_manifest(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+
+        _atomic_write(f"{save_path}_manifest.json", write_manifest)
+        self._remove_old_generations(save_path, keep={generation, generation - 1})
+
+    @staticmethod
+    def _remove_old_generations(save_path: str, keep: set) -> None:
+        """
+        Delete data files of index generations not in keep.
+        """
+        save_dir = os.path.dirname(save_path) or "."
+        pattern = re.compile(re.escape(os.path.basename(save_path)) + r"_g(\d+)_")
+        for name in os.listdir(save_dir):
+            match = pattern.match(name)
+            if match and int(match.group(1)) not in keep:
+                os.remove(os.path.join(save_dir, name))
+
+    @staticmethod
+    def read_manifest(load_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Read the manifest of a saved index.
+        
+        Args:
+            load_path: Path prefix for the saved files
+            
+        Returns:
+            The manifest dictionary, or None if no readable manifest exists
+        """
+        try:
+            with open(f"{load_path}_manifest.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
     
-    def load_index(self, load_path: str) -> None:
+    def load_index(self, load_path: str, expected_key: Optional[str] = None) -> None:
         """
         Load a previously built index from disk.
+
+        Embeddings and flat or HNSW FAISS indexes are memory-mapped rather than
+        read into private memory, so cold start is cheap and the pages are
+        shared between processes loading the same files.
         
         Args:
             load_path: Path prefix for the saved files
+            expected_key: If given, refuse to load an index stored under a
+                different cache key
         """
-        with open(f"{load_path}_documents.pkl", "rb") as f:
-            self.documents = pickle.load(f)
-        with open(f"{load_path}_embeddings.pkl", "rb") as f:
-            self.embeddings = pickle.load(f)
-        self.faiss_index = faiss.read_index(f"{load_path}_faiss.index")
+        manifest = self.read_manifest(load_path)
+        if manifest is None:
+            raise FileNotFoundError(f"No index manifest found at {load_path}_manifest.json")
+        if manifest.get("format_version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format version: {manifest.get('format_version')}")
+        if expected_key is not None and manifest.get("index_key") != expected_key:
+            raise ValueError("Index on disk is stale: cache key does not match the source data.")
+
+        load_dir = os.path.dirname(load_path)
+        files = {name: os.path.join(load_dir, filename) for name, filename in manifest["files"].items()}
+
+        with open(files["documents"], "r", encoding="utf-8") as f:
+            columns = json.load(f)
+        documents = [
+            SchoolDocument(name, content, metadata)
+            for name, content, metadata in zip(columns["school_name"], columns["content"], columns["metadata"])
+        ]
+        if self.uses_embeddings:
+            if not manifest.get("has_vectors", True):
+                raise ValueError("Index on disk has no vectors; it was built in lexical mode.")
+            if manifest.get("index_spec") != self.index_spec:
+                raise ValueError(f"Index on disk uses index spec {manifest.get('index_spec')!r}, "
+                                 f"not {self.index_spec!r}.")
+            self.embeddings = np.load(files["embeddings"], mmap_mode="r") if "embeddings" in files else None
+            self.index_factory = manifest["index_factory"]
+            self.faiss_index = read_vector_index(files["faiss"], self.index_factory)
+            if self.faiss_index.ntotal != len(documents):
+                raise ValueError("Index on disk is inconsistent: document and vector counts differ.")
+        self._set_documents(documents, columns["doc_id"], columns["key"], columns["content_hash"])
+        self.next_doc_id = max(self.next_doc_id, manifest.get("next_doc_id", 0))
+        self.index_key = manifest.get("index_key")
         self.index_built = True
+
+    def load_or_build(self, 
+                      index_path: str,
+                      school_csv: str = 'BPS.csv',
+                      programs_csv: str = 'BPS-special-programs.csv') -> str:
+        """
+        Load the cached index if it was built from the current data. If only
+        the data changed, load it and apply an incremental update; if the
+        embedding model, index format or DOCUMENT_BUILDER_VERSION changed,
+        rebuild it from scratch.
+        
+        Args:
+            index_path: Path prefix for the saved files
+            school_csv: Path to the school data CSV
+            programs_csv: Path to the special programs CSV
+            
+        Returns:
+            "loaded", "updated" or "built", describing what was done
+        """
+        key = self.cache_key(school_csv, programs_csv)
+        manifest = self.read_manifest(index_path)
+        if manifest is not None and manifest.get("index_key") == key:
+            self.load_index(index_path, expected_key=key)
+            return "loaded"
+
+        if (manifest is not None
+                and manifest.get("format_version") == INDEX_FORMAT_VERSION
+                and manifest.get("builder_version") == DOCUMENT_BUILDER_VERSION
+                and manifest.get("model_id") == self.index_model_id):
+            self.load_index(index_path)
+            self.update_index(school_csv, programs_csv, index_path)
+            return "updated"
+
+        self.process_school_data(school_csv, programs_csv)
+        self.build_index(index_path)
+        return "built"
     
-    def retrieve(self, query: str, top_k: int = 3) -> List[SchoolDocument]:
+    def warm_up(self) -> None:
+        """
+        Load the embedding model and run one query through encoding and
+        search, so the first real request doesn't pay for model loading,
+        lazy imports or paging in a memory-mapped index.
         """
-        Retrieve the most relevant documents for a given query.
+        with timed_phase("warm_up"):
+            if self.uses_embeddings:
+                self.embedding_model.load()
+                embedding = self.embedding_model.encode(["warm-up query"])
+                if self.faiss_index is not None:
+                    self.faiss_index.search(embedding, 1)
+            if self.lexical_index is not None:
+                self.lexical_index.search("warm-up query", 1)
+            if self.metadata_index is not None:
+                self.metadata_index.extract_filters("warm-up query")
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """
+        Embed a query, reusing the cached embedding for previously seen queries.
         
         Args:
             query: The user's query
-            top_k: Number of documents to retrieve
+            
+        Returns:
+            Read-only, unit-length float32 embedding vector
+        """
+        if self.embedding_model is None:
+            raise ValueError("No embedding model loaded in lexical retrieval mode.")
+
+        def compute():
+            embedding = normalize_rows(self.embedding_model.encode([query])[0])
+            embedding.setflags(write=False)
+            return embedding
+
+        return self.query_cache.get_or_compute(normalize_query(query), compute)
+
+    def documents_by_name(self, school_names: Sequence[str]) -> List[SchoolDocument]:
+        """
+        Look up documents by school name, skipping schools no longer indexed.
+        
+        Args:
+            school_names: School names, in the order wanted
+            
+        Returns:
+            The matching documents
+        """
+        return [self._by_name[name] for name in school_names if name in self._by_name]
+
+    def find_school_names(self, text: str) -> List[str]:
+        """
+        Names of indexed schools mentioned in a text, in order of first mention.
+        
+        Args:
+            text: Text to scan, e.g. an earlier answer
+            
+        Returns:
+            List of school names
+        """
+        if not self._by_name:
+            return []
+        if self._name_pattern is None:
+            # Longest names first, so "Boston Latin Academy" wins over "Boston Latin"
+            names = sorted(self._by_name, key=len, reverse=True)
+            self._name_pattern = (re.compile("|".join(re.escape(name) for name in names), re.IGNORECASE),
+                                  {name.lower(): name for name in names})
+        pattern, canonical = self._name_pattern
+        found = []
+        for match in pattern.finditer(text):
+            name = canonical[match.group(0).lower()]
+            if name not in found:
+                found.append(name)
+        return found
+
+    def query_cache_stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters of the query embedding cache.
+        
+        Returns:
+            Dictionary of cache statistics
+        """
+        return self.query_cache.stats()
+
+    def encode_queries(self, queries: Sequence[str]) -> np.ndarray:
+        """
+        Embed several queries, encoding all cache misses in a single forward pass.
+        
+        Args:
+            queries: The user queries
+            
+        Returns:
+            Float32 matrix with one unit-length embedding per query
+        """
+        keys = [normalize_query(q) for q in queries]
+        cached = {}
+        missing = {}
+        for key, query in zip(keys, queries):
+            if key in cached or key in missing:
+                continue
+            embedding = self.query_cache.get(key)
+            if embedding is None:
+                missing[key] = query
+            else:
+                cached[key] = embedding
+
+        if missing:
+            if self.embedding_model is None:
+                raise ValueError("No embedding model loaded in lexical retrieval mode.")
+            encoded = normalize_rows(self.embedding_model.encode(list(missing.values())))
+            for key, embedding in zip(missing, encoded):
+                embedding.setflags(write=False)
+                self.query_cache.put(key, embedding)
+                cached[key] = embedding
+
+        return np.stack([cached[key] for key in keys]).astype('float32', copy=False)
+
+    # Order in which filters pulled out of a query are dropped when together
+    # they match no school: least to most important to the user.
+    FILTER_RELAX_ORDER = ("program", "grade", "zip_code", "neighborhood")
+
+    def resolve_filters(self, 
+                        query: str,
+                        auto_filter: bool = False,
+                        **filters: Any) -> Optional[List[int]]:
+        """
+        Turn explicit filters, and optionally filters found in the query text,
+        into the ids of the candidate documents.
+
+        Explicit filters are applied strictly. Filters extracted from the query
+        are relaxed one at a time (see FILTER_RELAX_ORDER) if the combination
+        matches nothing, so a mis-parsed query never returns an empty result.
+        
+        Args:
+            query: The user's query
+            auto_filter: Whether to extract filters from the query text
+            **filters: Explicit grade, neighborhood, zip_code and program filters
+            
+        Returns:
+            Sorted candidate ids, or None to search all documents
+        """
+        explicit = {field: value for field, value in filters.items() if value is not None}
+        extracted = {}
+        if auto_filter:
+            extracted = {field: value for field, value in self.metadata_index.extract_filters(query).items()
+                         if field not in explicit}
+
+        candidate_ids = self.metadata_index.select(**explicit, **extracted)
+        for field in self.FILTER_RELAX_ORDER:
+            if candidate_ids is None or candidate_ids or field not in extracted:
+                continue
+            del extracted[field]
+            candidate_ids = self.metadata_index.select(**explicit, **extracted)
+        return candidate_ids
+
+    def _search(self, 
+                query_embeddings: np.ndarray,
+                top_k: int,
+                candidate_ids: Optional[List[int]] = None) -> List[List[Tuple[int, float]]]:
+        """
+        Search the FAISS index, restricted to candidate_ids when given.
+
+        Candidates and results are document positions; the FAISS index itself
+        is keyed by the stable document ids. Results come with their cosine
+        similarity to the query.
+        """
+        if candidate_ids is None:
+            scores, indices = search(self.faiss_index, self.index_factory, query_embeddings, top_k)
+        elif not candidate_ids:
+            return [[] for _ in range(len(query_embeddings))]
+        else:
+            scores, indices = search(self.faiss_index, self.index_factory, query_embeddings,
+                                     min(top_k, len(candidate_ids)),
+                                     self.doc_ids[np.asarray(candidate_ids, dtype='int64')])
+        return [[(self._id_to_position[int(idx)], float(score)) for idx, score in zip(row, row_scores) if idx >= 0]
+                for row, row_scores in zip(indices, scores)]
+
+    def _cosine_scores(self, query_embedding: np.ndarray, positions: Sequence[int]) -> np.ndarray:
+        """
+        Cosine similarity of the query to documents the vector search didn't return.
+        """
+        if self.embeddings is not None:
+            vectors = np.asarray(self.embeddings[list(positions)], dtype='float32')
+        else:
+            vectors = reconstruct(self.faiss_index, self.doc_ids[list(positions)])
+        return vectors @ query_embedding
+
+    def retrieve_scored(self, 
+                        query: str,
+                        top_k: int = 3,
+                        grade: Optional[Any] = None,
+                        neighborhood: Optional[Any] = None,
+                        zip_code: Optional[Any] = None,
+                        program: Optional[Any] = None,
+                        auto_filter: bool = False,
+                        adaptive: Optional[AdaptiveK] = None) -> List[Tuple[SchoolDocument, float]]:
+        """
+        Retrieve the most relevant documents for a given query with their
+        relevance scores.
+
+        Structured filters restrict the vector search to matching schools
+        before ranking. Each filter accepts a single value or a list of
+        alternatives, e.g. grade="K2" or neighborhood=["Roxbury", "Dorchester"].
+
+        Scores are the cosine similarity to the query in dense and hybrid
+        mode (hybrid ranks by reciprocal rank fusion, so its scores need not
+        decrease), and the BM25 score relative to the best match in lexical
+        mode, so the top result scores 1.
+
+        When micro-batching is enabled, concurrent calls are coalesced into a
+        single retrieve_batch call.
+        
+        Args:
+            query: The user's query
+            top_k: Number of documents to retrieve; the most kept with adaptive
+            grade: Grade the school must serve, e.g. "K2", "6th grade" or 6
+            neighborhood: Neighborhood the school must be in
+            zip_code: Zip code the school must be in
+            program: Special program the school must offer
+            auto_filter: Also extract filters from the query text
+            adaptive: Keep a number of documents chosen from their scores
+                instead of exactly top_k; see AdaptiveK
+            
+        Returns:
+            (document, score) pairs, most relevant first
+        """
+        if not self.index_built:
+            raise ValueError("Index not built. Call build_index first.")
+
+        with span("filter"):
+            candidate_ids = self.resolve_filters(query, auto_filter, grade=grade, neighborhood=neighborhood,
+                                                 zip_code=zip_code, program=program)
+
+        # Rank a few more with adaptive k, to make up for repeated schools
+        depth = 2 * top_k if adaptive is not None else top_k
+        if self.batcher is not None:
+            return self._select(self.batcher.submit((query, depth, candidate_ids)), top_k, adaptive)
+        
+        dense = None
+        query_embedding = None
+        if self.uses_embeddings:
+            # Encode the query
+            with span("encode_query"):
+                query_embedding = self.encode_query(query)
+            
+            # Search the index
+            with span("vector_search"):
+                dense = self._search(query_embedding.reshape(1, -1), self._candidate_depth(depth), candidate_ids)[0]
+        
+        # Return the relevant documents
+        ranked = self._rank(query, depth, dense, candidate_ids, query_embedding)
+        return self._select(ranked, top_k, adaptive)
+
+    def retrieve(self, 
+                 query: str,
+                 top_k: int = 3,
+                 grade: Optional[Any] = None,
+                 neighborhood: Optional[Any] = None,
+                 zip_code: Optional[Any] = None,
+                 program: Optional[Any] = None,
+                 auto_filter: bool = False,
+                 adaptive: Optional[AdaptiveK] = None) -> List[SchoolDocument]:
+        """
+        Retrieve the most relevant documents for a given query; like
+        retrieve_scored, without the scores.
+        
+        Args:
+            query: The user's query
+            top_k: Number of documents to retrieve; the most kept with adaptive
+            grade: Grade the school must serve, e.g. "K2", "6th grade" or 6
+            neighborhood: Neighborhood the school must be in
+            zip_code: Zip code the school must be in
+            program: Special program the school must offer
+            auto_filter: Also extract filters from the query text
+            adaptive: Keep a number of documents chosen from their scores; see AdaptiveK
             
         Returns:
             List of the most relevant school documents
         """
+        return [doc for doc, _ in self.retrieve_scored(query, top_k, grade, neighborhood, zip_code, program,
+                                                       auto_filter, adaptive)]
+
+    def _candidate_depth(self, top_k: int) -> int:
+        """
+        Number of results to take from each retriever before fusing them.
+        """
+        return top_k if self.retrieval_mode == "dense" else max(4 * top_k, 20)
+
+    def _rank(self, 
+              query: str,
+              top_k: int,
+              dense: Optional[List[Tuple[int, float]]],
+              candidate_ids: Optional[List[int]] = None,
+              query_embedding: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Produce the final ranking for a query from the dense results (already
+        searched) and, in lexical or hybrid mode, a BM25 search, as
+        (position, score) pairs; see retrieve_scored for the scores.
+        """
+        if self.retrieval_mode == "dense":
+            return dense[:top_k]
+
+        with span("lexical_search"):
+            lexical = self.lexical_index.search(query, self._candidate_depth(top_k), candidate_ids)
+        if self.retrieval_mode == "lexical":
+            best = lexical[0][1] if lexical else 0.0
+            return [(doc_id, score / best if best > 0 else 0.0) for doc_id, score in lexical[:top_k]]
+
+        with span("fusion"):
+            fused = reciprocal_rank_fusion([[doc_id for doc_id, _ in dense], [doc_id for doc_id, _ in lexical]],
+                                           k=self.rrf_k)
+            ranked = [doc_id for doc_id, _ in fused[:top_k]]
+            scores = dict(dense)
+            missing = [doc_id for doc_id in ranked if doc_id not in scores]
+            if missing:
+                scores.update(zip(missing, self._cosine_scores(query_embedding, missing).tolist()))
+        return [(doc_id, scores[doc_id]) for doc_id in ranked]
+
+    def _select(self, 
+                ranked: List[Tuple[int, float]],
+                top_k: int,
+                adaptive: Optional[AdaptiveK] = None) -> List[Tuple[SchoolDocument, float]]:
+        """
+        Turn a ranking into (document, score) pairs: the first top_k, or as
+        many as the adaptive policy keeps.
+        """
+        if adaptive is None:
+            return [(self.documents[position], score) for position, score in ranked[:top_k]]
+
+        if adaptive.min_k > top_k:
+            raise ValueError(f"min_k ({adaptive.min_k}) must not exceed top_k ({top_k})")
+        count_tokens = adaptive.count_tokens or approximate_tokens
+        selected = []
+        best = None
+        tokens = 0
+        for position, score in ranked:
+            doc = self.documents[position]
+            if len(selected) == top_k:
+                break
+            if any(doc.school_name == kept.school_name for kept, _ in selected):
+                continue
+            cost = count_tokens(self._format_entry(len(selected) + 1, doc)) if adaptive.max_tokens else 0
+            if len(selected) >= adaptive.min_k:
+                if adaptive.threshold is not None and score < adaptive.threshold:
+                    break
+                if adaptive.gap is not None and best is not None and score < best - adaptive.gap:
+                    break
+                if adaptive.max_tokens and tokens + cost > adaptive.max_tokens:
+                    break
+            selected.append((doc, score))
+            best = score if best is None else max(best, score)
+            tokens += cost
+        return selected
+
+    @property
+    def location_table(self) -> LocationTable:
+        if self._location_table is None:
+            self._location_table = LocationTable.load(self.locations_path)
+        return self._location_table
+
+    @property
+    def locator(self) -> SchoolLocator:
+        """
+        Spatial index over the current documents, rebuilt after the index changes.
+        """
+        if self._locator is None or self._locator_version != self.index_version:
+            with span("build_locator"):
+                self._locator = SchoolLocator(self.documents, self.location_table)
+            self._locator_version = self.index_version
+        return self._locator
+
+    def retrieve_nearby(self,
+                        location: Any,
+                        radius_or_k: Union[int, float] = 5,
+                        **filters: Any) -> List[Tuple[SchoolDocument, float]]:
+        """
+        Find schools close to a location, with their distances.
+
+        An int is the number of nearest schools to return; a float is a
+        radius in miles, e.g. retrieve_nearby("02124", 5) for the five
+        closest schools and retrieve_nearby("Jamaica Plain", 1.5) for every
+        school within a mile and a half.
+        
+        Args:
+            location: Zip code, neighborhood, "lat, lon" or a (lat, lon) pair
+            radius_or_k: Number of schools (int) or radius in miles (float)
+            **filters: Filters accepted by retrieve, e.g. grade="K2"
+            
+        Returns:
+            List of (school document, distance in miles), nearest first
+        """
         if not self.index_built:
             raise ValueError("Index not built. Call build_index first.")
+        resolved = self.location_table.resolve(location)
+        if resolved is None:
+            raise ValueError(f"Unknown location: {location!r}")
+        _, point = resolved
+
+        allowed = self.metadata_index.select(**filters) if filters else None
+        with span("nearby_search"):
+            if isinstance(radius_or_k, bool) or not isinstance(radius_or_k, (int, np.integer)):
+                hits = self.locator.within(point, float(radius_or_k))
+            elif allowed is None:
+                hits = self.locator.nearest(point, int(radius_or_k))
+            else:
+                # Filtered schools can be anywhere in the ranking; with ~100 schools
+                # ranking them all is still cheap
+                hits = self.locator.nearest(point, len(self.locator))
+        if allowed is not None:
+            allowed = set(allowed)
+            hits = [(position, miles) for position, miles in hits if position in allowed]
+            if isinstance(radius_or_k, (int, np.integer)) and not isinstance(radius_or_k, bool):
+                hits = hits[:int(radius_or_k)]
+        return [(self.documents[position], miles) for position, miles in hits]
+
+    def distances_from(self,
+                       query: str,
+                       docs: Sequence[SchoolDocument]) -> Optional[Tuple[str, Dict[str, float]]]:
+        """
+        Distances from the location named in a query (a zip code or
+        neighborhood) to each of the given schools.
+        
+        Args:
+            query: The user's query
+            docs: Schools to measure
+            
+        Returns:
+            Tuple of the location's label and miles by school name, or None if
+            the query names no known location
+        """
+        try:
+            resolved = self.location_table.resolve(query)
+        except FileNotFoundError:
+            return None
+        if resolved is None:
+            return None
+        label, point = resolved
+        distances = {}
+        for doc in docs:
+            school_point = self.location_table.school_point(doc.school_name, doc.metadata)
+            if school_point is not None:
+                distances[doc.school_name] = haversine_miles(point, school_point)
+        return label, distances
+
+    async def aretrieve(self, query: str, top_k: int = 3, **filters: Any) -> List[SchoolDocument]:
+        """
+        Async version of retrieve. Encoding and search run in self.executor so
+        they don't block the event loop; the caller's context is carried over
+        so their spans land in the caller's trace.
         
-        # Encode the query
-        query_embedding = self.embedding_model.encode([query])
-        query_embedding = query_embedding.astype('float32')
+        Args:
+            query: The user's query
+            top_k: Number of documents to retrieve
+            **filters: Filter arguments accepted by retrieve
+            
+        Returns:
+            List of the most relevant school documents
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor,
+                                          functools.partial(context.run, self.retrieve, query, top_k, **filters))
+
+    def retrieve_batch(self, 
+                       queries: Sequence[str], 
+                       top_k: int = 3,
+                       auto_filter: bool = False,
+                       adaptive: Optional[AdaptiveK] = None) -> List[List[SchoolDocument]]:
+        """
+        Retrieve the most relevant documents for several queries at once, using
+        one encode call and one FAISS search for the unfiltered queries.
         
-        # Search the index
-        distances, indices = self.faiss_index.search(query_embedding, top_k)
+        Args:
+            queries: The user queries
+            top_k: Number of documents to retrieve per query; the most kept with adaptive
+            auto_filter: Extract filters from each query's text, as in retrieve;
+                filtered queries are still encoded together but searched one by one
+            adaptive: Keep a number of documents chosen from their scores; see AdaptiveK
+            
+        Returns:
+            One list of relevant school documents per query, in input order
+        """
+        if not self.index_built:
+            raise ValueError("Index not built. Call build_index first.")
+        if not queries:
+            return []
+
+        candidate_ids = [None] * len(queries)
+        if auto_filter:
+            with span("filter"):
+                candidate_ids = [self.resolve_filters(query, auto_filter=True) for query in queries]
+
+        depth = 2 * top_k if adaptive is not None else top_k
+        return [[doc for doc, _ in self._select(ranked, top_k, adaptive)]
+                for ranked in self._rank_batch(queries, depth, candidate_ids)]
+
+    def _rank_batch(self, 
+                    queries: Sequence[str], 
+                    top_k: int,
+                    candidate_ids: Sequence[Optional[List[int]]]) -> List[List[Tuple[int, float]]]:
+        """
+        Rank several queries, encoding them together; see _rank.
+        """
+        dense = [None] * len(queries)
+        query_embeddings = [None] * len(queries)
+        if self.uses_embeddings:
+            with span("encode_query"):
+                query_embeddings = self.encode_queries(queries)
+            depth = self._candidate_depth(top_k)
+            with span("vector_search"):
+                unfiltered = [i for i, ids in enumerate(candidate_ids) if ids is None]
+                if unfiltered:
+                    for i, results in zip(unfiltered, self._search(query_embeddings[unfiltered], depth)):
+                        dense[i] = results
+                for i, ids in enumerate(candidate_ids):
+                    if ids is not None:
+                        dense[i] = self._search(query_embeddings[i:i + 1], depth, ids)[0]
+
+        return [self._rank(query, top_k, results, candidates, embedding)
+                for query, results, candidates, embedding in zip(queries, dense, candidate_ids, query_embeddings)]
+
+    def enable_micro_batching(self, max_batch_size: int = 32, max_wait_ms: float = 5.0) -> None:
+        """
+        Route retrieve calls through a micro-batcher that collects concurrent
+        queries for up to max_wait_ms and ranks them with one encode call and
+        one FAISS search. Filtered queries (see resolve_filters) are encoded
+        with the others but searched one by one over their candidates.
         
-        # Return the relevant documents
-        relevant_docs = [self.documents[idx] for idx in indices[0]]
-        return relevant_docs
+        Args:
+            max_batch_size: Largest number of queries searched together
+            max_wait_ms: How long a query waits for others to join its batch
+        """
+        self.disable_micro_batching()
+
+        def run_batch(items):
+            queries = [query for query, _, _ in items]
+            max_k = max(top_k for _, top_k, _ in items)
+            results = self._rank_batch(queries, max_k, [candidate_ids for _, _, candidate_ids in items])
+            return [ranked[:top_k] for ranked, (_, top_k, _) in zip(results, items)]
+
+        self.batcher = MicroBatcher(run_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def disable_micro_batching(self) -> None:
+        """
+        Stop the micro-batcher, if any, and go back to per-call retrieval.
+        """
+        if self.batcher is not None:
+            batcher, self.batcher = self.batcher, None
+            batcher.close()
     
-    def format_retrieved_context(self, docs: List[SchoolDocument]) -> str:
+    def _format_entry(self, 
+                      number: int, 
+                      doc: SchoolDocument,
+                      distances: Optional[Tuple[str, Dict[str, float]]] = None,
+                      other_programs: Sequence[str] = ()) -> str:
+        """
+        One school's entry in the retrieved context.
+        """
+        entry = f"{number}. {doc.content}\n"
+        if other_programs:
+            entry += f"   Also offers: {', '.join(other_programs)}\n"
+        
+        # Add metadata details that might be helpful
+        if doc.metadata.get("phone"):
+            entry += f"   Phone: {doc.metadata['phone']}\n"
+        if doc.metadata.get("email"):
+            entry += f"   Email: {doc.metadata['email']}\n"
+        if distances is not None and doc.school_name in distances[1]:
+            # Measured between zip code or neighborhood centroids, so only approximate
+            miles = distances[1][doc.school_name]
+            if miles < 0.05:
+                entry += f"   Area distance from {distances[0]}: same area\n"
+            else:
+                entry += f"   Area distance from {distances[0]}: about {miles:.1f} miles\n"
+        return entry
+
+    def format_retrieved_context(self,
+                                 docs: List[SchoolDocument],
+                                 distances: Optional[Tuple[str, Dict[str, float]]] = None) -> str:
         """
         Format retrieved documents into a context string for the model.
+
+        Some schools have several documents, one per program listing; each
+        school is listed once, at its best rank, with the programs of its
+        other documents added.
         
         Args:
             docs: List of retrieved school documents
+            distances: Location label and miles by school name, from distances_from
             
         Returns:
             Formatted context string
         """
+        schools = {}
+        for doc in docs:
+            first, other_programs = schools.setdefault(doc.school_name, (doc, []))
+            if doc is not first:
+                other_programs.extend(program for program in doc.metadata.get("programs", [])
+                                      if program not in first.metadata.get("programs", [])
+                                      and program not in other_programs)
+
         context = "# RETRIEVED_SCHOOLS\n"
-        for i, doc in enumerate(docs, 1):
-            context += f"{i}. {doc.content}\n"
-            
-            # Add metadata details that might be helpful
-            if doc.metadata.get("phone"):
-                context += f"   Phone: {doc.metadata['phone']}\n"
-            if doc.metadata.get("email"):
-                context += f"   Email: {doc.metadata['email']}\n"
-            
-        return context 
\ No newline at end of file
+        if distances is not None and any(name in distances[1] for name in schools):
+            context += (f"Area distances run from the center of {distances[0]} to the center of each school's "
+                        "zip code area, not from a home to a school. Do not use them to decide bus eligibility.\n")
+        for i, (doc, other_programs) in enumerate(schools.values(), 1):
+            context += self._format_entry(i, doc, distances, other_programs)
+        return context
@@ -0,0 +1,150 @@
+"""
+Enrollment rules as structured data: the age cutoffs from
+age_cutoffs_2025.txt and the transportation eligibility rules from the prompt.
+
+Both are parsed from the same text the model sees, so the fast path in
+src.intent_router and the LLM always apply the same rules.
+
+Example usage:
+    rules = RuleTable.load()
+    rules.grade_for_birth_date(datetime.date(2020, 8, 15))  # 0, i.e. K2
+    rules.transportation_for_grade(3).min_miles             # 1.0
+"""
+
+import datetime
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+from src.metadata_index import MAX_GRADE, MIN_GRADE, parse_grade
+from src.prompt import TRANSPORTATION_SECTION, read_age_cutoffs
+
+MONTHS = {name: number for number, name in enumerate(
+    ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+     "november", "december"], 1)}
+
+_CUTOFF_PATTERN = re.compile(r"on or before (\w+) (\d{1,2}), (\d{4})", re.IGNORECASE)
+_AGE_ROW_PATTERN = re.compile(r"Born in (\d{4}) = (\d{1,2}) years old = (K\d|Grade \d{1,2})", re.IGNORECASE)
+_OVERAGE_PATTERN = re.compile(r"^- Born in \d{4} or earlier.*?:\s*(.+)$", re.IGNORECASE | re.MULTILINE)
+_TRANSPORT_PATTERN = re.compile(r"^- (?:Grades\s+)?(K?\d{1,2})\s*[–-]\s*(K?\d{1,2}):\s*(.+)$", re.MULTILINE)
+_MILES_PATTERN = re.compile(r">\s*(\d+(?:\.\d+)?) miles?")
+
+
+def grade_label(level: int) -> str:
+    """
+    Display name of a numeric grade level: K0, K1, K2, then "Grade 1" to "Grade 12".
+    """
+    return f"K{level + 2}" if level <= 0 else f"Grade {level}"
+
+
+def grade_span(low: int, high: int) -> str:
+    """
+    Display name of a grade range, as in the BPS rules: "K0–K1", "K2–5", "Grades 9–12".
+    """
+    if low > 0:
+        return f"Grades {low}–{high}"
+    return f"{grade_label(low)}–{grade_label(high) if high <= 0 else high}"
+
+
+class TransportationRule(NamedTuple):
+    low: int
+    high: int
+    # Minimum distance from school for a bus, or None if the rule grants no bus
+    min_miles: Optional[float]
+    description: str
+
+
+class RuleTable:
+    """
+    Age cutoffs and transportation rules for one school year.
+    """
+
+    def __init__(self,
+                 cutoff_date: datetime.date,
+                 grade_by_age: Dict[int, int],
+                 transportation: List[TransportationRule],
+                 overage_note: str = ""):
+        """
+        Args:
+            cutoff_date: Date on which a student's age decides their grade
+            grade_by_age: Numeric grade level for each age on the cutoff date
+            transportation: Transportation rules by grade range
+            overage_note: How students older than the table are placed
+        """
+        self.cutoff_date = cutoff_date
+        self.grade_by_age = grade_by_age
+        self.transportation = transportation
+        self.overage_note = overage_note
+
+    @classmethod
+    def load(cls,
+             age_cutoffs_path: str = "age_cutoffs_2025.txt",
+             transportation_text: str = TRANSPORTATION_SECTION) -> "RuleTable":
+        """
+        Parse the age cutoff file and the transportation section.
+
+        Args:
+            age_cutoffs_path: Path to the age cutoff text file
+            transportation_text: Transportation rules, one "- K0–K1: ..." line per grade range
+
+        Returns:
+            The rule table
+
+        Raises:
+            ValueError: If the age cutoff file is missing or has no cutoff date or ages
+        """
+        text = read_age_cutoffs(age_cutoffs_path)
+        cutoff = _CUTOFF_PATTERN.search(text)
+        rows = _AGE_ROW_PATTERN.findall(text)
+        if cutoff is None or not rows or cutoff.group(1).lower() not in MONTHS:
+            raise ValueError(f"Could not parse age cutoffs from {age_cutoffs_path}")
+        cutoff_date = datetime.date(int(cutoff.group(3)), MONTHS[cutoff.group(1).lower()], int(cutoff.group(2)))
+        grade_by_age = {int(age): parse_grade(grade) for _, age, grade in rows}
+        overage = _OVERAGE_PATTERN.search(text)
+
+        transportation = []
+        for low, high, description in _TRANSPORT_PATTERN.findall(transportation_text):
+            miles = _MILES_PATTERN.search(description)
+            transportation.append(TransportationRule(parse_grade(low), parse_grade(high),
+                                                     float(miles.group(1)) if miles else None,
+                                                     description.strip()))
+        return cls(cutoff_date, grade_by_age, transportation, overage.group(1).strip() if overage else "")
+
+    @property
+    def school_year(self) -> str:
+        return f"{self.cutoff_date.year}–{self.cutoff_date.year + 1}"
+
+    @property
+    def min_age(self) -> int:
+        return min(self.grade_by_age)
+
+    @property
+    def max_age(self) -> int:
+        return max(self.grade_by_age)
+
+    def age_on_cutoff(self, birth_date: datetime.date) -> int:
+        """
+        A child's age on the cutoff date.
+        """
+        cutoff = self.cutoff_date
+        return cutoff.year - birth_date.year - ((cutoff.month, cutoff.day) < (birth_date.month, birth_date.day))
+
+    def grade_for_age(self, age: int) -> Optional[int]:
+        """
+        Numeric grade level for an age on the cutoff date, or None if the
+        child is too young or older than the table.
+        """
+        return self.grade_by_age.get(age)
+
+    def grade_for_birth_date(self, birth_date: datetime.date) -> Optional[int]:
+        """
+        Numeric grade level for a birth date, or None outside the table.
+        """
+        return self.grade_for_age(self.age_on_cutoff(birth_date))
+
+    def transportation_for_grade(self, level: int) -> Optional[TransportationRule]:
+        """
+        The transportation rule covering a grade level, if any.
+        """
+        if not MIN_GRADE <= level <= MAX_GRADE:
+            return None
+        return next((rule for rule in self.transportation if rule.low <= level <= rule.high), None)
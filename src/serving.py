@@ -0,0 +1,217 @@
+"""
+Multi-process serving: several Gradio workers sharing one index and one
+embedding model.
+
+The launcher
+- starts the embedding service, the only process that loads the model,
+- builds or updates the index once, so workers only ever load it,
+- imports the app and freezes the garbage collector, then forks N workers
+  that share those pages copy-on-write,
+- restarts workers that exit, and logs how much memory each process uses.
+
+Workers memory-map the FAISS index and embeddings read-only (see
+src.vector_index), so the page cache holds one copy for all of them, and send
+query embedding to the service, so none of them loads PyTorch. Worker i
+serves Gradio on port + i and its metrics on METRICS_PORT + i. Gradio keeps
+per-session state in the worker, so put a proxy with sticky sessions (e.g.
+nginx ip_hash) in front of the ports.
+
+Example usage:
+    python -m src.serving --workers 4 --port 7860
+"""
+
+import argparse
+import functools
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, Optional
+
+from config import (EMBEDDING_BACKEND, EMBEDDING_MODEL, LOG_LEVEL, LOG_SAMPLE_RATE, METRICS_HOST, METRICS_PORT,
+                    MICRO_BATCH_MAX_SIZE, RETRIEVAL_MODE, SERVING_PORT, SERVING_WORKERS, SLOW_REQUEST_SECONDS)
+from src.embedding_service import EmbeddingService
+from src.embeddings import EmbeddingBackend, create_backend
+from src.telemetry import configure_logging, configure_sampling, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+
+def process_memory_mb(pid: int) -> Dict[str, float]:
+    """
+    Memory of a process from /proc (Linux only). PSS charges each shared page
+    to the processes sharing it in equal parts, so PSS summed over processes
+    is their real combined footprint, unlike RSS.
+
+    Args:
+        pid: Process id
+
+    Returns:
+        Dictionary with rss_mb, pss_mb and shared_mb, or empty if unavailable
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r", encoding="utf-8") as f:
+            fields = {line.split(":")[0]: int(line.split()[1]) for line in f if line.split()[-1:] == ["kB"]}
+    except OSError:
+        return {}
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "shared_mb": round((fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)) / 1024, 1),
+    }
+
+
+def memory_report(pids: Dict[str, int]) -> Dict[str, Dict[str, float]]:
+    """
+    Memory of several processes plus their total.
+
+    Args:
+        pids: Process ids by name
+
+    Returns:
+        process_memory_mb per name, and the sums under "total"
+    """
+    report = {name: process_memory_mb(pid) for name, pid in pids.items()}
+    report["total"] = {key: round(sum(usage.get(key, 0.0) for usage in report.values()), 1)
+                       for key in ("rss_mb", "pss_mb", "shared_mb")}
+    return report
+
+
+def prepare_index(embedding_backend: Optional[EmbeddingBackend],
+                  retrieval_mode: str,
+                  index_dir: str = "models",
+                  school_csv: str = "BPS.csv",
+                  programs_csv: str = "BPS-special-programs.csv") -> str:
+    """
+    Build or update the index before starting workers, so they all load it
+    instead of racing to rebuild it.
+
+    Returns:
+        "loaded", "updated" or "built"
+    """
+    from src.chat import SchoolChatbot
+
+    engine = SchoolChatbot.create_rag_engine(embedding_backend, retrieval_mode)
+    return engine.load_or_build(os.path.join(index_dir, "school_rag"), school_csv, programs_csv)
+
+
+def run_worker(worker_id: int,
+               host: str,
+               port: int,
+               retrieval_mode: str,
+               embedding_backend: Optional[EmbeddingBackend],
+               ready: Any) -> None:
+    """
+    Body of one worker process: build the chatbot and serve Gradio on port + worker_id.
+    """
+    from app import create_chatbot
+    from src.chat import SchoolChatbot
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    if METRICS_PORT is not None:
+        start_metrics_server(METRICS_PORT + worker_id, host=METRICS_HOST)
+    chatbot = SchoolChatbot(retrieval_mode=retrieval_mode, embedding_backend=embedding_backend)
+    demo = create_chatbot(chatbot)
+    ready.set()
+    demo.launch(server_name=host, server_port=port + worker_id)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(workers: int = SERVING_WORKERS,
+          host: str = "127.0.0.1",
+          port: int = SERVING_PORT,
+          retrieval_mode: str = RETRIEVAL_MODE,
+          backend_factory: Optional[Callable[[], EmbeddingBackend]] = None,
+          startup_timeout: float = 600.0) -> None:
+    """
+    Start the embedding service and the workers, and keep the workers
+    running until interrupted.
+
+    Args:
+        workers: Number of Gradio worker processes
+        host: Interface the workers listen on
+        port: Port of the first worker; worker i listens on port + i
+        retrieval_mode: "dense", "hybrid" or "lexical"; lexical needs no embedding service
+        backend_factory: Picklable callable returning the EmbeddingBackend the
+            service runs; built from config if None
+        startup_timeout: Seconds to wait for the model and each worker to start
+    """
+    service = None
+    embedding_backend = None
+    if retrieval_mode != "lexical":
+        service = EmbeddingService(backend_factory or functools.partial(create_backend, EMBEDDING_BACKEND,
+                                                                        EMBEDDING_MODEL),
+                                   max_batch_size=MICRO_BATCH_MAX_SIZE)
+        service.start(startup_timeout)
+        embedding_backend = service.client()
+
+    status = prepare_index(embedding_backend, retrieval_mode)
+    logger.info("Index %s before starting %d workers", status, workers)
+    if embedding_backend is not None:
+        embedding_backend.close()
+
+    # Imported before forking so workers share these pages instead of importing them each
+    import app  # noqa: F401
+    import src.chat  # noqa: F401
+    gc.collect()
+    gc.freeze()
+
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    processes = {}
+
+    def start_worker(worker_id):
+        ready = context.Event()
+        process = context.Process(target=run_worker, name=f"worker-{worker_id}",
+                                  args=(worker_id, host, port, retrieval_mode, embedding_backend, ready))
+        process.start()
+        processes[worker_id] = process
+        return ready
+
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        for worker_id, ready in [(i, start_worker(i)) for i in range(workers)]:
+            if not ready.wait(startup_timeout):
+                raise TimeoutError(f"Worker {worker_id} did not start within {startup_timeout}s")
+        pids = {"launcher": os.getpid(), **{p.name: p.pid for p in processes.values()}}
+        if service is not None:
+            pids["embedding-service"] = service.process.pid
+        logger.info("Serving on %s:%d-%d; memory: %s", host, port, port + workers - 1, memory_report(pids))
+
+        while True:
+            wait([process.sentinel for process in processes.values()])
+            for worker_id, process in list(processes.items()):
+                if not process.is_alive():
+                    logger.warning("Worker %d exited with code %s; restarting it", worker_id, process.exitcode)
+                    start_worker(worker_id)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(10)
+        if service is not None:
+            service.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the chatbot from several worker processes.")
+    parser.add_argument("--workers", type=int, default=SERVING_WORKERS, help="Number of Gradio workers")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=SERVING_PORT, help="Port of the first worker")
+    parser.add_argument("--retrieval-mode", default=RETRIEVAL_MODE, choices=["dense", "hybrid", "lexical"])
+    args = parser.parse_args()
+
+    configure_logging(LOG_LEVEL)
+    configure_sampling(LOG_SAMPLE_RATE, SLOW_REQUEST_SECONDS)
+    serve(args.workers, args.host, args.port, args.retrieval_mode)
+
+
+if __name__ == "__main__":
+    main()
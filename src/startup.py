@@ -0,0 +1,81 @@
+import importlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict
+
+# Seconds spent in each startup phase (heavy imports, model load, index load,
+# warm-up), in the order the phases first ran.
+_timings: "OrderedDict[str, float]" = OrderedDict()
+_lock = threading.Lock()
+
+
+@contextmanager
+def timed_phase(name: str):
+    """
+    Time a startup phase and add it to the startup report. Repeated phases
+    with the same name accumulate.
+
+    Example usage:
+        with timed_phase("load_index"):
+            engine.load_index(path)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _timings[name] = _timings.get(name, 0.0) + elapsed
+
+
+def startup_timings() -> Dict[str, float]:
+    """
+    Snapshot of the recorded startup phases.
+
+    Returns:
+        Mapping of phase name to seconds spent
+    """
+    with _lock:
+        return dict(_timings)
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access, so
+    importing code that references heavy dependencies (torch, faiss, pandas)
+    costs nothing until they are actually used. The import is timed as the
+    startup phase "import:<name>".
+
+    Example usage:
+        faiss = LazyModule("faiss")
+        index = faiss.IndexFlatL2(384)  # faiss is imported here
+    """
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    with timed_phase(f"import:{self._name}"):
+                        module = importlib.import_module(self._name)
+                    self.__dict__["_module"] = module
+        return module
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<LazyModule {self._name!r} ({state})>"
@@ -0,0 +1,398 @@
+"""
+Lightweight tracing, metrics and structured logging for the chat pipeline.
+
+- `span(stage)` times one stage of a request (query encoding, FAISS search,
+  context formatting, prompt assembly, generation, ...) into the
+  `chatbot_stage_seconds` histogram and the current request's trace.
+- `trace_request(path)` wraps a whole request: it counts it, records its
+  latency and emits one structured log line with the per-stage breakdown.
+  Only a sample of requests is logged (plus every slow or failed one), and
+  the decision is made before anything is formatted, so logging costs
+  nothing for the rest.
+- `REGISTRY.render()` returns all metrics in the Prometheus text format;
+  `start_metrics_server(port)` serves it at /metrics.
+
+Example usage:
+    with trace_request("get_response") as trace:
+        with span("retrieve"):
+            docs = engine.retrieve(query)
+        trace.set(num_docs=len(docs))
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count, per label combination.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return super().render() + [f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                                   for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in cumulative buckets, per label combination.
+    """
+
+    kind = "histogram"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts (the last one for +Inf), then the running sum and the total count
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 3))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels: Any) -> int:
+        series = self._series.get(self._key(labels))
+        return int(series[-1]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            all_series = {key: list(series) for key, series in self._series.items()}
+        lines = super().render()
+        for key, series in sorted(all_series.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Current value read from a callback when metrics are rendered, e.g. a
+    cache's size or the number of generations in flight.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.read = read
+
+    def render(self) -> List[str]:
+        return super().render() + [f"{self.name} {float(self.read())}"]
+
+
+class MetricsRegistry:
+    """
+    Named collection of metrics, rendered together in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and not isinstance(metric, Gauge):
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self,
+                  name: str,
+                  documentation: str,
+                  labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], float]) -> Gauge:
+        """
+        Register a gauge, replacing any earlier one with the same name.
+        """
+        return self._register(Gauge(name, documentation, read))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram("chatbot_stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+REQUESTS = REGISTRY.counter("chatbot_requests_total", "Chat requests by entry point and outcome.",
+                            ["path", "outcome"])
+REQUEST_SECONDS = REGISTRY.histogram("chatbot_request_seconds", "End-to-end chat request latency.", ["path"])
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram("chatbot_time_to_first_token_seconds",
+                                         "Time from request start to the first streamed token.", ["path"])
+
+
+class Trace:
+    """
+    Stages and attributes of one request, collected for its log line.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self.attributes: Dict[str, Any] = {}
+        self.outcome = "ok"
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def stage_totals(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("chatbot_trace", default=None)
+
+# Fraction of requests logged; slow and failed ones are always logged
+_sampling = {"rate": 0.1, "slow_seconds": 5.0}
+
+
+def configure_sampling(rate: float, slow_seconds: Optional[float] = None) -> None:
+    """
+    Set the fraction of requests whose trace is logged.
+
+    Args:
+        rate: Probability that a request is logged, from 0 to 1
+        slow_seconds: Requests at least this slow are always logged; None to disable
+    """
+    _sampling["rate"] = rate
+    _sampling["slow_seconds"] = slow_seconds
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """
+    Record an already measured stage, for stages that don't fit a `with` block.
+
+    Args:
+        stage: Stage name, used as the histogram label
+        seconds: Time spent in the stage
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time one stage into the stage histogram and the current request's trace.
+
+    Args:
+        stage: Stage name, used as the histogram label
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def trace_request(path: str) -> Iterator[Trace]:
+    """
+    Trace one chat request: count it, record its latency and log its
+    per-stage breakdown if it is sampled, slow or failed. Set
+    `trace.outcome` to e.g. "cache_hit" to distinguish outcomes; errors and
+    abandoned streams are recorded as "error" and "cancelled".
+
+    Args:
+        path: Entry point, e.g. "get_response" or "aget_response_stream"
+
+    Yields:
+        The request's Trace
+    """
+    trace = Trace(path)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except (GeneratorExit, asyncio.CancelledError):
+        # The client stopped reading a stream or disconnected
+        trace.outcome = "cancelled"
+        raise
+    except BaseException as e:
+        trace.outcome = "error"
+        trace.set(error=type(e).__name__)
+        raise
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # Async generators may be finalized from another context
+            _current_trace.set(None)
+        elapsed = time.perf_counter() - trace.started
+        REQUESTS.inc(path=path, outcome=trace.outcome)
+        REQUEST_SECONDS.observe(elapsed, path=path)
+        _log_trace(trace, elapsed)
+
+
+def _log_trace(trace: Trace, elapsed: float) -> None:
+    slow = _sampling["slow_seconds"] is not None and elapsed >= _sampling["slow_seconds"]
+    if trace.outcome != "error" and not slow and random.random() >= _sampling["rate"]:
+        return
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    fields = {
+        "event": "chat_request",
+        "path": trace.path,
+        "outcome": trace.outcome,
+        "seconds": round(elapsed, 6),
+        "stages": {stage: round(seconds, 6) for stage, seconds in trace.stage_totals().items()},
+        **trace.attributes,
+    }
+    level = logging.WARNING if trace.outcome == "error" or slow else logging.INFO
+    logger.log(level, "chat_request", extra={"fields": fields})
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format log records as one JSON object per line. Structured fields passed
+    as extra={"fields": {...}} are merged into the object.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def configure_logging(level: Union[int, str] = logging.INFO) -> None:
+    """
+    Send this package's logs to stderr as JSON lines.
+
+    Args:
+        level: Minimum level logged, e.g. logging.INFO or "INFO"
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    for name in ("src", "__main__"):
+        package_logger = logging.getLogger(name)
+        package_logger.handlers = [handler]
+        package_logger.setLevel(level)
+        package_logger.propagate = False
+
+
+def start_metrics_server(port: int,
+                         host: str = "127.0.0.1",
+                         registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """
+    Serve the registry's metrics at http://host:port/metrics from a daemon thread.
+
+    Args:
+        port: Port to listen on (0 picks a free one)
+        host: Interface to bind; the loopback default keeps the endpoint local
+        registry: Metrics to serve
+
+    Returns:
+        The running server; call shutdown() to stop it
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,180 @@
+"""
+Tests for the async request path of SchoolChatbot.
+
+Generation goes to a local fake inference server that speaks the
+text-generation API, so no remote endpoint or token is needed. Retrieval uses
+the lexical mode, which does not load an embedding model.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.chat import SchoolChatbot
+from src.concurrency import ConcurrencyLimiter, OverloadedError
+
+
+class FakeInferenceServer:
+    """
+    Minimal text-generation server. Replies with a fixed text, optionally
+    after a delay, and can fail the first few requests with a 503.
+    """
+
+    def __init__(self, reply_tokens=("Hernandez ", "is ", "in ", "Roxbury."), delay=0.0, failures=0):
+        self.reply_tokens = list(reply_tokens)
+        self.delay = delay
+        self.failures = failures
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake.lock:
+                    fake.requests += 1
+                    should_fail = fake.requests <= fake.failures
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                try:
+                    time.sleep(fake.delay)
+                    if should_fail:
+                        self.send_response(503)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                    elif body.get("stream"):
+                        self._stream()
+                    else:
+                        self._reply([{"generated_text": "".join(fake.reply_tokens)}])
+                finally:
+                    with fake.lock:
+                        fake.in_flight -= 1
+
+            def _reply(self, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for i, text in enumerate(fake.reply_tokens):
+                    event = {"index": i, "token": {"id": i, "text": text, "logprob": 0.0, "special": False},
+                             "generated_text": None, "details": None}
+                    self.wfile.write(f"data:{json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(scope="module")
+def index_dir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("index"))
+
+
+def make_chatbot(url, index_dir):
+    chatbot = SchoolChatbot(model_id=url, index_dir=index_dir, retrieval_mode="lexical")
+    chatbot.generation_retries = 2
+    return chatbot
+
+
+def test_aget_response_returns_generated_text(index_dir):
+    with FakeInferenceServer() as server:
+        chatbot = make_chatbot(server.url, index_dir)
+        response = asyncio.run(chatbot.aget_response("Where is the Hernandez school?"))
+
+    assert response == "Hernandez is in Roxbury."
+    assert chatbot.response_timings[-1]["total"] > 0
+
+
+def test_aget_response_stream_yields_tokens_and_records_ttft(index_dir):
+    async def collect(chatbot):
+        return [token async for token in chatbot.aget_response_stream("Where is the Hernandez school?")]
+
+    with FakeInferenceServer() as server:
+        chatbot = make_chatbot(server.url, index_dir)
+        tokens = asyncio.run(collect(chatbot))
+
+    assert tokens == server.reply_tokens
+    timing = chatbot.response_timings[-1]
+    assert 0 < timing["time_to_first_token"] <= timing["total"]
+
+
+def test_transient_failures_are_retried(index_dir):
+    with FakeInferenceServer(failures=2) as server:
+        chatbot = make_chatbot(server.url, index_dir)
+        response = asyncio.run(chatbot.aget_response("Spanish programs in Jamaica Plain"))
+
+    assert response == "Hernandez is in Roxbury."
+    assert server.requests == 3
+
+
+def test_in_flight_generations_are_bounded(index_dir):
+    async def run_all(chatbot):
+        return await asyncio.gather(*(chatbot.aget_response(f"question {i}") for i in range(6)))
+
+    with FakeInferenceServer(delay=0.1) as server:
+        chatbot = make_chatbot(server.url, index_dir)
+        chatbot.generation_limiter = ConcurrencyLimiter(max_in_flight=2)
+        responses = asyncio.run(run_all(chatbot))
+
+    assert len(responses) == 6
+    assert server.max_in_flight == 2
+
+
+def test_requests_beyond_queue_timeout_are_rejected(index_dir):
+    async def run_all(chatbot):
+        return await asyncio.gather(*(chatbot.aget_response(f"question {i}") for i in range(3)),
+                                    return_exceptions=True)
+
+    with FakeInferenceServer(delay=0.3) as server:
+        chatbot = make_chatbot(server.url, index_dir)
+        chatbot.generation_limiter = ConcurrencyLimiter(max_in_flight=1, queue_timeout=0.05)
+        results = asyncio.run(run_all(chatbot))
+
+    assert sum(isinstance(result, OverloadedError) for result in results) == 2
+    assert chatbot.generation_limiter.rejected == 2
+
+
+def test_limiter_is_reusable_across_event_loops():
+    limiter = ConcurrencyLimiter(max_in_flight=2)
+    peak = 0
+
+    async def work():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def run_all():
+        await asyncio.gather(*(work() for _ in range(6)))
+
+    # Both runs wait for slots, which binds a semaphore to each loop
+    asyncio.run(run_all())
+    asyncio.run(run_all())
+    assert peak == 2 and limiter.in_flight == 0 and limiter.waiting == 0
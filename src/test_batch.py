@@ -0,0 +1,114 @@
+"""
+Tests for batch answering: batched retrieval, bounded generation and resuming
+an interrupted run. Generation goes to the offline fake clients.
+"""
+
+import json
+
+import pytest
+
+from src.batch import read_queries, run_batch
+from src.benchmark import FakeAsyncInferenceClient, load_labeled_queries
+from src.chat import SchoolChatbot
+from src.rag_engine import AdaptiveK, RAGEngine
+from src.testing import HashingBackend
+
+
+class CountingClient(FakeAsyncInferenceClient):
+    """
+    Tracks the most generations in flight at once; fails on queries containing "FAIL".
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(time_to_first_token=0.01, **kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def text_generation(self, prompt, stream=False, **params):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            response = await super().text_generation(prompt, stream=stream, **params)
+            if "FAIL" in prompt:
+                raise ValueError("bad request")
+            return response
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def chatbot(tmp_path):
+    chatbot = SchoolChatbot(index_dir=str(tmp_path / "index"), retrieval_mode="lexical")
+    chatbot.async_client = CountingClient()
+    return chatbot
+
+
+def write_queries(path, queries):
+    path.write_text("".join(json.dumps(query) + "\n" for query in queries))
+    return str(path)
+
+
+def read_answers(path):
+    return [json.loads(line) for line in open(path, encoding="utf-8")]
+
+
+def test_batched_retrieval_matches_single_queries(tmp_path):
+    engine = RAGEngine(embedding_model=HashingBackend(), retrieval_mode="hybrid")
+    engine.process_school_data()
+    engine.build_index()
+    queries = [item["query"] for item in load_labeled_queries()]
+
+    batched = engine.retrieve_batch(queries, top_k=3, auto_filter=True)
+    adaptive = engine.retrieve_batch(queries, top_k=6, auto_filter=True, adaptive=AdaptiveK())
+
+    for query, docs, kept in zip(queries, batched, adaptive):
+        assert docs == engine.retrieve(query, top_k=3, auto_filter=True), query
+        assert kept == engine.retrieve(query, top_k=6, auto_filter=True, adaptive=AdaptiveK()), query
+
+
+def test_answers_every_query_with_bounded_workers(chatbot, tmp_path):
+    queries = [{"id": f"q{i}", "query": f"Spanish programs in Roxbury for student {i}"} for i in range(20)]
+    queries.append({"query": "What grade is a 5 year old in?", "tag": "rules"})
+    input_path = write_queries(tmp_path / "in.jsonl", queries)
+    output_path = str(tmp_path / "out.jsonl")
+
+    summary = run_batch(input_path, output_path, chatbot, workers=3, batch_size=8)
+
+    answers = {answer["id"]: answer for answer in read_answers(output_path)}
+    assert summary["answered"] == len(answers) == 21 and summary["fast_path"] == 1
+    assert answers["21"]["outcome"] == "fast_path" and answers["21"]["tag"] == "rules"
+    assert answers["q0"]["response"] == "Based on the retrieved schools, yes."
+    assert answers["q0"]["schools"] == [doc.school_name for doc in chatbot.rag_engine.retrieve(
+        queries[0]["query"], top_k=chatbot.retrieval_top_k, auto_filter=True, adaptive=chatbot.retrieval_policy)]
+    assert chatbot.async_client.calls == 20
+    assert chatbot.async_client.max_in_flight == 3
+
+
+def test_interrupted_run_resumes(chatbot, tmp_path):
+    queries = [{"id": "a", "query": "K2 in Dorchester"}, {"id": "b", "query": "FAIL this one"},
+               {"id": "c", "query": "Schools in East Boston"}, {"id": "d", "query": "Schools in Hyde Park"}]
+    input_path = write_queries(tmp_path / "in.jsonl", queries)
+    output_path = tmp_path / "out.jsonl"
+    # "a" finished and "c" was cut off mid-line when the earlier run stopped
+    output_path.write_text(json.dumps({"id": "a", "query": "K2 in Dorchester", "response": "Done."}) + "\n"
+                           + '{"id": "c", "que')
+
+    first = run_batch(input_path, str(output_path), chatbot)
+    queries[1]["query"] = "Schools in Roxbury"
+    write_queries(tmp_path / "in.jsonl", queries)
+    second = run_batch(input_path, str(output_path), chatbot)
+
+    assert (first["skipped"], first["answered"], first["errors"]) == (1, 2, 1)
+    # Only the failed question is asked again
+    assert (second["skipped"], second["answered"], second["errors"]) == (3, 1, 0)
+    assert chatbot.async_client.calls == 4
+    latest = {answer["id"]: answer for answer in read_answers(output_path)}
+    assert sorted(latest) == ["a", "b", "c", "d"]
+    assert all("error" not in answer for answer in latest.values())
+
+
+def test_read_queries_rejects_duplicate_ids(tmp_path):
+    path = write_queries(tmp_path / "in.jsonl", [{"id": 1, "query": "a"}, {"id": "1", "query": "b"}])
+
+    with pytest.raises(ValueError, match="duplicate id"):
+        read_queries(path)
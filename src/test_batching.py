@@ -0,0 +1,130 @@
+"""
+Tests for the micro-batcher and for micro-batched retrieval. The engine
+embeds with the hashing backend, so no model is downloaded.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.batching import MicroBatcher
+from src.rag_engine import RAGEngine
+from src.testing import HashingBackend
+
+
+class RecordingBatchFn:
+    def __init__(self, fn=lambda items: [item * 2 for item in items]):
+        self.fn = fn
+        self.batches = []
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        return self.fn(items)
+
+
+def submit_all(batcher, items):
+    with ThreadPoolExecutor(len(items)) as pool:
+        return list(pool.map(batcher.submit, items))
+
+
+def test_concurrent_items_share_batches_up_to_the_size_cap():
+    batch_fn = RecordingBatchFn()
+    batcher = MicroBatcher(batch_fn, max_batch_size=32, max_wait_ms=200)
+    assert submit_all(batcher, list(range(6))) == [0, 2, 4, 6, 8, 10]
+    assert batch_fn.batches and len(batch_fn.batches) == 1 and batcher.average_batch_size == 6
+    batcher.close()
+
+    batch_fn = RecordingBatchFn()
+    batcher = MicroBatcher(batch_fn, max_batch_size=2, max_wait_ms=200)
+    assert submit_all(batcher, list(range(5))) == [0, 2, 4, 6, 8]
+    assert max(len(batch) for batch in batch_fn.batches) == 2
+    assert sorted(item for batch in batch_fn.batches for item in batch) == list(range(5))
+    batcher.close()
+
+    with pytest.raises(ValueError):
+        MicroBatcher(batch_fn, max_batch_size=0)
+
+
+def test_a_lone_item_waits_only_until_the_deadline():
+    batch_fn = RecordingBatchFn()
+    batcher = MicroBatcher(batch_fn, max_wait_ms=50)
+
+    start = time.monotonic()
+    assert batcher.submit(1) == 2
+    assert 0.04 <= time.monotonic() - start < 1.0
+    # Arriving after the deadline, the next item gets a batch of its own
+    assert batcher.submit(2) == 4
+    assert batch_fn.batches == [[1], [2]]
+    batcher.close()
+
+
+def test_errors_reach_every_caller_in_the_batch():
+    def fail(items):
+        raise KeyError("bad batch")
+
+    batcher = MicroBatcher(fail, max_wait_ms=100)
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(batcher.submit, item) for item in range(3)]
+        for future in futures:
+            with pytest.raises(KeyError, match="bad batch"):
+                future.result(timeout=5)
+    batcher.close()
+
+    batcher = MicroBatcher(lambda items: items[:-1], max_wait_ms=0)
+    with pytest.raises(RuntimeError, match="different number of results"):
+        batcher.submit(1)
+    assert batcher.batches_run == 0
+    batcher.close()
+
+
+def test_close_processes_queued_items_and_never_strands_a_caller():
+    release = threading.Event()
+    batcher = MicroBatcher(RecordingBatchFn(lambda items: release.wait(5) and [item * 2 for item in items]),
+                           max_batch_size=1, max_wait_ms=0)
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(batcher.submit, item) for item in range(3)]
+        time.sleep(0.05)
+        closing = pool.submit(batcher.close)
+        release.set()
+        closing.result(timeout=5)
+        assert [future.result(timeout=5) for future in futures] == [0, 2, 4]
+    with pytest.raises(RuntimeError, match="closed"):
+        batcher.submit(1)
+    batcher.close()
+
+    # Submits racing with close either get their result or are refused
+    for _ in range(20):
+        batcher = MicroBatcher(lambda items: items, max_wait_ms=0)
+        with ThreadPoolExecutor(8) as pool:
+            futures = [pool.submit(batcher.submit, item) for item in range(8)]
+            batcher.close()
+            for item, future in enumerate(futures):
+                try:
+                    assert future.result(timeout=5) == item
+                except RuntimeError as e:
+                    assert "closed" in str(e)
+
+
+def test_engine_batches_filtered_and_unfiltered_queries():
+    engine = RAGEngine(embedding_model=HashingBackend(), retrieval_mode="hybrid")
+    engine.process_school_data()
+    engine.build_index()
+    queries = ["Spanish dual language programs", "schools in Roxbury for 3rd grade", "art and music",
+               "Inclusion programs near 02130", "Hernandez", "kindergarten in Dorchester"]
+    expected = [engine.retrieve(query, top_k=3, auto_filter=True) for query in queries]
+
+    engine.enable_micro_batching(max_batch_size=8, max_wait_ms=200)
+    with ThreadPoolExecutor(len(queries)) as pool:
+        batched = list(pool.map(lambda query: engine.retrieve(query, top_k=3, auto_filter=True), queries))
+    assert [[doc.school_name for doc in docs] for docs in batched] == \
+        [[doc.school_name for doc in docs] for docs in expected]
+    assert engine.batcher.items_processed == len(queries) and engine.batcher.batches_run < len(queries)
+
+    batcher = engine.batcher
+    engine.disable_micro_batching()
+    assert engine.batcher is None
+    with pytest.raises(RuntimeError):
+        batcher.submit(("Hernandez", 3, None))
+    assert engine.retrieve("Hernandez", top_k=3, auto_filter=True) == expected[4]
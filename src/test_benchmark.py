@@ -0,0 +1,64 @@
+"""
+Tests for the offline benchmark suite. Runs in lexical mode, which needs no
+embedding model.
+"""
+
+import asyncio
+import json
+
+import pandas as pd
+
+from src.benchmark import (FakeAsyncInferenceClient, FakeInferenceClient, latency_summary, load_labeled_queries,
+                           relevance_metrics, run_benchmark)
+from src.rag_engine import SchoolDocument
+
+
+def test_labeled_queries_name_real_schools():
+    school_names = set(pd.read_csv("BPS.csv")["School Name"])
+    queries = load_labeled_queries()
+
+    assert len({item["id"] for item in queries}) == len(queries)
+    assert all(item["relevant"] and set(item["relevant"]) <= school_names for item in queries)
+
+
+def test_fake_clients_stream_and_reply():
+    client = FakeInferenceClient(reply_tokens=["a", "b"])
+    assert client.text_generation("prompt") == "ab"
+    assert list(client.text_generation("prompt", stream=True)) == ["a", "b"]
+
+    async def collect():
+        async_client = FakeAsyncInferenceClient(reply_tokens=["a", "b"])
+        stream = await async_client.text_generation("prompt", stream=True)
+        return await async_client.text_generation("prompt"), [token async for token in stream]
+
+    assert asyncio.run(collect()) == ("ab", ["a", "b"])
+
+
+def test_relevance_metrics():
+    docs = {name: SchoolDocument(name, "") for name in "ABCD"}
+    rankings = {"q1": ["A", "B", "C"], "q2": ["C", "D", "A"]}
+    labeled = [{"query": "q1", "relevant": ["A"]}, {"query": "q2", "relevant": ["A", "B"]}]
+
+    metrics = relevance_metrics(lambda query, k: [docs[name] for name in rankings[query][:k]], labeled, ks=(1, 3))
+
+    assert metrics == {"recall@1": 0.5, "recall@3": 0.75, "mrr": (1 + 1 / 3) / 2}
+
+
+def test_latency_summary_percentiles():
+    summary = latency_summary([i / 1000 for i in range(1, 101)])
+    assert round(summary["p50_ms"], 1) == 50.5
+    assert summary["p99_ms"] > summary["p95_ms"] > summary["p50_ms"]
+
+
+def test_run_benchmark_reports_json_results():
+    # Two levels above MAX_CONCURRENT_GENERATIONS, so generations wait for slots in both
+    results = run_benchmark(["lexical"], repeats=1, concurrency_levels=[1, 16, 32], requests_per_level=32)
+
+    json.dumps(results)
+    mode = results["modes"][0]
+    assert mode["build_seconds"] > 0 and mode["num_documents"] > 0
+    assert mode["relevance"]["mrr"] > 0.5
+    assert mode["adaptive"]["context_tokens"] <= mode["adaptive"]["fixed_context_tokens"]
+    assert mode["retrieve_latency"]["p99_ms"] >= mode["retrieve_latency"]["p50_ms"]
+    assert [run["concurrency"] for run in mode["end_to_end"]] == [1, 16, 32]
+    assert all(run["requests_per_second"] > 0 for run in mode["retrieve_throughput"])
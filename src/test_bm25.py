@@ -0,0 +1,51 @@
+"""
+Tests for the BM25 index and reciprocal rank fusion, on a handful of
+hand-written school documents. Hybrid mode embeds them with the hashing
+backend from src/testing.py, so no model is downloaded.
+"""
+
+import pytest
+
+from src.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from src.rag_engine import RAGEngine
+from src.testing import SCHOOLS, HashingBackend, documents
+
+@pytest.fixture(scope="module", params=["lexical", "hybrid"])
+def engine(request):
+    engine = RAGEngine(embedding_model=HashingBackend(), retrieval_mode=request.param)
+    engine.documents = documents()
+    engine.build_index()
+    return engine
+
+
+def test_tokenize_drops_stopwords_and_splits_names():
+    assert tokenize("Which schools have ABA-Based classrooms near 02130?") == ["aba", "based", "classrooms", "02130"]
+
+
+def test_bm25_prefers_rare_terms_and_respects_candidates():
+    index = BM25Index([doc.content for doc in documents()])
+
+    results = index.search("Mozart elementary", top_k=5)
+    assert results[0][0] == 0
+    # Every elementary school matches, but only Mozart has the rare name term
+    assert {doc_id for doc_id, _ in results} == {0, 1, 2}
+    assert results[0][1] > 2 * results[1][1]
+
+    assert index.search("Mozart", top_k=5, candidate_ids=[1, 2]) == []
+    assert {doc_id for doc_id, _ in index.search("Roxbury", top_k=2)} <= {1, 3, 4}
+    assert index.search("opera", top_k=5) == [] and index.search("Mozart", top_k=0) == []
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 2]], k=1)
+    # 2 is second in both lists; 3 is first in one and third in the other
+    assert [doc_id for doc_id, _ in fused] == [3, 2, 1]
+    assert fused[0][1] == pytest.approx(1 / 2 + 1 / 4)
+    assert fused[1][1] == pytest.approx(2 / 3)
+    # Ties are broken by document id
+    assert [doc_id for doc_id, _ in reciprocal_rank_fusion([[5], [4]])] == [4, 5]
+
+
+@pytest.mark.parametrize("name", list(SCHOOLS))
+def test_exact_school_name_ranks_first(engine, name):
+    assert engine.retrieve(name, top_k=3)[0].school_name == name
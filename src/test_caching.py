@@ -0,0 +1,172 @@
+"""
+Tests for the LRU and semantic response caches. Vectors are built by hand or
+come from the hashing backend in src/testing.py, and the chatbot runs in
+lexical mode, so no embedding model is loaded.
+"""
+
+import numpy as np
+import pytest
+
+from src.benchmark import FakeInferenceClient
+from src.caching import LRUCache, SemanticResponseCache
+from src.chat import SchoolChatbot
+from src.rag_engine import RAGEngine
+from src.testing import HashingBackend, documents
+
+SCHOOLS = frozenset({"Hernandez K-8", "Haynes EEC"})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingBackend(HashingBackend):
+    def __init__(self):
+        super().__init__()
+        self.encoded = []
+
+    def _encode(self, texts):
+        self.encoded.extend(texts)
+        return super()._encode(texts)
+
+
+def unit(*values):
+    vector = np.array(values, dtype="float32")
+    return vector / np.linalg.norm(vector)
+
+
+def test_lru_evicts_least_recently_used_first():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert "b" not in cache and "a" in cache and "c" in cache
+    cache.put("a", 10)
+    cache.put("d", 4)
+    assert "c" not in cache and cache.get("a") == 10
+    assert cache.get("b", "missing") == "missing"
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 1, "evictions": 2, "expirations": 0,
+                             "hit_rate": pytest.approx(2 / 3)}
+
+
+def test_lru_expiry_and_get_or_compute():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=4, ttl=10, clock=clock)
+    computed = []
+
+    def compute():
+        computed.append(clock.now)
+        return len(computed)
+
+    assert cache.get_or_compute("a", compute) == 1
+    clock.now = 10
+    assert cache.get_or_compute("a", compute) == 1
+    clock.now = 10.5
+    assert cache.get_or_compute("a", compute) == 2
+    assert computed == [0.0, 10.5]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["size"]) == (1, 2, 1, 1)
+
+    cache.clear()
+    assert len(cache) == 0 and cache.stats()["misses"] == 2
+
+    disabled = LRUCache(maxsize=0)
+    disabled.put("a", 1)
+    assert len(disabled) == 0 and disabled.get_or_compute("a", lambda: 2) == 2
+    with pytest.raises(ValueError):
+        LRUCache(maxsize=-1)
+
+
+def test_query_embeddings_are_cached_by_normalized_text():
+    backend = CountingBackend()
+    engine = RAGEngine(embedding_model=backend, retrieval_mode="dense")
+    engine.documents = documents()
+    engine.build_index()
+    backend.encoded.clear()
+
+    first = engine.retrieve("Spanish programs in Roxbury?", top_k=2)
+    assert engine.retrieve("  spanish PROGRAMS   in roxbury ", top_k=2) == first
+    assert backend.encoded == ["Spanish programs in Roxbury?"]
+    stats = engine.query_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+    # Batched encoding shares the cache and embeds each new text once
+    engine.encode_queries(["spanish programs in roxbury", "Arts program", "arts program!"])
+    assert backend.encoded[1:] == ["Arts program"]
+    assert engine.query_cache_stats()["size"] == 2
+
+    # An expired embedding is computed again
+    clock = FakeClock()
+    engine.query_cache = LRUCache(maxsize=8, ttl=60, clock=clock)
+    engine.encode_query("Arts program")
+    clock.now = 61
+    engine.encode_query("Arts program")
+    assert backend.encoded[2:] == ["Arts program", "Arts program"]
+    assert engine.query_cache_stats()["expirations"] == 1
+
+
+def test_near_duplicates_hit_only_with_the_same_schools():
+    cache = SemanticResponseCache(maxsize=8, threshold=0.95)
+    cache.store(unit(1, 0, 0), "spanish programs", SCHOOLS, "Hernandez has one.")
+
+    assert cache.lookup(unit(1, 0.1, 0), "which schools have spanish programs", SCHOOLS) == "Hernandez has one."
+    assert cache.lookup(unit(1, 0.1, 0), "which schools have spanish programs", frozenset({"Haynes EEC"})) is None
+    assert cache.lookup(unit(1, 1, 0), "what about french", SCHOOLS) is None
+    # Without an embedding only the same normalized text hits
+    assert cache.lookup(None, "spanish programs", SCHOOLS) == "Hernandez has one."
+    assert cache.lookup(None, "spanish program", SCHOOLS) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 3)
+    assert stats["hit_rate"] == pytest.approx(0.4)
+
+
+def test_eviction_expiry_and_in_place_updates():
+    clock = FakeClock()
+    cache = SemanticResponseCache(maxsize=2, ttl=10, threshold=0.95, clock=clock)
+    cache.store(unit(1, 0, 0), "a", SCHOOLS, "A")
+    cache.store(unit(0, 1, 0), "b", SCHOOLS, "B")
+    assert cache.lookup(unit(1, 0, 0), "a?", SCHOOLS) == "A"
+    cache.store(unit(0, 0, 1), "c", SCHOOLS, "C")
+
+    # "b" was least recently used; its row now holds "c"
+    assert len(cache) == 2 and cache.stats()["evictions"] == 1
+    assert cache.lookup(unit(0, 1, 0), "b?", SCHOOLS) is None
+    assert cache.lookup(unit(0, 0, 1), "c?", SCHOOLS) == "C"
+
+    # Storing the same text again replaces its embedding without taking another row
+    cache.store(unit(0, 1, 0), "c", SCHOOLS, "C2")
+    assert cache.lookup(unit(0, 0, 1), "c?", SCHOOLS) is None
+    assert cache.lookup(unit(0, 1, 0), "c?", SCHOOLS) == "C2"
+    assert len(cache) == 2 and cache.stats()["evictions"] == 1
+
+    clock.now = 11
+    assert cache.lookup(unit(1, 0, 0), "a?", SCHOOLS) is None
+    assert len(cache) == 1
+
+    cache.clear()
+    assert len(cache) == 0 and cache.stats()["invalidations"] == 1
+    cache.store(unit(1, 0), "other model", SCHOOLS, "D")
+    assert cache.lookup(unit(1, 0.05), "other model?", SCHOOLS) == "D"
+
+
+def test_chatbot_reuses_answers_until_the_index_changes(tmp_path):
+    chatbot = SchoolChatbot(index_dir=str(tmp_path), retrieval_mode="lexical")
+    chatbot.client = FakeInferenceClient()
+    question = "Which schools have Spanish programs in Roxbury?"
+
+    first = chatbot.get_response(question)
+    assert chatbot.get_response(question) == first
+    assert chatbot.client.calls == 1
+    assert chatbot.response_cache_stats()["hit_rate"] == pytest.approx(0.5)
+
+    chatbot.rag_engine.build_index()
+    chatbot.get_response(question)
+    assert chatbot.client.calls == 2
+    assert chatbot.response_cache_stats()["invalidations"] == 1
@@ -0,0 +1,91 @@
+"""
+Tests for bounded conversation memory and its use in SchoolChatbot.
+"""
+
+from src.benchmark import FakeInferenceClient
+from src.chat import SchoolChatbot
+from src.conversation import ConversationMemory, Turn, is_follow_up, normalize_history, summarize_turns
+
+
+class RecordingClient(FakeInferenceClient):
+    def text_generation(self, prompt, stream=False, **params):
+        self.prompts = getattr(self, "prompts", []) + [prompt]
+        return super().text_generation(prompt, stream=stream, **params)
+
+
+def as_messages(turns):
+    messages = []
+    for user, assistant in turns:
+        messages += [{"role": "user", "content": user}, {"role": "assistant", "content": assistant}]
+    return messages
+
+
+def test_normalize_history_accepts_messages_and_pairs():
+    messages = [
+        {"role": "user", "content": "Spanish programs?"},
+        {"role": "assistant", "content": [{"type": "text", "text": "The Hernandez School."}]},
+        {"role": "user", "content": "Where is it?"},
+    ]
+
+    assert normalize_history(messages) == [Turn("Spanish programs?", "The Hernandez School.")]
+    assert normalize_history([["Hi", "Hello!"]]) == [Turn("Hi", "Hello!")]
+    assert normalize_history(None) == []
+
+
+def test_follow_up_detection():
+    assert is_follow_up("Where is it located?")
+    assert is_follow_up("Do they offer bus service?")
+    assert not is_follow_up("Are there STEM schools in Dorchester?")
+
+
+def test_window_stays_bounded_and_summary_is_incremental():
+    summarized = []
+
+    def counting_summarize(previous, turns):
+        summarized.extend(turns)
+        return summarize_turns(previous, turns, max_lines=4)
+
+    memory = ConversationMemory(max_history_tokens=100, max_recent_turns=3, summarize=counting_summarize)
+    turns = []
+    sizes = []
+    for i in range(40):
+        conversation = memory.prepare(as_messages(turns))
+        sizes.append(len(conversation.render()))
+        message, response = f"Question number {i} about schools?", f"Answer number {i}. " + "detail " * 20
+        memory.remember(conversation, message, response, [f"School {i}"])
+        turns.append((message, response))
+
+    assert len(conversation.recent_turns) <= 3
+    assert len(conversation.summary.splitlines()) == 4
+    assert "Question number 36" in conversation.summary
+    # Each turn is summarized once, when it leaves the window
+    assert len(summarized) == len(set(summarized)) == conversation.summarized_turns
+    assert max(sizes[10:]) - min(sizes[10:]) < 50
+    assert conversation.schools == ["School 38", "School 37", "School 36"]
+
+
+def test_state_is_recovered_when_not_cached():
+    memory = ConversationMemory(max_history_tokens=10)
+    history = as_messages([("Spanish programs?", "Try the Hernandez K-8 School."), ("Thanks", "You're welcome.")])
+
+    conversation = memory.prepare(history, lambda text: ["Hernandez K-8 School"] if "Hernandez" in text else [])
+
+    assert conversation.schools == ["Hernandez K-8 School"]
+    assert conversation.summary.startswith("- User asked: Spanish programs?")
+
+
+def test_follow_up_uses_carried_schools_and_skips_response_cache(tmp_path):
+    chatbot = SchoolChatbot(index_dir=str(tmp_path), retrieval_mode="lexical")
+    chatbot.client = RecordingClient()
+    first = "Spanish programs in Jamaica Plain"
+
+    answer = chatbot.get_response(first)
+    first_schools = [doc.school_name for doc in chatbot.rag_engine.retrieve(first, top_k=3, auto_filter=True)]
+    chatbot.get_response("Where is it located?", as_messages([(first, answer)]))
+    # The same follow-up in a conversation is generated again, not served from the cache
+    chatbot.get_response("Where is it located?", as_messages([(first, answer)]))
+
+    prompt = chatbot.client.prompts[1]
+    assert first_schools[0] in prompt.split("# RETRIEVED_SCHOOLS")[1].split("\n")[1]
+    assert f"<|user|>\n{first}\n<|assistant|>\n{answer}\n" in prompt
+    assert chatbot.client.calls == 3
@@ -0,0 +1,104 @@
+"""
+Tests for the vectorized document construction in the RAG engine.
+
+The reference implementations below are the original row-by-row loops; the
+column-wise pipeline must produce exactly the same documents.
+"""
+
+import math
+import re
+
+import pandas as pd
+
+from src.chat import SchoolChatbot
+from src.rag_engine import SchoolDocument, build_school_documents, load_school_data
+
+
+def reference_documents(merged_df, program_columns):
+    documents = []
+    for _, row in merged_df.iterrows():
+        school_name = row["School Name"]
+        address = row["Address"] if "Address" in row else ""
+        zip_code = ""
+        neighborhood = ""
+        if address:
+            zip_match = re.search(r'MA\s+(\d{5})', address)
+            if zip_match:
+                zip_code = zip_match.group(1)
+            neighborhood_match = re.search(r'([A-Za-z\s]+),\s+MA', address)
+            if neighborhood_match:
+                neighborhood = neighborhood_match.group(1).strip()
+        programs_offered = [col for col in program_columns if row.get(col) == "Yes"]
+        content = f"{school_name} is a {row.get('School Type', 'N/A')} school serving grades {row.get('Grades Served', 'N/A')}."
+        if address:
+            content += f" Located at {address}."
+        if programs_offered:
+            readable_programs = [p.replace('_', ' ').title() for p in programs_offered]
+            content += f" Special programs include: {', '.join(readable_programs)}."
+        metadata = {
+            "grades": row.get("Grades Served", ""),
+            "type": row.get("School Type", ""),
+            "address": address,
+            "zip_code": zip_code,
+            "neighborhood": neighborhood,
+            "programs": programs_offered,
+            "phone": row.get("Phone Number", "") if "Phone Number" in row else "",
+            "email": row.get("Email Address", "") if "Email Address" in row else ""
+        }
+        documents.append(SchoolDocument(school_name, content, metadata))
+    return documents
+
+
+def reference_school_lines(merged_df, program_columns):
+    lines = []
+    for _, row in merged_df.iterrows():
+        programs_offered = [col for col in program_columns if row.get(col, "") == "Yes"]
+        programs_str = "Y" if programs_offered else "N"
+        lines.append(f'- {row["School Name"]}: {row["Grades Served"]}, {row["School Type"]}, {programs_str}')
+    return set(lines)
+
+
+def as_comparable(doc):
+    def normalize(value):
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        return value
+    metadata = {key: normalize(value) for key, value in doc.metadata.items()}
+    return (doc.school_name, doc.content, metadata)
+
+
+def test_documents_match_row_loop_on_bps_data():
+    merged_df, program_columns = load_school_data('BPS.csv', 'BPS-special-programs.csv')
+
+    expected = reference_documents(merged_df, program_columns)
+    actual = build_school_documents(merged_df, program_columns)
+
+    assert len(actual) == len(expected)
+    assert [as_comparable(d) for d in actual] == [as_comparable(d) for d in expected]
+
+
+def test_documents_match_row_loop_on_edge_cases():
+    merged_df = pd.DataFrame({
+        "School Name": ["A School", "B School", "C School"],
+        "Address": ["1 Main St. Jamaica Plain, MA 02130", "no zip here", ""],
+        "Phone Number": ["(617) 555-0100", None, "(617) 555-0102"],
+        "Grades Served": ["0 - 6", "9 - 12", "1 - 1"],
+        "School Type": ["Traditional", "Exam", None],
+        "dual_language": ["Yes", None, "No"],
+        "Inclusion": [None, "Yes", "Yes"],
+    })
+    program_columns = ["dual_language", "Inclusion", "Missing Column"]
+
+    expected = reference_documents(merged_df, program_columns)
+    actual = build_school_documents(merged_df, program_columns)
+
+    assert [as_comparable(d) for d in actual] == [as_comparable(d) for d in expected]
+
+
+def test_school_data_section_matches_row_loop():
+    merged_df, program_columns = load_school_data('BPS.csv', 'BPS-special-programs.csv')
+
+    section = SchoolChatbot.format_school_data('BPS.csv', 'BPS-special-programs.csv')
+
+    assert section.startswith("# SCHOOL_DATA\n")
+    assert set(section.split("\n")[1:]) == reference_school_lines(merged_df, program_columns)
@@ -0,0 +1,109 @@
+"""
+Tests for the embedding backends and lazy startup.
+
+A tiny randomly initialized BERT model is built on disk, so exporting it to
+ONNX and comparing backends needs no downloads.
+"""
+
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from src.embeddings import (EmbeddingBackend, OnnxEmbeddingBackend, SentenceTransformerBackend, compare_backends,
+                            export_onnx)
+from src.rag_engine import RAGEngine
+
+WORDS = ["school", "spanish", "program", "roxbury", "dorchester", "grades", "k2", "boston",
+         "is", "a", "in", "the", "serving", "located", "at", "public"]
+
+TEXTS = [
+    "Hernandez is a public school serving grades K2 in Roxbury.",
+    "A Spanish program in Dorchester.",
+    "Boston",
+    "",
+]
+
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    model_dir = tmp_path_factory.mktemp("tiny-bert")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS
+    (model_dir / "vocab.txt").write_text("\n".join(vocab) + "\n")
+    BertTokenizerFast(vocab_file=str(model_dir / "vocab.txt")).save_pretrained(model_dir)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=64, max_position_embeddings=64)
+    BertModel(config).save_pretrained(model_dir)
+
+    transformer = models.Transformer(str(model_dir), max_seq_length=64)
+    pooling = models.Pooling(config.hidden_size, pooling_mode="mean")
+    return SentenceTransformer(modules=[transformer, pooling, models.Normalize()], device="cpu")
+
+
+@pytest.fixture(scope="module")
+def onnx_dir(tiny_model, tmp_path_factory):
+    output_dir = tmp_path_factory.mktemp("onnx")
+    export_onnx("tiny-bert", str(output_dir), model=tiny_model)
+    return str(output_dir)
+
+
+@pytest.mark.parametrize("quantized, tolerance", [(False, 1e-4), (True, 0.1)])
+def test_onnx_backend_matches_sentence_transformers(tiny_model, onnx_dir, quantized, tolerance):
+    reference = SentenceTransformerBackend("tiny-bert", model=tiny_model)
+    candidate = OnnxEmbeddingBackend(onnx_dir, quantized=quantized)
+
+    report = compare_backends(reference, candidate, TEXTS)
+
+    assert report["max_abs_diff"] < tolerance
+    assert report["min_cosine"] > 1 - tolerance
+
+
+def test_onnx_backend_loads_lazily_and_batches(onnx_dir):
+    assert OnnxEmbeddingBackend(onnx_dir).model_id == "onnx-int8:tiny-bert"
+    # The float32 model, because dynamic int8 quantization scales activations per batch
+    backend = OnnxEmbeddingBackend(onnx_dir, quantized=False, batch_size=3)
+    assert not backend.is_loaded
+
+    embeddings = backend.encode(TEXTS)
+
+    assert backend.is_loaded
+    assert embeddings.shape == (len(TEXTS), 32) and embeddings.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1.0, rtol=1e-5)
+    np.testing.assert_allclose(backend.encode(TEXTS[1:2])[0], embeddings[1], atol=1e-5)
+
+
+def test_incomplete_backend_fails_when_constructed():
+    class NoEncode(EmbeddingBackend):
+        model_id = "no-encode"
+
+        def _load(self):
+            pass
+
+    with pytest.raises(TypeError, match="_encode"):
+        NoEncode()
+
+
+def test_engine_defers_model_loading_until_warm_up(onnx_dir, tmp_path):
+    engine = RAGEngine(embedding_model=OnnxEmbeddingBackend(onnx_dir), retrieval_mode="dense")
+    engine.process_school_data()
+    engine.build_index(str(tmp_path / "school_rag"))
+
+    loaded = RAGEngine(embedding_model=OnnxEmbeddingBackend(onnx_dir), retrieval_mode="dense")
+    assert loaded.load_or_build(str(tmp_path / "school_rag")) == "loaded"
+    assert not loaded.embedding_model.is_loaded
+
+    loaded.warm_up()
+
+    assert loaded.embedding_model.is_loaded
+    assert loaded.retrieve("Spanish program in Dorchester", top_k=2)
+
+
+def test_importing_engine_does_not_import_heavy_dependencies():
+    code = ("import sys, src.rag_engine, src.chat; "
+            "print(sorted(m for m in ('torch', 'faiss', 'pandas', 'sentence_transformers') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
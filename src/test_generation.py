@@ -0,0 +1,166 @@
+"""
+Tests for the local generation backend, with a tiny randomly initialized
+Llama model and a tokenizer trained on the prompt text, so nothing is
+downloaded.
+"""
+
+import asyncio
+
+import pytest
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors, trainers
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+from src.benchmark import load_labeled_queries
+from src.chat import SchoolChatbot
+from src.generation import GQA_ATTENTION, AsyncLocalClient, LocalGenerator, create_generation_clients
+from src.prompt import PromptTemplate
+
+PREFIX = PromptTemplate().static_prefix
+
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=400, special_tokens=["<pad>", "<s>", "</s>"],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator([PREFIX] + [item["query"] for item in load_labeled_queries()], trainer)
+    tokenizer.post_processor = processors.TemplateProcessing(single="<s> $A", special_tokens=[("<s>", 1)])
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>",
+                                        pad_token="<pad>")
+
+    torch.manual_seed(0)
+    config = LlamaConfig(vocab_size=len(tokenizer), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=4096,
+                         bos_token_id=1, eos_token_id=2, pad_token_id=0)
+    return LlamaForCausalLM(config).eval(), tokenizer
+
+
+def reference(model, tokenizer, ids, max_new_tokens):
+    with torch.inference_mode():
+        output = model.generate(torch.tensor([ids]), attention_mask=torch.ones((1, len(ids)), dtype=torch.long),
+                                max_new_tokens=max_new_tokens, do_sample=False, repetition_penalty=1.1)
+    return tokenizer.decode(output[0, len(ids):], skip_special_tokens=True)
+
+
+def test_batched_decodes_from_the_prefix_cache_match_generate(tiny_model):
+    model, tokenizer = tiny_model
+    generator = LocalGenerator("tiny", prefix=lambda: PREFIX, batch_wait_ms=200, model=model, tokenizer=tokenizer)
+    suffixes = ["<|user|>\nWhat is a pilot school?\n<|assistant|>\n",
+                "# RETRIEVED_SCHOOLS\n1. Haynes Early Education Center\n<|user|>\nWhere is it?\n<|assistant|>\n",
+                "<|user|>\nK2 in Roxbury\n<|assistant|>\n"]
+    params = {"max_new_tokens": 12, "do_sample": False, "repetition_penalty": 1.1}
+
+    requests = [generator.submit(PREFIX + suffix, params) for suffix in suffixes]
+    requests.append(generator.submit("No shared prefix here", params))
+    answers = [request.done.result(timeout=60) for request in requests]
+
+    prefix_ids = tokenizer(PREFIX)["input_ids"]
+    for suffix, answer in zip(suffixes, answers):
+        ids = prefix_ids + tokenizer(suffix, add_special_tokens=False)["input_ids"]
+        assert answer == reference(model, tokenizer, ids, 12)
+    assert answers[-1] == reference(model, tokenizer, tokenizer("No shared prefix here")["input_ids"], 12)
+
+    stats = generator.stats()
+    assert stats["batches"] == 1 and stats["average_batch_size"] == 4
+    assert stats["prefix_builds"] == 1 and stats["prefix_reuses"] == 3 and stats["prefix_tokens"] == len(prefix_ids)
+    generator.close()
+
+
+def test_requests_join_a_running_batch(tiny_model):
+    model, tokenizer = tiny_model
+    generator = LocalGenerator("tiny", prefix=lambda: PREFIX, batch_wait_ms=0, model=model, tokenizer=tokenizer)
+    params = {"max_new_tokens": 4, "do_sample": False, "repetition_penalty": 1.1}
+    suffixes = ["<|user|>\nWhat is a pilot school?\n<|assistant|>\n", "<|user|>\nK2 in Roxbury\n<|assistant|>\n"]
+    joining = []
+    finished = []
+
+    def emit(piece):
+        # Queued while the first request is decoding, from the decoding thread itself
+        if isinstance(piece, str) and not joining:
+            for suffix in suffixes:
+                joining.append(generator.submit(PREFIX + suffix, params))
+                joining[-1].done.add_done_callback(lambda _: finished.append("joined"))
+
+    first = generator.submit("No shared prefix here", dict(params, max_new_tokens=24), emit)
+    first.done.add_done_callback(lambda _: finished.append("first"))
+    answer = first.done.result(timeout=60)
+    answers = [request.done.result(timeout=60) for request in joining]
+
+    # The later requests finished while the first one was still decoding
+    assert finished == ["joined", "joined", "first"]
+    assert answer == reference(model, tokenizer, tokenizer("No shared prefix here")["input_ids"], 24)
+    prefix_ids = tokenizer(PREFIX)["input_ids"]
+    for suffix, joined in zip(suffixes, answers):
+        ids = prefix_ids + tokenizer(suffix, add_special_tokens=False)["input_ids"]
+        assert joined == reference(model, tokenizer, ids, 4)
+    stats = generator.stats()
+    assert (stats["batches"], stats["joined"], stats["requests"]) == (1, 2, 3)
+    generator.close()
+
+
+def test_only_loaded_models_switch_attention(tiny_model, tmp_path):
+    model, tokenizer = tiny_model
+    model.save_pretrained(tmp_path)
+    tokenizer.save_pretrained(tmp_path)
+    generator = LocalGenerator(str(tmp_path), prefix=lambda: PREFIX)
+    generator.load()
+
+    assert generator.model.config._attn_implementation == GQA_ATTENTION
+    assert model.config._attn_implementation == "sdpa"
+    # Padded rows need a mask, which takes the shared key/value head path
+    suffix = "<|user|>\nWhat is a pilot school?\n<|assistant|>\n"
+    params = {"max_new_tokens": 8, "do_sample": False, "repetition_penalty": 1.1}
+    requests = [generator.submit(PREFIX + suffix, params), generator.submit("No shared prefix here", params)]
+    answers = [request.done.result(timeout=60) for request in requests]
+    generator.close()
+
+    ids = tokenizer(PREFIX)["input_ids"] + tokenizer(suffix, add_special_tokens=False)["input_ids"]
+    assert answers == [reference(model, tokenizer, ids, 8),
+                       reference(model, tokenizer, tokenizer("No shared prefix here")["input_ids"], 8)]
+
+
+def test_streams_sampling_and_errors(tiny_model):
+    model, tokenizer = tiny_model
+    generator = LocalGenerator("tiny", prefix=lambda: PREFIX, model=model, tokenizer=tokenizer)
+    prompt = PREFIX + "<|user|>\nIs there a bus for K1?\n<|assistant|>\n"
+    sampled = {"max_new_tokens": 16, "do_sample": True, "temperature": 0.7, "top_k": 50, "top_p": 0.9, "seed": 7}
+
+    whole = generator.text_generation(prompt, **sampled)
+    assert "".join(generator.text_generation(prompt, stream=True, **sampled)) == whole
+
+    async def run_async():
+        client = AsyncLocalClient(generator)
+        text = await client.text_generation(prompt, **sampled)
+        stream = await client.text_generation(prompt, stream=True, **sampled)
+        return text, "".join([piece async for piece in stream])
+
+    assert asyncio.run(run_async()) == (whole, whole)
+    assert generator.stats()["prefix_builds"] == 1
+
+    with pytest.raises(ValueError, match="no room"):
+        generator.text_generation(PREFIX + "school " * 5000)
+    with pytest.raises(TypeError):
+        generator.text_generation(prompt, best_of=2)
+    generator.close()
+
+
+def test_chatbot_generates_locally(tiny_model, tmp_path):
+    model, tokenizer = tiny_model
+    chatbot = SchoolChatbot(index_dir=str(tmp_path), retrieval_mode="lexical")
+    chatbot.client = LocalGenerator("tiny", prefix=lambda: chatbot.prompt_template.static_prefix, model=model,
+                                    tokenizer=tokenizer)
+    chatbot.async_client = AsyncLocalClient(chatbot.client)
+
+    assert isinstance(chatbot.get_response("Which schools have Spanish programs in Roxbury?"), str)
+    asyncio.run(chatbot.aget_response("What is a pilot school?"))
+    assert chatbot.client.stats()["prefix_reuses"] == 2 and chatbot.client.stats()["prefix_builds"] == 1
+
+    with pytest.raises(ValueError, match="Unknown generation backend"):
+        create_generation_clients("gpu", "tiny")
+    client, async_client = create_generation_clients("local", "tiny")
+    assert not client.is_loaded and async_client.generator is client
+    chatbot.client.close()
+    client.close()
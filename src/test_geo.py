@@ -0,0 +1,84 @@
+"""
+Tests for proximity search over school locations. Uses the lexical mode, which
+needs no embedding model.
+"""
+
+import pytest
+
+from src.chat import SchoolChatbot
+from src.geo import LocationTable, haversine_miles
+from src.rag_engine import RAGEngine
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = RAGEngine(retrieval_mode="lexical")
+    engine.process_school_data()
+    engine.build_index()
+    return engine
+
+
+def brute_force(engine, point):
+    table = engine.location_table
+    distances = []
+    for doc in engine.documents:
+        school_point = table.school_point(doc.school_name, doc.metadata)
+        if school_point is not None:
+            distances.append((haversine_miles(point, school_point), doc.school_name))
+    return sorted(distances)
+
+
+def test_resolve_locations():
+    table = LocationTable.load()
+
+    assert table.resolve("schools in 02124")[0] == "02124"
+    assert table.resolve("near Jamaica Plain")[0] == "Jamaica Plain"
+    assert table.resolve("in JP") == ("Jamaica Plain", table.neighborhoods["Jamaica Plain"])
+    assert table.resolve("West Roxbury")[0] == "West Roxbury"
+    assert table.resolve("42.3, -71.1")[1] == (42.3, -71.1)
+    assert table.resolve("somewhere else") is None
+    assert 2 < haversine_miles(table.zips["02130"], table.zips["02124"]) < 4
+
+
+def test_nearest_matches_brute_force(engine):
+    point = engine.location_table.zips["02125"]
+
+    nearby = engine.retrieve_nearby("02125", 10)
+
+    miles = [distance for _, distance in nearby]
+    assert len(nearby) == 10 and miles == sorted(miles)
+    assert miles == pytest.approx([distance for distance, _ in brute_force(engine, point)[:10]])
+
+
+def test_radius_and_filters(engine):
+    point = engine.location_table.neighborhoods["Roxbury"]
+    expected = {name for distance, name in brute_force(engine, point) if distance <= 1.5}
+
+    within = engine.retrieve_nearby("Roxbury", 1.5)
+    high_schools = engine.retrieve_nearby("Roxbury", 3, grade=10)
+
+    assert {doc.school_name for doc, _ in within} == expected
+    assert all(distance <= 1.5 for _, distance in within)
+    assert len(high_schools) == 3
+    allowed = {engine.documents[position].school_name for position in engine.metadata_index.select(grade=10)}
+    assert {doc.school_name for doc, _ in high_schools} <= allowed
+    with pytest.raises(ValueError):
+        engine.retrieve_nearby("Atlantis", 3)
+
+
+def test_context_reports_distances(engine):
+    query = "Elementary schools near 02130"
+    docs = [doc for doc, _ in engine.retrieve_nearby("02122", 2)]
+    context = engine.format_retrieved_context(docs, engine.distances_from(query, docs))
+
+    assert context.count("Area distance from 02130: about") == 2
+    assert "Do not use them to decide bus eligibility" in context
+    assert engine.distances_from("What is a pilot school?", []) is None
+
+
+def test_transportation_questions_get_no_distances(tmp_path):
+    chatbot = SchoolChatbot(index_dir=str(tmp_path), retrieval_mode="lexical")
+
+    assert "Area distance from 02130" in chatbot.format_prompt("Elementary schools near 02130")
+    prompt = chatbot.format_prompt("Can my 3rd grader take the bus from 02130 to these schools?")
+    assert "Area distance" not in prompt
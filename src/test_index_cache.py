@@ -0,0 +1,125 @@
+"""
+Tests for the on-disk index cache: which changes force a rebuild, and that
+readers only ever see a complete generation. Embeddings come from the
+hashing backend in src/testing.py, so no model is downloaded.
+"""
+
+import json
+import shutil
+
+import pytest
+
+import src.rag_engine as rag_engine
+from src.rag_engine import RAGEngine
+from src.testing import HashingBackend
+
+SCHOOL = "Adams Elementary School"
+
+
+class OtherHashingBackend(HashingBackend):
+    @property
+    def model_id(self):
+        return "hashing-test-v2"
+
+
+@pytest.fixture
+def data(tmp_path):
+    for name in ("BPS.csv", "BPS-special-programs.csv"):
+        shutil.copy(name, tmp_path / name)
+    return str(tmp_path / "BPS.csv"), str(tmp_path / "BPS-special-programs.csv"), str(tmp_path / "index" / "rag")
+
+
+def engine(backend=None):
+    return RAGEngine(embedding_model=backend or HashingBackend(), retrieval_mode="dense")
+
+
+def content(engine, name):
+    return next(doc.content for doc in engine.documents if doc.school_name == name)
+
+
+def test_unchanged_data_loads_and_changes_rebuild(data, monkeypatch):
+    school_csv, programs_csv, index_path = data
+    assert engine().load_or_build(index_path, school_csv, programs_csv) == "built"
+    assert engine().load_or_build(index_path, school_csv, programs_csv) == "loaded"
+
+    with open(school_csv, encoding="utf-8") as f:
+        text = f.read()
+    with open(school_csv, "w", encoding="utf-8") as f:
+        f.write(text.replace("165 Webster St.", "170 Webster St."))
+    edited = engine()
+    assert edited.load_or_build(index_path, school_csv, programs_csv) == "updated"
+    assert "170 Webster St." in content(edited, SCHOOL)
+    assert engine().load_or_build(index_path, school_csv, programs_csv) == "loaded"
+
+    assert engine(OtherHashingBackend()).load_or_build(index_path, school_csv, programs_csv) == "built"
+    assert RAGEngine.read_manifest(index_path)["model_id"].startswith("hashing-test-v2")
+
+    monkeypatch.setattr(rag_engine, "DOCUMENT_BUILDER_VERSION", rag_engine.DOCUMENT_BUILDER_VERSION + 1)
+    rebuilt = engine(OtherHashingBackend())
+    assert rebuilt.load_or_build(index_path, school_csv, programs_csv) == "built"
+    assert RAGEngine.read_manifest(index_path)["builder_version"] == rag_engine.DOCUMENT_BUILDER_VERSION
+
+
+def test_half_written_generation_is_never_loaded(data, monkeypatch):
+    school_csv, programs_csv, index_path = data
+    original = engine()
+    original.load_or_build(index_path, school_csv, programs_csv)
+    first = RAGEngine.read_manifest(index_path)
+
+    # Crash after the new generation's data files are written but before the manifest is replaced
+    atomic_write = rag_engine._atomic_write
+
+    def crash_on_manifest(path, write_fn):
+        if path.endswith("_manifest.json"):
+            raise OSError("disk full")
+        atomic_write(path, write_fn)
+
+    monkeypatch.setattr(rag_engine, "_atomic_write", crash_on_manifest)
+    changed = engine()
+    changed.documents = original.documents[:-1]
+    changed.build_index()
+    with pytest.raises(OSError):
+        changed.save_index(index_path)
+    monkeypatch.undo()
+
+    assert RAGEngine.read_manifest(index_path) == first
+    loaded = engine()
+    assert loaded.load_or_build(index_path, school_csv, programs_csv) == "loaded"
+    assert len(loaded.documents) == first["num_documents"] == len(original.documents)
+
+    # A torn manifest is treated as missing, and the index is rebuilt
+    with open(f"{index_path}_manifest.json", "w", encoding="utf-8") as f:
+        f.write(json.dumps(first)[:40])
+    assert RAGEngine.read_manifest(index_path) is None
+    assert engine().load_or_build(index_path, school_csv, programs_csv) == "built"
+
+
+def test_update_index_applies_edits_additions_and_removals(data):
+    school_csv, programs_csv, index_path = data
+    hybrid = RAGEngine(embedding_model=HashingBackend(), retrieval_mode="hybrid")
+    hybrid.load_or_build(index_path, school_csv, programs_csv)
+    total = len(hybrid.documents)
+
+    with open(school_csv, encoding="utf-8") as f:
+        lines = f.read().splitlines(keepends=True)
+    lines = [line.replace("165 Webster St.", "170 Webster St.") for line in lines
+             if not line.startswith("Bates Elementary School,")]
+    lines.append('Zephyr Harbor Academy,"1 Harbor Way Dorchester, MA 02125",(617) 635-0000,'
+                 'zephyr@bostonpublicschools.org,6 - 8,Innovation\n')
+    with open(school_csv, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+    stats = hybrid.update_index(school_csv, programs_csv, save_path=index_path)
+    assert stats == {"added": 1, "changed": 1, "removed": 1, "unchanged": total - 2}
+    assert len(hybrid.documents) == hybrid.faiss_index.ntotal == total
+
+    assert "170 Webster St." in content(hybrid, SCHOOL)
+    assert "Bates Elementary School" not in {doc.school_name for doc in hybrid.documents}
+    assert hybrid.retrieve("Zephyr Harbor Academy", top_k=1)[0].school_name == "Zephyr Harbor Academy"
+    assert all(doc.school_name != "Bates Elementary School" for doc in hybrid.retrieve("Bates Elementary", top_k=5))
+
+    # The vectors were replaced too: the edited text is its own nearest neighbour
+    dense = RAGEngine(embedding_model=HashingBackend(), retrieval_mode="dense")
+    assert dense.load_or_build(index_path, school_csv, programs_csv) == "loaded"
+    assert dense.retrieve(content(dense, SCHOOL), top_k=1)[0].school_name == SCHOOL
+    assert "170 Webster St." in dense.retrieve("Adams 170 Webster St. East Boston", top_k=1)[0].content
@@ -0,0 +1,80 @@
+"""
+Tests for the rule table and the intent router's fast path. Uses the lexical
+mode, which needs no embedding model.
+"""
+
+import datetime
+
+import pytest
+
+from src.benchmark import FakeInferenceClient
+from src.chat import SchoolChatbot
+from src.intent_router import IntentRouter, parse_birth_period
+from src.rag_engine import RAGEngine
+from src.rules import RuleTable
+
+
+@pytest.fixture(scope="module")
+def router():
+    engine = RAGEngine(retrieval_mode="lexical")
+    engine.process_school_data()
+    engine.build_index()
+    return IntentRouter(RuleTable.load(), engine)
+
+
+def test_rule_table_matches_source_text():
+    rules = RuleTable.load()
+
+    assert rules.cutoff_date == datetime.date(2025, 9, 1)
+    assert rules.grade_for_birth_date(datetime.date(2020, 9, 1)) == 0
+    assert rules.grade_for_birth_date(datetime.date(2020, 9, 2)) == -1
+    assert rules.grade_for_birth_date(datetime.date(2008, 1, 1)) == 12
+    assert rules.grade_for_birth_date(datetime.date(2023, 1, 1)) is None
+    assert [rules.transportation_for_grade(level).min_miles for level in (-2, 0, 5, 6, 8)] == [0.75, 1, 1, 1.5, 1.5]
+    assert rules.transportation_for_grade(10).min_miles is None
+    assert parse_birth_period("born 3/15/2020")[0] == datetime.date(2020, 3, 15)
+    assert parse_birth_period("born in May 2019")[1] == datetime.date(2019, 5, 31)
+    assert parse_birth_period("born in 2019 or 2020") is None
+
+
+def test_deterministic_questions_are_answered(router):
+    assert "enters K2" in router.route("What grade will my daughter born March 3, 2020 be in?").text
+    year_only = router.route("My son was born in 2020, what grade does he start?").text
+    assert "K2 if born on or before September 1, 2020" in year_only and "K1 if born after" in year_only
+    assert "too young" in router.route("Born 2023-01-05, can she enroll in K0?").text
+    assert "Yes." in router.route("Does a 7th grade student get the bus if we live 2 miles away?").text
+    assert "No." in router.route("Is my kindergarten child eligible for the bus at 0.8 miles?").text
+    assert "and 1 mile is within" in router.route("Does a 7th grade student get the bus at 1 mile?").text
+    assert "MBTA pass" in router.route("Does a grade 10 student get bus transportation?").text
+
+    listing = router.route("Which schools serve 9th grade in JP?")
+    assert listing.intent == "schools_for_grade"
+    assert listing.schools and "Margarita Muniz Academy" in listing.schools
+    assert all(line.endswith("Jamaica Plain)") for line in listing.text.splitlines()[1:])
+
+
+def test_other_questions_fall_through(router):
+    for question in [
+        "What is a pilot school?",
+        "Which schools have Spanish programs for K2?",
+        "What are the best schools for 3rd grade in Dorchester?",
+        "When does the bus arrive for grade 3?",
+        "Does a 3rd grader at Mason Elementary School get a bus?",
+        "My twins were born in 2019 and 2020, what grades?",
+    ]:
+        assert router.route(question) is None, question
+
+
+def test_chatbot_skips_the_model_on_the_fast_path(tmp_path):
+    chatbot = SchoolChatbot(index_dir=str(tmp_path), retrieval_mode="lexical")
+    chatbot.client = FakeInferenceClient()
+
+    answer = chatbot.get_response("What grade is a 5 year old in?")
+    streamed = "".join(chatbot.get_response_stream("Is there a bus for K1?"))
+    chatbot.get_response("What is a pilot school?")
+
+    assert "enters K2" in answer and "0.75 miles" in streamed
+    assert chatbot.client.calls == 1
+    stats = chatbot.intent_router_stats()
+    assert stats["fast_path_rate"] == pytest.approx(2 / 3)
+    assert stats["by_intent"] == {"grade_for_age": 1, "bus_eligibility": 1}
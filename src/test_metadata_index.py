@@ -0,0 +1,62 @@
+"""
+Tests for filter extraction and filtered search. Uses the lexical mode, which
+needs no embedding model.
+"""
+
+import pytest
+
+from src.metadata_index import canonical_neighborhood, grade_filter, parse_grade, parse_grade_range
+from src.rag_engine import RAGEngine
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = RAGEngine(retrieval_mode="lexical")
+    engine.process_school_data()
+    engine.build_index()
+    return engine
+
+
+def serves(doc, level):
+    grade_range = parse_grade_range(doc.metadata.get("grades"))
+    return grade_range is not None and grade_range[0] <= level <= grade_range[1]
+
+
+def test_grade_parsing():
+    assert [parse_grade(text) for text in ["K0", "k1", "K2", "pre-k", "3rd grade", "grade 12", "Seventh grade", "7"]] \
+        == [-2, -1, 0, -1, 3, 12, 7, 7]
+    # Zeros and numbers outside 1-12 in unrelated text are not grades
+    for text in ["0", "grade 0", "Grade 05", "grade 13", "We live at 10 K 0 Street", "K-8 schools", "0.8 miles"]:
+        assert parse_grade(text) is None, text
+    assert grade_filter("Kindergarten options in Dorchester") == [-2, -1, 0]
+    assert grade_filter("pre-kindergarten seats") == [-2, -1]
+    assert grade_filter("K2 seats") == 0
+    assert grade_filter("What is a pilot school?") is None
+
+
+def test_extract_filters(engine):
+    extract = engine.metadata_index.extract_filters
+
+    assert extract("schools in jp near 02130 for 3rd grade") == {
+        "zip_code": ["02130"], "neighborhood": ["Jamaica Plain"], "grade": 3}
+    assert extract("Inclusion programs in West Roxbury for kindergarten") == {
+        "neighborhood": ["West Roxbury"], "grade": [-2, -1, 0], "program": ["Inclusion"]}
+    assert extract("Special admission schools for grade 7") == {"grade": 7, "program": ["Special Admission Schools"]}
+    # Program names match whole words only
+    assert "program" not in extract("Is there an inclusive school in Roxbury?")
+    assert extract("What is a pilot school?") == {}
+
+
+def test_filtered_search_returns_only_matching_schools(engine):
+    docs = engine.retrieve("schools in Roxbury", top_k=10, grade="K1", neighborhood="Roxbury")
+    assert docs
+    assert all(serves(doc, -1) and canonical_neighborhood(doc.metadata["neighborhood"]) == "Roxbury" for doc in docs)
+
+    docs = engine.retrieve("schools near 02130 for 3rd grade", top_k=10, auto_filter=True)
+    assert docs and all(doc.metadata["zip_code"] == "02130" and serves(doc, 3) for doc in docs)
+
+    docs = engine.retrieve("kindergarten in Dorchester", top_k=10, auto_filter=True)
+    assert docs and all(any(serves(doc, level) for level in (-2, -1, 0)) for doc in docs)
+
+    docs = engine.retrieve("Inclusion schools", top_k=10, auto_filter=True)
+    assert docs and all("Inclusion" in doc.metadata["programs"] for doc in docs)
@@ -0,0 +1,76 @@
+"""
+Tests for the prompt template's token budget and static prefix, with a
+whitespace tokenizer so no model is downloaded.
+"""
+
+import os
+
+from src.prompt import PromptTemplate
+
+DOCS = [f"{number}. School number {number} offers a program" for number in range(1, 6)]
+
+
+class WhitespaceTokenizer:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, add_special_tokens=True):
+        self.calls += 1
+        return text.split()
+
+
+def format_context(docs):
+    return "# RETRIEVED_SCHOOLS\n" + "\n".join(docs)
+
+
+def prompt_tokens(template, docs, question):
+    return len(template.render(question, docs, format_context).split())
+
+
+def test_least_relevant_documents_are_dropped_to_fit_the_budget(tmp_path):
+    cutoffs = tmp_path / "age_cutoffs.txt"
+    cutoffs.write_text("# AGE_CUTOFFS\nK2: 5 by September 1\n", encoding="utf-8")
+    question = "Which schools have a program?"
+    unlimited = PromptTemplate(str(cutoffs), tokenizer=WhitespaceTokenizer())
+    assert unlimited.fit_documents(question, DOCS * 100, format_context) == DOCS * 100
+    assert unlimited.tokenizer.calls == 0
+
+    budget = prompt_tokens(unlimited, DOCS[:3], question)
+    template = PromptTemplate(str(cutoffs), max_prompt_tokens=budget, tokenizer=WhitespaceTokenizer())
+    assert template.fit_documents(question, DOCS, format_context) == DOCS[:3]
+    assert template.render(question, DOCS, format_context) == unlimited.render(question, DOCS[:3], format_context)
+
+    template.max_prompt_tokens = budget - 1
+    assert template.fit_documents(question, DOCS, format_context) == DOCS[:2]
+    template.max_prompt_tokens = 1
+    assert template.fit_documents(question, DOCS, format_context) == []
+
+
+def test_prefix_and_its_token_count_follow_the_age_cutoff_file(tmp_path):
+    cutoffs = tmp_path / "age_cutoffs.txt"
+    cutoffs.write_text("# AGE_CUTOFFS\nK2: 5 by September 1\n", encoding="utf-8")
+    tokenizer = WhitespaceTokenizer()
+    question = "Which schools have a program?"
+    budget = prompt_tokens(PromptTemplate(str(cutoffs)), DOCS[:3], question)
+    template = PromptTemplate(str(cutoffs), max_prompt_tokens=budget, tokenizer=tokenizer)
+
+    first = template.static_prefix
+    assert "5 by September 1" in first and template.static_prefix is first
+    assert len(template.fit_documents(question, DOCS, format_context)) == 3
+    # The prefix is counted once, not per request
+    calls = tokenizer.calls
+    template.fit_documents(question, DOCS, format_context)
+    assert tokenizer.calls - calls == calls - 1
+
+    # Same size, new mtime: rebuilt and recounted
+    stat = os.stat(cutoffs)
+    cutoffs.write_text("# AGE_CUTOFFS\nK2: 6 by September 1\n", encoding="utf-8")
+    os.utime(cutoffs, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert "6 by September 1" in template.static_prefix
+
+    # Longer file, same mtime: the bigger prefix leaves room for fewer schools
+    stat = os.stat(cutoffs)
+    cutoffs.write_text("# AGE_CUTOFFS\nK2: 6 by September 1, or 5 with a waiver\n", encoding="utf-8")
+    os.utime(cutoffs, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert len(template.fit_documents(question, DOCS, format_context)) == 2
+    assert "with a waiver" in template.static_prefix
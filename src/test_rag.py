@@ -3,21 +3,26 @@ Test script for the RAG-based Boston Schools Chatbot
 
 This script provides a simple way to test the RAG functionality
 by asking questions and showing both the retrieved documents
-and the final model response.
+and the final model response. To answer a whole file of questions with one
+loaded chatbot, use python -m src.batch instead.
 """
 
+from src.benchmark import FakeInferenceClient
 from src.chat import SchoolChatbot
 import argparse
 
-def test_rag_chatbot(query):
+def test_rag_chatbot(query, offline=False):
     """
     Test the RAG-based chatbot with a specific query.
     
     Args:
         query (str): The question to ask the chatbot
+        offline (bool): Answer with a fixed stand-in reply instead of calling the model
     """
     print(f"Initializing chatbot with RAG capability...")
     chatbot = SchoolChatbot()
+    if offline:
+        chatbot.client = FakeInferenceClient()
     
     print("\n" + "="*50)
     print(f"QUERY: {query}")
@@ -49,9 +54,11 @@ def main():
     parser.add_argument("--query", type=str, 
                         default="My child is starting kindergarten and we live in Jamaica Plain. What are our options?",
                         help="The question to ask the chatbot")
+    parser.add_argument("--offline", action="store_true",
+                        help="Answer with a fixed stand-in reply instead of calling the model")
     
     args = parser.parse_args()
-    test_rag_chatbot(args.query)
+    test_rag_chatbot(args.query, args.offline)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""
+Tests for scored retrieval, adaptive k and the deduplicated context.
+
+Embeddings come from the hashing backend in src/testing.py, so no model is
+downloaded.
+"""
+
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from src.prompt import approximate_tokens
+from src.rag_engine import AdaptiveK, RAGEngine
+from src.testing import HashingBackend
+
+QUERY = "Spanish dual language programs in Roxbury"
+
+
+@pytest.fixture(scope="module", params=["dense", "hybrid", "lexical"])
+def engine(request):
+    engine = RAGEngine(embedding_model=HashingBackend(), retrieval_mode=request.param)
+    engine.process_school_data()
+    engine.build_index()
+    return engine
+
+
+def test_scores_are_cosine_or_relative_bm25(engine):
+    scored = engine.retrieve_scored(QUERY, top_k=5)
+    scores = [score for _, score in scored]
+
+    assert len(scored) == 5
+    if engine.retrieval_mode == "lexical":
+        assert scores[0] == pytest.approx(1.0) and all(0 <= score <= 1 for score in scores)
+        return
+    query = engine.embedding_model.encode([QUERY])[0]
+    expected = engine.embedding_model.encode([doc.content for doc, _ in scored]) @ query
+    np.testing.assert_allclose(scores, expected, atol=1e-5)
+    if engine.retrieval_mode == "dense":
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_adaptive_k_keeps_confident_distinct_schools(engine):
+    fixed = engine.retrieve(QUERY, top_k=6)
+    adaptive = engine.retrieve_scored(QUERY, top_k=6, adaptive=AdaptiveK(threshold=0.3, gap=0.15))
+    names = [doc.school_name for doc, _ in adaptive]
+    best = adaptive[0][1]
+
+    assert 1 <= len(adaptive) <= 6 and len(set(names)) == len(names)
+    assert all(score >= 0.3 and best - score <= 0.15 for _, score in adaptive[1:])
+    budgeted = engine.retrieve(QUERY, top_k=6, adaptive=AdaptiveK(min_k=2, threshold=0.0, gap=1.0, max_tokens=1))
+    assert [doc.school_name for doc in budgeted] == [doc.school_name for doc in fixed[:2]]
+
+
+def test_context_lists_each_school_once(engine):
+    counts = Counter(doc.school_name for doc in engine.documents)
+    name = next(name for name, count in counts.items() if count > 1)
+    docs = [doc for doc in engine.documents if doc.school_name == name]
+
+    context = engine.format_retrieved_context(docs)
+    assert context.count(name) == 1
+    other = set(docs[1].metadata.get("programs", [])) - set(docs[0].metadata.get("programs", []))
+    if other:
+        assert "Also offers: " in context and all(program in context for program in other)
+
+
+def test_min_k_zero_and_token_budget_cutoff(engine):
+    kept = engine.retrieve_scored("Hernandez", top_k=3, adaptive=AdaptiveK(min_k=0))
+    assert all(score >= 0.3 for _, score in kept)
+    assert engine.retrieve_scored("Hernandez", top_k=3, adaptive=AdaptiveK(min_k=0, threshold=2.0)) == []
+
+    loose = AdaptiveK(threshold=None, gap=None)
+    ranked = [doc for doc, _ in engine.retrieve_scored(QUERY, top_k=4, adaptive=loose)]
+    assert len(ranked) == 4
+    # Room for exactly the first two entries: the third is cut off by the budget
+    budget = sum(approximate_tokens(engine._format_entry(number, doc)) for number, doc in enumerate(ranked[:2], 1))
+    budgeted = engine.retrieve(QUERY, top_k=4, adaptive=AdaptiveK(threshold=None, gap=None, max_tokens=budget))
+    assert budgeted == ranked[:2]
+
+
+def test_adaptive_k_rejects_bad_min_k(engine):
+    with pytest.raises(ValueError, match="negative"):
+        AdaptiveK(min_k=-1)
+    with pytest.raises(ValueError, match="exceed top_k"):
+        engine.retrieve(QUERY, top_k=2, adaptive=AdaptiveK(min_k=3))
@@ -0,0 +1,70 @@
+"""
+Tests for the shared embedding service and multi-process serving helpers.
+
+The service runs the hashing backend from src/testing.py, so no model
+is downloaded.
+"""
+
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.embedding_service import EmbeddingService
+from src.rag_engine import RAGEngine
+from src.serving import memory_report
+from src.testing import HashingBackend
+
+
+@pytest.fixture(scope="module")
+def service():
+    service = EmbeddingService(HashingBackend, max_wait_ms=20)
+    service.start(timeout=120)
+    yield service
+    service.stop()
+
+
+def test_remote_backend_matches_local(service):
+    client = service.client()
+    texts = ["Spanish programs in Roxbury", "K2 in Dorchester"]
+
+    assert client.model_id == "hashing-test"
+    np.testing.assert_array_equal(client.encode(texts), HashingBackend().encode(texts))
+    # Clients can be handed to other processes; the copy opens its own connection
+    np.testing.assert_array_equal(pickle.loads(pickle.dumps(client)).encode(texts[:1]), client.encode(texts[:1]))
+
+
+def test_concurrent_requests_share_batches(service):
+    client = service.client()
+    before = client.stats()
+    queries = [f"school number {i}" for i in range(32)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda query: client.encode([query])[0], queries))
+
+    after = client.stats()
+    np.testing.assert_allclose(np.stack(results), HashingBackend().encode(queries), rtol=1e-6)
+    assert after["items_processed"] - before["items_processed"] == 32
+    assert after["batches_run"] - before["batches_run"] < 32
+
+
+def test_engine_retrieves_through_service(service, tmp_path):
+    local = RAGEngine(embedding_model=HashingBackend(), retrieval_mode="dense")
+    local.load_or_build(str(tmp_path / "school_rag"))
+    remote = RAGEngine(embedding_model=service.client(), retrieval_mode="dense")
+
+    # Same model id, so the index built locally is reused as is
+    assert remote.load_or_build(str(tmp_path / "school_rag")) == "loaded"
+    query = "Spanish program in Roxbury"
+    assert ([doc.school_name for doc in remote.retrieve(query, top_k=5)]
+            == [doc.school_name for doc in local.retrieve(query, top_k=5)])
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="needs /proc smaps_rollup")
+def test_memory_report_totals_processes():
+    report = memory_report({"a": os.getpid(), "b": os.getpid()})
+
+    assert report["a"]["pss_mb"] > 0
+    assert report["total"]["rss_mb"] == pytest.approx(2 * report["a"]["rss_mb"], abs=0.2)
@@ -0,0 +1,100 @@
+"""
+Tests for request tracing, the metrics registry and the /metrics endpoint.
+"""
+
+import asyncio
+import json
+import logging
+import urllib.request
+
+import pytest
+
+from src.benchmark import FakeAsyncInferenceClient, FakeInferenceClient
+from src.chat import SchoolChatbot
+from src.telemetry import (STAGE_SECONDS, REQUESTS, JsonFormatter, MetricsRegistry, configure_sampling, span,
+                           start_metrics_server, trace_request)
+
+
+@pytest.fixture
+def log_every_request():
+    configure_sampling(1.0, None)
+    yield
+    configure_sampling(0.1, 5.0)
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency.", ["stage"], buckets=[0.1, 1.0])
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage="search")
+    registry.counter("requests_total", "Requests.", ["outcome"]).inc(outcome="ok")
+    registry.gauge("in_flight", "In flight.", lambda: 3)
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE latency_seconds histogram" in lines
+    assert 'latency_seconds_bucket{stage="search",le="0.1"} 1.0' in lines
+    assert 'latency_seconds_bucket{stage="search",le="1.0"} 2.0' in lines
+    assert 'latency_seconds_bucket{stage="search",le="+Inf"} 3.0' in lines
+    assert 'latency_seconds_count{stage="search"} 3.0' in lines
+    assert 'requests_total{outcome="ok"} 1.0' in lines
+    assert "in_flight 3.0" in lines
+
+
+def test_trace_records_spans_and_logs_failures(caplog):
+    configure_sampling(0.0, None)
+    with caplog.at_level(logging.INFO, logger="src.telemetry"):
+        with trace_request("unit") as trace:
+            with span("unit_stage"):
+                pass
+        with pytest.raises(RuntimeError):
+            with trace_request("unit"):
+                raise RuntimeError("boom")
+    configure_sampling(0.1, 5.0)
+
+    assert [stage for stage, _ in trace.spans] == ["unit_stage"]
+    assert REQUESTS.value(path="unit", outcome="error") == 1
+    # Unsampled successes are not logged, failures always are
+    assert [record.fields["outcome"] for record in caplog.records] == ["error"]
+    payload = json.loads(JsonFormatter().format(caplog.records[0]))
+    assert payload["path"] == "unit" and payload["error"] == "RuntimeError"
+
+
+def test_chat_paths_record_stages_and_outcomes(tmp_path, caplog, log_every_request):
+    chatbot = SchoolChatbot(index_dir=str(tmp_path), retrieval_mode="lexical")
+    chatbot.client = FakeInferenceClient()
+    chatbot.async_client = FakeAsyncInferenceClient()
+    query = "Spanish programs in Jamaica Plain"
+
+    async def stream():
+        return [token async for token in chatbot.aget_response_stream(query)]
+
+    with caplog.at_level(logging.INFO, logger="src.telemetry"):
+        chatbot.get_response(query)
+        asyncio.run(stream())
+
+    first, second = [record.fields for record in caplog.records]
+    assert first["outcome"] == "generated" and second["outcome"] == "cache_hit"
+    assert {"retrieve", "filter", "lexical_search", "cache_lookup", "prompt_assembly", "format_context",
+            "generation"} <= set(first["stages"])
+    assert REQUESTS.value(path="aget_response_stream", outcome="cache_hit") >= 1
+    assert STAGE_SECONDS.count(stage="generation") >= 1
+
+
+def test_metrics_endpoint_serves_registry():
+    registry = MetricsRegistry()
+    registry.counter("hits_total", "Hits.").inc(2)
+    server = start_metrics_server(0, registry=registry)
+    try:
+        # Only reachable from this machine unless a host is given
+        assert server.server_address[0] == "127.0.0.1"
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            body = response.read().decode("utf-8")
+            content_type = response.headers["Content-Type"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert "hits_total 2.0" in body
@@ -0,0 +1,82 @@
+"""
+Tests for the configurable FAISS index types.
+
+Embeddings come from the hashing backend in src/testing.py, so no model is downloaded.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.rag_engine import RAGEngine
+from src.testing import HashingBackend
+from src.vector_index import compare_index_specs, ivfpq_factory, normalize_rows, stores_exact_vectors
+
+
+def clustered_vectors(num_vectors, dimension=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension))
+    vectors = centers[rng.integers(0, clusters, size=num_vectors)] + 0.3 * rng.normal(size=(num_vectors, dimension))
+    return vectors.astype("float32")
+
+
+def test_compressed_specs_trade_recall_for_memory():
+    vectors = normalize_rows(clustered_vectors(4050))
+    vectors, queries = vectors[:4000], vectors[4000:]
+
+    rows = {row["spec"]: row for row in compare_index_specs(vectors, queries, ["flat", "hnsw", "sq8", "ivfpq"])}
+
+    assert rows["flat"]["recall@10"] == 1.0
+    assert rows["hnsw"]["recall@10"] > 0.9
+    assert rows["sq8"]["recall@10"] > 0.9
+    # Measured with the engine's inner product, where PQ loses more recall than under L2
+    assert rows["ivfpq"]["recall@10"] > 0.15
+    assert rows["ivfpq"]["bytes_per_vector"] < rows["sq8"]["bytes_per_vector"] < rows["flat"]["bytes_per_vector"]
+    assert all(row["latency_ms"] > 0 for row in rows.values())
+
+
+def test_ivfpq_factory_fits_small_datasets():
+    assert ivfpq_factory(125, 384) == "IVF3,PQ48x6"
+    assert ivfpq_factory(100000, 384) == "IVF1264,PQ48x8"
+    assert not stores_exact_vectors("IVF3,PQ48x6")
+    assert stores_exact_vectors("HNSW32,Flat")
+
+
+@pytest.mark.parametrize("spec", ["flat", "hnsw", "sq8", "ivfpq"])
+def test_index_spec_round_trips_and_updates(spec, tmp_path):
+    index_path = str(tmp_path / "school_rag")
+    engine = RAGEngine(embedding_model=HashingBackend(), retrieval_mode="dense", index_spec=spec)
+    assert engine.load_or_build(index_path) == "built"
+
+    manifest = RAGEngine.read_manifest(index_path)
+    assert ("embeddings" in manifest["files"]) == (spec in ("sq8", "ivfpq"))
+
+    loaded = RAGEngine(embedding_model=HashingBackend(), retrieval_mode="dense", index_spec=spec)
+    assert loaded.load_or_build(index_path) == "loaded"
+    query = "Spanish program in Roxbury"
+    assert ([doc.school_name for doc in loaded.retrieve(query, top_k=5)]
+            == [doc.school_name for doc in engine.retrieve(query, top_k=5)])
+    assert all(doc.metadata["zip_code"] == "02130"
+               for doc in loaded.retrieve("schools in 02130", top_k=3, auto_filter=True))
+
+    # Drop one school and change another, then apply the refresh incrementally
+    schools = pd.read_csv("BPS.csv")
+    removed = schools.loc[0, "School Name"]
+    schools.loc[1, "Grades Served"] = "K0-12"
+    schools = schools.drop(index=0)
+    schools.to_csv(tmp_path / "BPS.csv", index=False)
+    stats = loaded.update_index(str(tmp_path / "BPS.csv"), "BPS-special-programs.csv")
+
+    assert stats["removed"] >= 1 and stats["changed"] >= 1
+    assert loaded.faiss_index.ntotal == len(loaded.documents)
+    assert removed not in {doc.school_name for doc in loaded.retrieve(removed, top_k=10)}
+
+
+def test_loading_with_a_different_spec_rebuilds(tmp_path):
+    index_path = str(tmp_path / "school_rag")
+    RAGEngine(embedding_model=HashingBackend(), retrieval_mode="dense", index_spec="flat").load_or_build(index_path)
+
+    engine = RAGEngine(embedding_model=HashingBackend(), retrieval_mode="dense", index_spec="sq8")
+
+    assert engine.load_or_build(index_path) == "built"
+    assert engine.index_factory == "SQ8"
@@ -0,0 +1,50 @@
+"""
+Offline helpers shared by the test suite: an embedding backend that needs no
+model download and a handful of hand-written school documents.
+"""
+
+import zlib
+
+import numpy as np
+
+from src.embeddings import EmbeddingBackend
+from src.rag_engine import SchoolDocument
+
+
+class HashingBackend(EmbeddingBackend):
+    """
+    Bag-of-words embeddings from a fixed random vector per word.
+    """
+
+    dimension = 64
+
+    @property
+    def model_id(self):
+        return "hashing-test"
+
+    def _load(self):
+        pass
+
+    def _encode(self, texts):
+        embeddings = np.zeros((len(texts), self.dimension), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                rng = np.random.default_rng(zlib.crc32(word.encode("utf-8")))
+                embeddings[row] += rng.normal(size=self.dimension)
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+
+SCHOOLS = {
+    "Mozart Elementary School": "Elementary school in Roslindale serving K0 to grade 5 with an arts program.",
+    "Mendell Elementary School": "Elementary school in Roxbury serving K0 to grade 6 with an arts and music program.",
+    "Mather Elementary School": "Elementary school in Dorchester serving K1 to grade 5 with a Spanish program.",
+    "Hernandez K-8 School": "K-8 school in Roxbury with a two-way Spanish dual language program.",
+    "Haynes Early Education Center": "Early education center in Roxbury serving K0 to grade 1.",
+}
+
+
+def documents():
+    """
+    Build one SchoolDocument per entry in SCHOOLS.
+    """
+    return [SchoolDocument(name, f"School Name: {name}\n{text}") for name, text in SCHOOLS.items()]
@@ -0,0 +1,382 @@
+"""
+FAISS index types for the RAG engine, and a report comparing them.
+
+An index spec is either one of the names in INDEX_SPECS or any FAISS
+index_factory string. Compressed specs trade recall for memory:
+
+- "flat": exact search over float32 vectors (4 * d bytes per vector)
+- "hnsw": HNSW graph over float32 vectors; faster search, more memory
+- "sq8": exhaustive search over int8 scalar-quantized vectors (d bytes per vector)
+- "ivfpq": inverted file with product quantization (about d / 8 bytes per
+  vector); lists and code sizes are chosen from the number of vectors
+
+Example usage:
+    # Recall@k against the exact index, latency and memory for each spec
+    python -m src.vector_index --specs flat hnsw sq8 ivfpq --scale 50000
+"""
+
+import argparse
+import json
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.startup import LazyModule
+
+faiss = LazyModule("faiss")
+
+INDEX_SPECS = {
+    "flat": "Flat",
+    "hnsw": "HNSW32,Flat",
+    "sq8": "SQ8",
+    "ivfpq": None,  # sized from the data by ivfpq_factory
+}
+
+# Search-time defaults, stored with the index
+HNSW_EF_SEARCH = 64
+IVF_MAX_NPROBE = 16
+
+# Default report queries, besides every school name
+EXAMPLE_QUERIES = [
+    "I live in Dorchester and my daughter is going into 1st grade. Any schools you recommend?",
+    "We want a school with Spanish immersion for kindergarten near Jamaica Plain.",
+    "My son is in 6th grade and loves science. Are there STEM-focused schools in Boston?",
+    "Do any Boston public schools offer advanced work classes in 4th grade?",
+    "We need before-school care and bus service. Which schools provide those?",
+]
+
+
+def ivfpq_factory(num_vectors: int, dimension: int) -> str:
+    """
+    IVF-PQ factory string sized for the data: about 4 * sqrt(n) lists with at
+    least 39 training points each, sub-quantizers of 8 dimensions and no more
+    PQ centroids than there are vectors to train them on.
+
+    Args:
+        num_vectors: Number of vectors the index is trained on
+        dimension: Vector dimension
+
+    Returns:
+        FAISS index_factory string, e.g. "IVF894,PQ48x8"
+    """
+    nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+    m = max(divisor for divisor in range(1, max(dimension // 8, 1) + 1) if dimension % divisor == 0)
+    nbits = max(1, min(8, int(math.log2(max(num_vectors, 2)))))
+    return f"IVF{nlist},PQ{m}x{nbits}"
+
+
+def resolve_index_spec(spec: str, num_vectors: int, dimension: int) -> str:
+    """
+    Turn an index spec into a FAISS index_factory string.
+
+    Args:
+        spec: A name from INDEX_SPECS or an index_factory string
+        num_vectors: Number of vectors to be indexed
+        dimension: Vector dimension
+
+    Returns:
+        The index_factory string
+    """
+    if spec == "ivfpq":
+        return ivfpq_factory(num_vectors, dimension)
+    return INDEX_SPECS.get(spec, spec)
+
+
+def stores_exact_vectors(factory: str) -> bool:
+    """
+    Whether an index built from this factory string keeps the original
+    float32 vectors, so they can be reconstructed instead of stored separately.
+    """
+    storage = factory.split(",")[-1]
+    return storage == "Flat" or (storage.startswith("HNSW") and "," not in factory)
+
+
+def is_exhaustive(factory: str) -> bool:
+    """
+    Whether searches over an index built from this factory string are exact.
+    """
+    return factory == "Flat"
+
+
+def build_vector_index(factory: str,
+                       vectors: np.ndarray,
+                       ids: np.ndarray,
+                       metric: Optional[int] = None) -> Any:
+    """
+    Create, train and fill an index whose search results are the given ids.
+
+    IVF indexes map ids themselves (with a hash-table direct map, so vectors
+    can be reconstructed and removed by id); other types are wrapped in an
+    IndexIDMap2.
+
+    Args:
+        factory: FAISS index_factory string
+        vectors: Float32 matrix of vectors to add
+        ids: int64 id of each vector
+        metric: FAISS metric type, faiss.METRIC_L2 by default
+
+    Returns:
+        The FAISS index
+    """
+    if metric is None:
+        metric = faiss.METRIC_L2
+    base = faiss.index_factory(vectors.shape[1], factory, metric)
+    ivf = faiss.try_extract_index_ivf(base)
+    if ivf is not None:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        ivf.nprobe = min(ivf.nlist, IVF_MAX_NPROBE)
+        index = base
+    else:
+        index = faiss.IndexIDMap2(base)
+    hnsw = getattr(faiss.downcast_index(base), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = HNSW_EF_SEARCH
+    if not index.is_trained:
+        index.train(vectors)
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def read_vector_index(path: str, factory: str) -> Any:
+    """
+    Load an index written with faiss.write_index. Flat and HNSW indexes are
+    memory-mapped read-only, so the pages are shared between processes. IVF
+    indexes are read into memory: FAISS maps their lists in a form that
+    can't be copied for incremental updates, and they are small anyway.
+
+    Args:
+        path: Path of the index file
+        factory: The index_factory string it was built from
+
+    Returns:
+        The FAISS index
+    """
+    if factory.startswith("IVF"):
+        return faiss.read_index(path)
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+
+def reconstruct(index: Any, ids: Sequence[int]) -> np.ndarray:
+    """
+    Vectors stored in an index, by id. Compressed indexes return their
+    approximation of the original vectors.
+
+    Args:
+        index: Index created by build_vector_index
+        ids: Ids of the vectors
+
+    Returns:
+        Float32 matrix with one row per id
+    """
+    if not len(ids):
+        return np.empty((0, index.d), dtype="float32")
+    return np.stack([index.reconstruct(int(i)) for i in ids]).astype("float32", copy=False)
+
+
+def replace_vectors(index: Any,
+                    remove_ids: Sequence[int],
+                    vectors: np.ndarray,
+                    ids: Sequence[int]) -> Any:
+    """
+    Copy of the index with some ids removed and new vectors added, keeping its
+    training. Index types that can't remove vectors (HNSW) are refilled from
+    their reconstructed vectors instead.
+
+    Args:
+        index: Index created by build_vector_index; it is not modified, so it may
+            be a read-only memory-mapped one
+        remove_ids: Ids to delete
+        vectors: Float32 vectors to add
+        ids: Ids of the added vectors
+
+    Returns:
+        The updated index
+    """
+    updated = faiss.clone_index(index)
+    remove_ids = np.asarray(remove_ids, dtype="int64")
+    ids = np.asarray(ids, dtype="int64")
+    if len(remove_ids):
+        try:
+            updated.remove_ids(remove_ids)
+        except RuntimeError:
+            kept_ids = np.setdiff1d(faiss.vector_to_array(index.id_map), remove_ids)
+            kept_vectors = reconstruct(index, kept_ids)
+            updated.reset()
+            updated.add_with_ids(kept_vectors, kept_ids)
+    if len(ids):
+        updated.add_with_ids(vectors, ids)
+    return updated
+
+
+def search(index: Any,
+           factory: str,
+           queries: np.ndarray,
+           top_k: int,
+           subset_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search an index, optionally restricted to a subset of ids.
+
+    Restricted searches over approximate indexes scan the reconstructed
+    subset exactly, since graph and inverted-list traversals can miss
+    neighbours when most vectors are filtered out.
+
+    Args:
+        index: Index created by build_vector_index
+        factory: The index_factory string it was built from
+        queries: Float32 query matrix
+        top_k: Number of results per query
+        subset_ids: Ids to restrict the search to, or None for all
+
+    Returns:
+        Float32 matrix of scores (inner products or squared L2 distances,
+        depending on the index metric) and int64 matrix of result ids, -1
+        where fewer than top_k were found
+    """
+    if subset_ids is None:
+        return index.search(queries, top_k)
+    if is_exhaustive(factory):
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(subset_ids))
+        return index.search(queries, top_k, params=params)
+    scores, positions = faiss.knn(queries, reconstruct(index, subset_ids), top_k, metric=index.metric_type)
+    return scores, np.where(positions >= 0, subset_ids[np.maximum(positions, 0)], -1)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scale vectors to unit length, so inner products are cosine similarities.
+    All-zero rows stay zero.
+
+    Args:
+        vectors: Float matrix, or a single vector
+
+    Returns:
+        A new float32 array of the same shape
+    """
+    vectors = np.array(vectors, dtype="float32")
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def index_memory_bytes(index: Any) -> int:
+    """
+    Size of an index when serialized, which is close to its resident size.
+    """
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def compare_index_specs(vectors: np.ndarray,
+                        queries: np.ndarray,
+                        specs: Sequence[str],
+                        k: int = 10,
+                        repeats: int = 3,
+                        metric: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Build each index spec over the same vectors and measure it against the
+    exact flat index.
+
+    Args:
+        vectors: Float32 document vectors, unit length as the engine stores them
+        queries: Float32 query vectors, unit length as the engine searches with them
+        specs: Index specs to compare
+        k: Number of neighbours for recall@k
+        repeats: Timed search passes; the fastest one is reported
+        metric: FAISS metric type, faiss.METRIC_INNER_PRODUCT (the engine's) by default
+
+    Returns:
+        One row per spec with the factory string, recall@k, build time,
+        per-query latency (single-query searches), memory and bytes per vector
+    """
+    if metric is None:
+        metric = faiss.METRIC_INNER_PRODUCT
+    ids = np.arange(len(vectors), dtype="int64")
+    k = min(k, len(vectors))
+    exact = build_vector_index("Flat", vectors, ids, metric).search(queries, k)[1]
+
+    rows = []
+    for spec in specs:
+        factory = resolve_index_spec(spec, len(vectors), vectors.shape[1])
+        started = time.perf_counter()
+        index = build_vector_index(factory, vectors, ids, metric)
+        build_seconds = time.perf_counter() - started
+
+        found = index.search(queries, k)[1]
+        recall = np.mean([len(set(row[row >= 0]) & set(truth)) / k for row, truth in zip(found, exact)])
+
+        latencies = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            for query in queries:
+                index.search(query.reshape(1, -1), k)
+            latencies.append((time.perf_counter() - started) / len(queries))
+
+        memory = index_memory_bytes(index)
+        rows.append({
+            "spec": spec,
+            "factory": factory,
+            f"recall@{k}": float(recall),
+            "build_seconds": build_seconds,
+            "latency_ms": min(latencies) * 1000,
+            "memory_bytes": memory,
+            "bytes_per_vector": memory / len(vectors),
+        })
+    return rows
+
+
+def synthetic_neighbours(vectors: np.ndarray, total: int, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+    """
+    Grow a vector set to `total` rows by adding jittered copies of its
+    vectors, to estimate how the index types behave on a larger dataset.
+    """
+    rng = np.random.default_rng(seed)
+    extra = max(total - len(vectors), 0)
+    base = vectors[rng.integers(0, len(vectors), size=extra)]
+    jittered = base + rng.normal(scale=noise, size=base.shape).astype("float32")
+    return np.concatenate([vectors, jittered]).astype("float32")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index specs for the school index")
+    parser.add_argument("--specs", nargs="+", default=list(INDEX_SPECS), help="Index specs to compare")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours for recall@k")
+    parser.add_argument("--scale", type=int, default=0,
+                        help="Grow the index to this many vectors with jittered copies of the schools")
+    parser.add_argument("--queries", help="File with one query per line (default: the app's examples "
+                                          "and every school name)")
+    parser.add_argument("--school-csv", default="BPS.csv", help="Path to the school data CSV")
+    parser.add_argument("--programs-csv", default="BPS-special-programs.csv", help="Path to the programs CSV")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    from config import EMBEDDING_BACKEND, EMBEDDING_MODEL
+    from src.embeddings import create_backend
+    from src.rag_engine import RAGEngine
+
+    backend = create_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL)
+    documents = RAGEngine(retrieval_mode="lexical").process_school_data(args.school_csv, args.programs_csv)
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = EXAMPLE_QUERIES + [doc.school_name for doc in documents]
+
+    vectors = backend.encode([doc.content for doc in documents])
+    if args.scale:
+        vectors = synthetic_neighbours(vectors, args.scale)
+    rows = compare_index_specs(normalize_rows(vectors), normalize_rows(backend.encode(queries)), args.specs, k=args.k)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    recall_key = next(key for key in rows[0] if key.startswith("recall@"))
+    print(f"{len(vectors)} vectors, {len(queries)} queries")
+    print(f"{'spec':<8} {'factory':<18} {recall_key:>10} {'latency ms':>11} {'memory MB':>10} {'bytes/vec':>10}")
+    for row in rows:
+        print(f"{row['spec']:<8} {row['factory']:<18} {row[recall_key]:>10.3f} {row['latency_ms']:>11.3f} "
+              f"{row['memory_bytes'] / 1e6:>10.2f} {row['bytes_per_vector']:>10.0f}")
+
+
+
+if __name__ == "__main__":
+    main()